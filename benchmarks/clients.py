@@ -0,0 +1,117 @@
+"""
+Minimal load generating clients, so the benchmarks measure the server and not the
+HTTP client library.
+"""
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+
+import h2.config
+import h2.connection
+import h2.events
+from h2.settings import SettingCodes
+
+
+class H2Client:
+    """Multiplexes concurrent requests over a single HTTP/2 connection."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=True, header_encoding=None)
+        )
+        self.responses: Dict[int, "asyncio.Future[Tuple[int, bytes]]"] = {}
+        self.bodies: Dict[int, List[bytes]] = {}
+        self.discarded: Set[int] = set()
+        self.statuses: Dict[int, int] = {}
+        self.reader_task: Optional["asyncio.Task[None]"] = None
+
+    @classmethod
+    async def connect(
+        cls, host: str, port: int, window_size: Optional[int] = None
+    ) -> "H2Client":
+        reader, writer = await asyncio.open_connection(host, port)
+        client = cls(reader, writer)
+        client.conn.initiate_connection()
+        if window_size is not None:
+            client.conn.update_settings({SettingCodes.INITIAL_WINDOW_SIZE: window_size})
+            client.conn.increment_flow_control_window(window_size)
+        client.writer.write(client.conn.data_to_send())
+        client.reader_task = asyncio.create_task(client.read_loop())
+        return client
+
+    async def request(
+        self,
+        path: bytes = b"/",
+        headers: Optional[List[Tuple[bytes, bytes]]] = None,
+        discard_body: bool = False,
+    ) -> Tuple[int, bytes]:
+        stream_id = self.conn.get_next_available_stream_id()
+        request_headers = [
+            (b":method", b"GET"),
+            (b":path", path),
+            (b":scheme", b"http"),
+            (b":authority", b"localhost"),
+        ] + (headers or [])
+        future = asyncio.get_running_loop().create_future()
+        self.responses[stream_id] = future
+        self.bodies[stream_id] = []
+        if discard_body:
+            self.discarded.add(stream_id)
+        self.conn.send_headers(stream_id, request_headers, end_stream=True)
+        self.writer.write(self.conn.data_to_send())
+        return await future
+
+    async def read_loop(self) -> None:
+        while True:
+            data = await self.reader.read(65536)
+            if not data:
+                break
+            for event in self.conn.receive_data(data):
+                if isinstance(event, h2.events.ResponseReceived):
+                    self.statuses[event.stream_id] = int(
+                        dict(event.headers)[b":status"]
+                    )
+                elif isinstance(event, h2.events.DataReceived):
+                    if event.stream_id not in self.discarded:
+                        self.bodies[event.stream_id].append(event.data)
+                    self.conn.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id
+                    )
+                elif isinstance(event, h2.events.StreamEnded):
+                    self.discarded.discard(event.stream_id)
+                    body = b"".join(self.bodies.pop(event.stream_id))
+                    status = self.statuses.pop(event.stream_id)
+                    self.responses.pop(event.stream_id).set_result((status, body))
+            self.writer.write(self.conn.data_to_send())
+
+    async def close(self) -> None:
+        assert self.reader_task is not None
+        self.reader_task.cancel()
+        self.writer.close()
+
+
+class H11Client:
+    """Sends sequential requests over a single HTTP/1.1 keep-alive connection."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> "H11Client":
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, path: bytes = b"/") -> Tuple[int, bytes]:
+        self.writer.write(b"GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % path)
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status = int(head[9:12])
+        content_length = 0
+        for line in head.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.lower() == b"content-length":
+                content_length = int(value)
+        return status, await self.reader.readexactly(content_length)
+
+    async def close(self) -> None:
+        self.writer.close()
@@ -0,0 +1,73 @@
+"""
+Compare `uvicorn_extended.HTTPProtocol`, with all its extensions, to the stock
+`httptools` protocol of Uvicorn, on plain HTTP/1.1 keep-alive requests.
+
+    python -m benchmarks.extended --requests 20000 --connections 6 --rounds 3
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Tuple
+
+import uvicorn_extended
+
+from benchmarks.apps import hello_world
+from benchmarks.clients import H11Client
+from benchmarks.utils import cpu_time, serve, unused_port
+
+
+async def load(port: int, requests: int, connections: int) -> float:
+    clients = [await H11Client.connect("127.0.0.1", port) for _ in range(connections)]
+    remaining = requests
+
+    async def worker(client: H11Client) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            status, _ = await client.request()
+            assert status == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(client) for client in clients])
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+    return elapsed
+
+
+def bench(protocol: Any, requests: int, connections: int) -> Tuple[float, float]:
+    """Return the requests per second, and the CPU time of the server per request."""
+    port = unused_port()
+    with serve(hello_world, port, http=protocol) as process:
+        assert process.pid is not None
+        asyncio.run(load(port, 1000, connections))
+        start = cpu_time(process.pid)
+        elapsed = asyncio.run(load(port, requests, connections))
+        cpu = cpu_time(process.pid) - start
+    return requests / elapsed, cpu / requests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--connections", type=int, default=6)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    protocols: Dict[str, Any] = {
+        "httptools": "httptools",
+        "uvicorn_extended": uvicorn_extended.HTTPProtocol,
+    }
+    results: Dict[str, List[Tuple[float, float]]] = {name: [] for name in protocols}
+    # The rounds alternate, so that both see the same noise.
+    for _ in range(args.rounds):
+        for name, protocol in protocols.items():
+            results[name].append(bench(protocol, args.requests, args.connections))
+    for name, rounds in results.items():
+        rate = max(rate for rate, _ in rounds)
+        cpu = min(cpu for _, cpu in rounds)
+        print(f"{name:<20} {rate:>10.0f} req/s {cpu * 1e6:>8.1f} µs CPU/request")
+
+
+if __name__ == "__main__":
+    main()
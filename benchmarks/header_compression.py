@@ -0,0 +1,90 @@
+"""
+Compare the encoded size and the encoding time of response headers, between the
+stock HPACK encoder of h2 and `uvicorn_http2.encoder.HeaderEncoder`.
+
+    python -m benchmarks.header_compression --responses 100000 --lengths 1000
+"""
+import argparse
+import time
+from email.utils import formatdate
+from typing import Callable, List, Tuple
+
+import h2.config
+import h2.connection
+from hpack import Encoder
+from uvicorn_http2.encoder import HeaderEncoder
+
+Headers = List[Tuple[bytes, bytes]]
+
+# Responses per second, i.e. how often the `date` header changes.
+RESPONSES_PER_DATE = 1_000
+
+
+def response_headers(index: int, lengths: int) -> Headers:
+    date = formatdate(index // RESPONSES_PER_DATE, usegmt=True).encode()
+    return [
+        (b":status", b"200"),
+        (b"date", date),
+        (b"server", b"uvicorn"),
+        (b"content-type", b"application/json"),
+        (b"content-length", str(100 + index * 7919 % lengths).encode()),
+    ]
+
+
+def bench(
+    encoder: Callable[[], Encoder], responses: int, lengths: int
+) -> Tuple[float, float]:
+    """
+    Return the bytes and µs per response, decoding every block on the client side.
+    """
+    client = h2.connection.H2Connection(
+        config=h2.config.H2Configuration(client_side=True, header_encoding=None)
+    )
+    server = h2.connection.H2Connection(
+        config=h2.config.H2Configuration(client_side=False, header_encoding=None)
+    )
+    server.encoder = encoder()
+    client.initiate_connection()
+    server.initiate_connection()
+    server.receive_data(client.data_to_send())
+    client.receive_data(server.data_to_send())
+
+    request = [
+        (b":method", b"GET"),
+        (b":path", b"/"),
+        (b":scheme", b"http"),
+        (b":authority", b"example.org"),
+    ]
+    size = elapsed = 0.0
+    for index in range(responses):
+        stream_id = client.get_next_available_stream_id()
+        client.send_headers(stream_id, request, end_stream=True)
+        server.receive_data(client.data_to_send())
+
+        headers = response_headers(index, lengths)
+        start = time.perf_counter()
+        server.send_headers(stream_id, headers, end_stream=True)
+        elapsed += time.perf_counter() - start
+
+        data = server.data_to_send()
+        size += len(data)
+        client.receive_data(data)
+        client.clear_outbound_data_buffer()
+
+    return size / responses, elapsed / responses * 1e6
+
+
+def main(responses: int, lengths: int) -> None:
+    for name, encoder in [("h2 Encoder", Encoder), ("HeaderEncoder", HeaderEncoder)]:
+        size, elapsed = bench(encoder, responses, lengths)
+        print(f"{name:<16} {size:8.1f} bytes/response {elapsed:8.2f} µs/response")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--responses", type=int, default=100_000)
+    parser.add_argument(
+        "--lengths", type=int, default=1_000, help="Distinct content lengths."
+    )
+    args = parser.parse_args()
+    main(args.responses, args.lengths)
@@ -0,0 +1,74 @@
+"""
+Compare HTTP/2 multiplexing on `uvicorn_http2.H2Protocol` with HTTP/1.1 keep-alive
+on `uvicorn_trailers.HTTPProtocol`.
+
+    python -m benchmarks.http2 --requests 10000 --concurrency 100 --connections 6
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Tuple
+
+import uvicorn_trailers
+from uvicorn_http2 import H2Protocol
+
+from benchmarks.apps import hello_world
+from benchmarks.clients import H2Client, H11Client
+from benchmarks.utils import report, serve, unused_port
+
+Request = Callable[[], Awaitable[Tuple[int, bytes]]]
+
+
+async def run_load(requesters: List[Request], requests: int) -> float:
+    remaining = requests
+
+    async def worker(request: Request) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            status, _ = await request()
+            assert status == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(request) for request in requesters])
+    return time.perf_counter() - start
+
+
+async def bench_http2(port: int, requests: int, concurrency: int) -> float:
+    client = await H2Client.connect("127.0.0.1", port)
+    try:
+        return await run_load([client.request] * concurrency, requests)
+    finally:
+        await client.close()
+
+
+async def bench_http11(port: int, requests: int, connections: int) -> float:
+    clients = [await H11Client.connect("127.0.0.1", port) for _ in range(connections)]
+    try:
+        return await run_load([client.request for client in clients], requests)
+    finally:
+        for client in clients:
+            await client.close()
+
+
+def run(protocol: Any, bench: Callable[..., Awaitable[float]], *args: int) -> float:
+    port = unused_port()
+    with serve(hello_world, port, http=protocol):
+        return asyncio.run(bench(port, *args))
+
+
+def main(requests: int, concurrency: int, connections: int) -> None:
+    elapsed = run(H2Protocol, bench_http2, requests, concurrency)
+    report(f"HTTP/2 (1 connection, {concurrency} streams)", requests, elapsed)
+
+    elapsed = run(uvicorn_trailers.HTTPProtocol, bench_http11, requests, connections)
+    report(f"HTTP/1.1 ({connections} keep-alive connections)", requests, elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--connections", type=int, default=6)
+    args = parser.parse_args()
+    main(args.requests, args.concurrency, args.connections)
@@ -0,0 +1,76 @@
+"""
+Measure the latency of small responses on an HTTP/2 connection, while a large
+download saturates it, with and without the write scheduler of
+`uvicorn_http2.H2Protocol` bounding each write.
+
+    python -m benchmarks.http2_priority --requests 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, List
+
+from uvicorn_http2 import H2Protocol
+
+from benchmarks.clients import H2Client
+from benchmarks.utils import serve, unused_port
+
+CHUNK_SIZE = 1_048_576
+
+
+async def app(scope, receive, send):
+    assert scope["type"] == "http"
+    size = int(scope["path"][1:])
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    while size > CHUNK_SIZE:
+        await send(
+            {"type": "http.response.body", "body": b"x" * CHUNK_SIZE, "more_body": True}
+        )
+        size -= CHUNK_SIZE
+    await send({"type": "http.response.body", "body": b"x" * size})
+
+
+class UnboundedH2Protocol(H2Protocol):
+    # Each stream writes all its pending data on its turn, in `send()` order.
+    write_size = 2**31
+
+
+async def measure(port: int, requests: int, size: int) -> List[float]:
+    client = await H2Client.connect("127.0.0.1", port, window_size=2**30)
+    try:
+        download = asyncio.create_task(client.request(b"/%d" % size, discard_body=True))
+        await asyncio.sleep(0.1)
+        latencies = []
+        for _ in range(requests):
+            if download.done():
+                raise RuntimeError("The download completed, increase --size.")
+            start = time.perf_counter()
+            await client.request(b"/100")
+            latencies.append(time.perf_counter() - start)
+        download.cancel()
+        return latencies
+    finally:
+        await client.close()
+
+
+def run(protocol: Any, requests: int, size: int) -> None:
+    port = unused_port()
+    with serve(app, port, http=protocol):
+        latencies = asyncio.run(measure(port, requests, size))
+    p50 = statistics.median(latencies) * 1000
+    p99 = statistics.quantiles(latencies, n=100)[98] * 1000
+    print(f"{protocol.__name__:<24} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+
+
+def main(requests: int, size: int) -> None:
+    run(H2Protocol, requests, size)
+    run(UnboundedH2Protocol, requests, size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--size", type=int, default=2**40, help="Download size.")
+    args = parser.parse_args()
+    main(args.requests, args.size)
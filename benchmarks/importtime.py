@@ -0,0 +1,75 @@
+"""
+Measure the import time of each package with `python -X importtime`, on top of
+`uvicorn.server`, that a server imports anyway.
+
+    python -m benchmarks.importtime --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, Tuple
+
+BASELINE = "uvicorn.server"
+
+PACKAGES = [
+    "asgi_types",
+    "asgi_trailers",
+    "uvicorn_denial",
+    "uvicorn_extended",
+    "uvicorn_http2",
+    "uvicorn_httparse",
+    "uvicorn_manager",
+    "uvicorn_target",
+    "uvicorn_tls",
+    "uvicorn_trailers",
+    "uvicorn_worker",
+]
+
+
+def import_time(module: str) -> Tuple[float, int]:
+    """
+    The cumulative import time of `module`, in seconds, and the number of
+    modules it imports, once `BASELINE` is imported.
+    """
+    command = [sys.executable, "-X", "importtime", "-c", f"import {BASELINE}, {module}"]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    process = subprocess.run(command, env=env, capture_output=True, text=True)
+    process.check_returncode()
+    # Each line is `import time: <self> | <cumulative> | <name>`, printed once
+    # the module is imported: the ones after `BASELINE` are imported by `module`.
+    names: List[str] = []
+    cumulative = 0
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("| imported package"):
+            continue
+        _, microseconds, name = line.split("|")
+        if name.strip() == BASELINE:
+            names.clear()
+            continue
+        names.append(name.strip())
+        if name.strip() == module:
+            cumulative = int(microseconds)
+    return cumulative / 1_000_000, len(names)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("packages", nargs="*", default=PACKAGES)
+    args = parser.parse_args()
+
+    for package in args.packages:
+        samples: List[float] = []
+        for _ in range(args.runs):
+            elapsed, imported = import_time(package)
+            samples.append(elapsed)
+        print(
+            f"{package:<20} {statistics.median(samples) * 1000:>7.1f} ms"
+            f" (min {min(samples) * 1000:>6.1f} ms), {imported:>4} modules"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Measure the CPU time of the server per GB of a file sent with the zero-copy send
+extension of `uvicorn_tls.HTTPProtocol`: over plain HTTP, over the TLS transport
+of asyncio, and over a `KTLSTransport`, with `os.sendfile` when the kernel has TLS.
+
+    python -m benchmarks.ktls_sendfile --size 64 --requests 32
+"""
+import argparse
+import http.client
+import os
+import ssl
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import uvicorn_tls
+from uvicorn_tls.ktls import enable_ktls
+
+from benchmarks.utils import cpu_time, serve, unused_port
+
+CERTS = Path(__file__).parent.parent / "tests" / "certs"
+FILE = Path(tempfile.gettempdir()) / "uvicorn-tls-sendfile.bin"
+
+
+def ktls_context() -> ssl.SSLContext:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERTS / "server.pem", CERTS / "server.key")
+    enable_ktls(context)
+    return context
+
+
+class KTLSProtocol(uvicorn_tls.HTTPProtocol):
+    ktls_context = ktls_context()
+
+
+async def app(scope: Any, receive: Any, send: Any) -> None:
+    with open(FILE, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        headers = [(b"content-length", str(size).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.zerocopysend", "file": file})
+
+
+def download(port: int, context: Optional[ssl.SSLContext], requests: int) -> int:
+    connection: http.client.HTTPConnection
+    if context is None:
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+    else:
+        connection = http.client.HTTPSConnection("localhost", port, context=context)
+    received = 0
+    for _ in range(requests):
+        connection.request("GET", "/")
+        response = connection.getresponse()
+        while chunk := response.read(1 << 20):
+            received += len(chunk)
+    connection.close()
+    return received
+
+
+def bench(name: str, requests: int, tls: bool, **kwargs: Any) -> None:
+    port = unused_port()
+    context = None
+    if tls:
+        context = ssl.create_default_context(cafile=str(CERTS / "ca.pem"))
+    with serve(app, port, **kwargs) as process:
+        assert process.pid is not None
+        download(port, context, 1)
+        start_cpu, start = cpu_time(process.pid), time.perf_counter()
+        received = download(port, context, requests)
+        cpu, elapsed = cpu_time(process.pid) - start_cpu, time.perf_counter() - start
+    gigabytes = received / 1e9
+    print(
+        f"{name:<24} {cpu / gigabytes:>8.2f} CPU s/GB"
+        f" {gigabytes / elapsed:>8.2f} GB/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=64, help="The file size, in MB.")
+    parser.add_argument("--requests", type=int, default=32)
+    args = parser.parse_args()
+
+    size = args.size * 1_000_000
+    if not FILE.exists() or FILE.stat().st_size != size:
+        FILE.write_bytes(os.urandom(size))
+    tls_files: Dict[str, Any] = {
+        "ssl_certfile": str(CERTS / "server.pem"),
+        "ssl_keyfile": str(CERTS / "server.key"),
+    }
+    http = uvicorn_tls.HTTPProtocol
+    bench("http (sendfile)", args.requests, False, http=http)
+    bench("https (asyncio)", args.requests, True, http=http, **tls_files)
+    bench("https (KTLSTransport)", args.requests, True, http=KTLSProtocol)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""
+An application that is slow to import, and holds many objects, like a large
+application with many dependencies would.
+"""
+from benchmarks.apps import hello_world
+
+OBJECTS = 500_000
+
+TABLE = {f"key-{index}": (index, str(index), [index]) for index in range(OBJECTS)}
+
+app = hello_world
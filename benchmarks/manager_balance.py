@@ -0,0 +1,112 @@
+"""
+Compare how `uvicorn_manager.Manager` balances long-lived connections between
+its workers, with `reuse_port` and with `pass_connections`: the skew of the
+connections per worker, and the latency of the requests on them.
+
+    python -m benchmarks.manager_balance --workers 4 --connections 200
+"""
+import argparse
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import statistics
+import time
+from collections import Counter
+from typing import Any, Iterator, List
+
+import uvicorn_manager
+import uvicorn_trailers
+
+from benchmarks.clients import H11Client
+from benchmarks.utils import unused_port, wait_for_port
+
+
+async def cpu_app(scope: Any, receive: Any, send: Any) -> None:
+    # About half a millisecond of work per request, so a busier worker is slower.
+    deadline = time.perf_counter() + 0.0005
+    while time.perf_counter() < deadline:
+        pass
+    body = str(os.getpid()).encode()
+    headers = [(b"content-length", str(len(body)).encode())]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+@contextlib.contextmanager
+def serve(port: int, workers: int, **kwargs: Any) -> Iterator[None]:
+    kwargs = {
+        "workers": workers,
+        "port": port,
+        "http": uvicorn_trailers.HTTPProtocol,
+        "log_level": "warning",
+        "lifespan": "off",
+        **kwargs,
+    }
+    app = "benchmarks.manager_balance:cpu_app"
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=uvicorn_manager.run, args=(app,), kwargs=kwargs)
+    process.start()
+    try:
+        wait_for_port(port)
+        # Let all the workers boot.
+        time.sleep(2)
+        yield
+    finally:
+        process.terminate()
+        process.join()
+
+
+async def bench(port: int, connections: int, requests: int) -> None:
+    clients: List[H11Client] = []
+    pids: List[int] = []
+    for _ in range(connections):
+        client = await H11Client.connect("127.0.0.1", port)
+        _, body = await client.request()
+        clients.append(client)
+        pids.append(int(body))
+
+    latencies: List[float] = []
+
+    async def worker(client: H11Client) -> None:
+        for _ in range(requests):
+            start = time.perf_counter()
+            status, _ = await client.request()
+            latencies.append(time.perf_counter() - start)
+            assert status == 200
+
+    try:
+        await asyncio.gather(*[worker(client) for client in clients])
+    finally:
+        for client in clients:
+            await client.close()
+
+    counts = sorted(Counter(pids).values(), reverse=True)
+    skew = max(counts) / (connections / len(counts))
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"  connections per worker: {counts}, max/mean {skew:.2f}\n"
+        f"  latency p50 {quantiles[49] * 1000:>7.1f} ms"
+        f"   p99 {quantiles[98] * 1000:>7.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, options in (
+        ("reuse_port", {"reuse_port": True}),
+        ("pass_connections", {"pass_connections": True}),
+    ):
+        print(name)
+        port = unused_port()
+        with serve(port, args.workers, **options):
+            asyncio.run(bench(port, args.connections, args.requests))
+
+
+if __name__ == "__main__":
+    main()
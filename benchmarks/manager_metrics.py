@@ -0,0 +1,81 @@
+"""
+Measure the overhead of the shared memory metrics of `uvicorn_manager`, per
+request.
+
+    python -m benchmarks.manager_metrics --requests 20000 --connections 6
+"""
+import argparse
+import asyncio
+import time
+from typing import Any
+
+import uvicorn_trailers
+from uvicorn_manager import MetricsMiddleware, SharedMetrics
+
+from benchmarks.apps import hello_world
+from benchmarks.clients import H11Client
+from benchmarks.utils import report, serve, unused_port
+
+
+def metrics_app() -> Any:
+    metrics = SharedMetrics(slots=1).acquire(0)
+    assert metrics is not None
+    return MetricsMiddleware(hello_world, metrics)
+
+
+def bench_observe(iterations: int) -> None:
+    metrics = SharedMetrics(slots=1).acquire(0)
+    assert metrics is not None
+    start = time.perf_counter()
+    for _ in range(iterations):
+        metrics.observe(0.004)
+    elapsed = time.perf_counter() - start
+    print(f"{'WorkerMetrics.observe()':<40} {elapsed / iterations * 1e9:>10.0f} ns")
+
+
+async def bench_requests(port: int, requests: int, connections: int) -> float:
+    clients = [await H11Client.connect("127.0.0.1", port) for _ in range(connections)]
+    remaining = requests
+
+    async def worker(client: H11Client) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            status, _ = await client.request()
+            assert status == 200
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for client in clients])
+        return time.perf_counter() - start
+    finally:
+        for client in clients:
+            await client.close()
+
+
+def run(app: Any, requests: int, connections: int, **kwargs: Any) -> float:
+    port = unused_port()
+    protocol = uvicorn_trailers.HTTPProtocol
+    with serve(app, port, http=protocol, **kwargs):
+        # Warm up.
+        asyncio.run(bench_requests(port, requests // 10, connections))
+        return asyncio.run(bench_requests(port, requests, connections))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--connections", type=int, default=6)
+    args = parser.parse_args()
+
+    bench_observe(1_000_000)
+    for _ in range(2):
+        elapsed = run(hello_world, args.requests, args.connections)
+        report("Without metrics", args.requests, elapsed)
+        app = "benchmarks.manager_metrics:metrics_app"
+        elapsed = run(app, args.requests, args.connections, factory=True)
+        report("With metrics", args.requests, elapsed)
+
+
+if __name__ == "__main__":
+    main()
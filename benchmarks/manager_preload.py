@@ -0,0 +1,77 @@
+"""
+Measure the time until all the workers of `uvicorn_manager.Manager` are ready,
+and their memory usage, with and without `preload`.
+
+    python -m benchmarks.manager_preload --workers 8
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import time
+from typing import Any
+
+from uvicorn.config import Config
+from uvicorn_manager import Manager, memory_usage
+
+from benchmarks.utils import unused_port
+
+
+class ReportingManager(Manager):
+    def __init__(self, *args: Any, queue: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.queue = queue
+
+    def on_worker_ready(self, worker: Any) -> None:
+        super().on_worker_ready(worker)
+        if worker.ready:
+            self.queue.put(worker.pid)
+
+
+def run_manager(workers: int, preload: bool, queue: Any) -> None:
+    config = Config(
+        "benchmarks.large_app:app",
+        port=unused_port(),
+        log_level="warning",
+        lifespan="off",
+    )
+    ReportingManager(config, workers=workers, preload=preload, queue=queue).run()
+
+
+def run(workers: int, preload: bool) -> None:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_manager, args=(workers, preload, queue))
+    start = time.perf_counter()
+    process.start()
+    try:
+        pids = [queue.get(timeout=60) for _ in range(workers)]
+        elapsed = time.perf_counter() - start
+        # Let the workers settle, e.g. run a garbage collection.
+        time.sleep(1)
+        usage = [memory_usage(pid) for pid in pids]
+    finally:
+        assert process.pid is not None
+        os.kill(process.pid, signal.SIGTERM)
+        process.join()
+
+    uss = sum(item.uss for item in usage) / len(usage) / 2**20
+    pss = sum(item.pss for item in usage) / len(usage) / 2**20
+    name = "preload" if preload else "no preload"
+    print(
+        f"{name:<12} ready in {elapsed:>6.2f}s"
+        f"   per worker: {uss:>7.1f} MiB USS {pss:>7.1f} MiB PSS"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    for preload in (False, True):
+        run(args.workers, preload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Compare the cost of the ASGI scope of each request on a keep-alive connection,
+between the stock `httptools` protocol of Uvicorn, that builds every scope from a
+dict literal, and the protocols of this repository, that copy a template built
+once per connection.
+
+    python -m benchmarks.scope --requests 100000 --rounds 5
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Callable, Coroutine, Dict, Optional, Tuple, Type
+
+import uvicorn_extended
+import uvicorn_httparse
+import uvicorn_trailers
+from uvicorn.config import Config
+from uvicorn.protocols.http.httptools_impl import HttpToolsProtocol
+from uvicorn.server import ServerState
+
+from benchmarks.apps import hello_world
+
+REQUEST = (
+    b"GET /api/v1/users/42?fields=name HTTP/1.1\r\n"
+    b"Host: example.org\r\n"
+    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Firefox/119.0\r\n"
+    b"Accept: application/json\r\n"
+    b"Accept-Encoding: gzip, deflate, br\r\n"
+    b"Connection: keep-alive\r\n"
+    b"\r\n"
+)
+
+PROTOCOLS: Dict[str, Type[asyncio.Protocol]] = {
+    "httptools": HttpToolsProtocol,
+    "uvicorn_trailers": uvicorn_trailers.HTTPProtocol,
+    "uvicorn_extended": uvicorn_extended.HTTPProtocol,
+    "uvicorn_httparse": uvicorn_httparse.HttparseProtocol,
+}
+
+
+class Transport:
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        return {
+            "sockname": ("127.0.0.1", 8000),
+            "peername": ("127.0.0.1", 50000),
+        }.get(name, default)
+
+    def write(self, data: bytes) -> None:
+        pass
+
+    def is_closing(self) -> bool:
+        return False
+
+    def pause_reading(self) -> None:
+        pass
+
+    def resume_reading(self) -> None:
+        pass
+
+
+class Task:
+    def add_done_callback(self, callback: Callable[..., Any]) -> None:
+        pass
+
+
+class Loop:
+    """
+    The apps are never run: only the requests are parsed into scopes.
+    """
+
+    def create_task(self, coroutine: Coroutine[Any, Any, Any]) -> Task:
+        coroutine.close()
+        return Task()
+
+    def call_later(
+        self, delay: float, callback: Callable[..., Any], *args: Any
+    ) -> None:
+        pass
+
+
+def connect(protocol_class: Type[asyncio.Protocol], config: Config) -> Any:
+    protocol = protocol_class(  # type: ignore[call-arg]
+        config=config, server_state=ServerState(), _loop=Loop()
+    )
+    protocol.connection_made(Transport())  # type: ignore[arg-type]
+    return protocol
+
+
+def bench_requests(protocol_class: Type[asyncio.Protocol], requests: int) -> float:
+    """
+    Return the µs to parse a request, from its bytes to the scope of its cycle.
+    """
+    # `httparse` takes all that follows a request for its body, so it serves a
+    # single request per connection: its connections are made within the timing.
+    keep_alive = protocol_class is not uvicorn_httparse.HttparseProtocol
+    config = Config(app=hello_world, lifespan="off")
+    protocol = connect(protocol_class, config)
+    elapsed = 0.0
+    for _ in range(requests):
+        start = time.perf_counter()
+        if not keep_alive:
+            protocol = connect(protocol_class, config)
+        protocol.data_received(REQUEST)
+        elapsed += time.perf_counter() - start
+        protocol.cycle.response_complete = True
+    return elapsed / requests * 1e6
+
+
+def bench_scopes(
+    protocol_class: Type[asyncio.Protocol], requests: int
+) -> Optional[float]:
+    """
+    Return the µs to build the scope of a request, before its headers are parsed.
+    """
+    config = Config(app=hello_world, lifespan="off")
+    protocol = connect(protocol_class, config)
+    on_message_begin = getattr(protocol, "on_message_begin", None)
+    if on_message_begin is None:
+        # `httparse` parses a whole request at once.
+        return None
+    start = time.perf_counter()
+    for _ in range(requests):
+        on_message_begin()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main(requests: int, rounds: int) -> None:
+    results: Dict[str, Tuple[float, Optional[float]]] = {}
+    for _ in range(rounds):
+        for name, protocol_class in PROTOCOLS.items():
+            request = bench_requests(protocol_class, requests)
+            scope = bench_scopes(protocol_class, requests)
+            best_request, best_scope = results.get(name, (request, scope))
+            results[name] = (
+                min(request, best_request),
+                None if scope is None else min(scope, best_scope or scope),
+            )
+    for name, (request, scope) in results.items():
+        scope_text = "      -" if scope is None else f"{scope:7.2f}"
+        print(f"{name:<18} {scope_text} µs/scope {request:7.2f} µs/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    main(args.requests, args.rounds)
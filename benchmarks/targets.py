@@ -0,0 +1,160 @@
+"""
+Compare the decoding of request targets into the `path`, `raw_path` and
+`query_string` of the scopes: as the protocols used to, with `httptools.parse_url`
+or `bytes.partition`, and with `uvicorn_target.TargetDecoder`, on a few
+distributions of targets.
+
+    python -m benchmarks.targets --requests 200000 --paths 3000
+"""
+import argparse
+import base64
+import random
+import time
+import urllib.parse
+from typing import Callable, Dict, List, Tuple
+
+import httptools
+from uvicorn_target import TargetDecoder, decode_target
+
+Decoded = Tuple[str, bytes, bytes]
+
+
+def parse_url(target: bytes) -> Decoded:
+    # As the `httptools` protocols did.
+    parsed_url = httptools.parse_url(target)
+    raw_path = parsed_url.path
+    path = raw_path.decode("ascii")
+    if "%" in path:
+        path = urllib.parse.unquote(path)
+    return path, raw_path, parsed_url.query or b""
+
+
+def partition(target: bytes) -> Decoded:
+    # As the HTTP/2 protocol did, and the `httparse` one on `str`.
+    raw_path, _, query_string = target.partition(b"?")
+    path = raw_path.decode("ascii")
+    if "%" in path:
+        path = urllib.parse.unquote(path)
+    return path, raw_path, query_string
+
+
+def make_paths(count: int, rng: random.Random) -> List[bytes]:
+    """
+    Return the distinct targets of an application: API resources, static files,
+    some percent-encoded, and a few query strings.
+    """
+    paths = []
+    for index in range(count):
+        kind = index % 10
+        if kind < 5:
+            path = f"/api/v1/users/{index}/orders"
+        elif kind < 7:
+            path = f"/static/js/chunk-{index:x}.{rng.getrandbits(32):08x}.js"
+        elif kind < 8:
+            path = f"/articles/{urllib.parse.quote(f'café-{index}')}"
+        else:
+            path = f"/api/v1/search?q=item{index}&page={index % 5 + 1}"
+        paths.append(path.encode("ascii"))
+    return paths
+
+
+def zipf(paths: List[bytes], requests: int, rng: random.Random) -> List[bytes]:
+    """
+    A few popular targets, and a long tail.
+    """
+    weights = [1 / rank for rank in range(1, len(paths) + 1)]
+    return rng.choices(paths, weights, k=requests)
+
+
+def unique_queries(
+    paths: List[bytes], requests: int, rng: random.Random
+) -> List[bytes]:
+    """
+    Half of the requests with a query string of their own, e.g. to bust caches.
+    """
+    targets = zipf(paths, requests, rng)
+    for index in range(0, requests, 2):
+        path = targets[index].partition(b"?")[0]
+        targets[index] = b"%s?_=%d" % (path, rng.getrandbits(40))
+    return targets
+
+
+def tracking_queries(
+    paths: List[bytes], requests: int, rng: random.Random
+) -> List[bytes]:
+    """
+    A quarter of the requests with long, unique, tracking query strings.
+    """
+    targets = zipf(paths, requests, rng)
+    for index in range(0, requests, 4):
+        path = targets[index].partition(b"?")[0]
+        tracking = "&".join(f"utm_{key}={rng.getrandbits(64):x}" for key in "abcdefgh")
+        targets[index] = path + b"?" + tracking.encode("ascii")
+    return targets
+
+
+def long_paths(paths: List[bytes], requests: int, rng: random.Random) -> List[bytes]:
+    """
+    A quarter of the requests for long, unique, paths, e.g. signed URLs.
+    """
+    targets = zipf(paths, requests, rng)
+    for index in range(0, requests, 4):
+        token = base64.urlsafe_b64encode(rng.getrandbits(1536).to_bytes(192, "big"))
+        targets[index] = b"/media/" + token + b"/image.png"
+    return targets
+
+
+DISTRIBUTIONS: Dict[str, Callable[[List[bytes], int, random.Random], List[bytes]]] = {
+    "zipf": zipf,
+    "unique queries": unique_queries,
+    "tracking queries": tracking_queries,
+    "long paths": long_paths,
+}
+
+
+def bench(decoder: Callable[[bytes], object], targets: List[bytes]) -> float:
+    """
+    Return the ns to decode a target.
+    """
+    start = time.perf_counter()
+    for target in targets:
+        decoder(target)
+    return (time.perf_counter() - start) / len(targets) * 1e9
+
+
+def main(requests: int, paths_count: int, rounds: int) -> None:
+    rng = random.Random(0)
+    paths = make_paths(paths_count, rng)
+    decoders: Dict[str, Callable[[], Callable[[bytes], object]]] = {
+        "httptools.parse_url": lambda: parse_url,
+        "bytes.partition": lambda: partition,
+        "decode_target": lambda: decode_target,
+        "TargetDecoder": TargetDecoder,
+    }
+    for name, distribution in DISTRIBUTIONS.items():
+        targets = distribution(paths, requests, rng)
+        print(f"{name} ({len(set(targets))} distinct targets)")
+        results: Dict[str, float] = {}
+        # The decoders take turns, so that they share the noise of the machine.
+        for _ in range(rounds):
+            for decoder_name, make_decoder in decoders.items():
+                elapsed = bench(make_decoder(), targets)
+                results[decoder_name] = min(elapsed, results.get(decoder_name, elapsed))
+        for decoder_name, elapsed in results.items():
+            print(f"  {decoder_name:<20} {elapsed:7.0f} ns/target")
+        decoder = TargetDecoder()
+        bench(decoder, targets)
+        stats = decoder.stats()
+        print(
+            f"  {'':<20} {stats['hits'] / requests:7.1%} hits,"
+            f" {stats['bypassed'] / requests:.1%} bypassed"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--paths", type=int, default=3_000, help="Distinct paths.")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    main(args.requests, args.paths, args.rounds)
@@ -0,0 +1,81 @@
+"""
+Measure the memory of the server per idle TLS connection to
+`uvicorn_tls.HTTPProtocol`, with the buffers of asyncio, and with `SSLBuffers`.
+
+    python -m benchmarks.tls_memory --connections 2000
+"""
+import argparse
+import socket
+import ssl
+from pathlib import Path
+from typing import List
+
+import uvicorn_tls
+
+from benchmarks.apps import hello_world
+from benchmarks.utils import serve, unused_port
+
+CERTS = Path(__file__).parent.parent / "tests" / "certs"
+
+
+class OwnBufferProtocol(uvicorn_tls.HTTPProtocol):
+    ssl_buffers = uvicorn_tls.SSLBuffers(shared=False)
+
+
+class SSLBuffersProtocol(uvicorn_tls.HTTPProtocol):
+    ssl_buffers = uvicorn_tls.SSLBuffers()
+
+
+def rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("No VmRSS.")  # pragma: no cover
+
+
+def connect(context: ssl.SSLContext, port: int) -> ssl.SSLSocket:
+    sock = context.wrap_socket(
+        socket.create_connection(("127.0.0.1", port)), server_hostname="localhost"
+    )
+    sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    sock.recv(4096)
+    return sock
+
+
+def bench(name: str, connections: int, http: type) -> None:
+    context = ssl.create_default_context(cafile=str(CERTS / "ca.pem"))
+    port = unused_port()
+    socks: List[ssl.SSLSocket] = []
+    with serve(
+        hello_world,
+        port,
+        http=http,
+        ssl_certfile=str(CERTS / "server.pem"),
+        ssl_keyfile=str(CERTS / "server.key"),
+        timeout_keep_alive=3600,
+    ) as process:
+        assert process.pid is not None
+        # The first connections allocate what's kept for all of them.
+        socks.extend(connect(context, port) for _ in range(10))
+        before = rss(process.pid)
+        socks.extend(connect(context, port) for _ in range(connections))
+        after = rss(process.pid)
+        for sock in socks:
+            sock.close()
+    per_connection = (after - before) / connections / 1024
+    print(f"{name:<26} {per_connection:>8.1f} KiB/connection")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connections", type=int, default=2000)
+    args = parser.parse_args()
+
+    bench("asyncio", args.connections, uvicorn_tls.HTTPProtocol)
+    bench("SSLBuffers(shared=False)", args.connections, OwnBufferProtocol)
+    bench("SSLBuffers()", args.connections, SSLBuffersProtocol)
+
+
+if __name__ == "__main__":
+    main()
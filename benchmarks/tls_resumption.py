@@ -0,0 +1,75 @@
+"""
+Compare the TLS handshakes of new connections to `uvicorn_tls.HTTPProtocol`, full
+and resumed with a session ticket.
+
+    python -m benchmarks.tls_resumption --connections 2000
+"""
+import argparse
+import socket
+import ssl
+import statistics
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import uvicorn_tls
+
+from benchmarks.apps import hello_world
+from benchmarks.utils import serve, unused_port
+
+CERTS = Path(__file__).parent.parent / "tests" / "certs"
+
+
+class HTTPProtocol(uvicorn_tls.HTTPProtocol):
+    session_resumption = uvicorn_tls.SessionResumption()
+
+
+def handshake(
+    context: ssl.SSLContext, port: int, session: Optional[ssl.SSLSession]
+) -> ssl.SSLSession:
+    with socket.create_connection(("127.0.0.1", port)) as raw:
+        with context.wrap_socket(
+            raw, server_hostname="localhost", session=session
+        ) as sock:
+            sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            sock.recv(4096)
+            assert session is None or sock.session_reused
+            assert sock.session is not None
+            return sock.session
+
+
+def bench(port: int, connections: int, resume: bool) -> None:
+    context = ssl.create_default_context(cafile=str(CERTS / "ca.pem"))
+    session = handshake(context, port, None) if resume else None
+    latencies: List[float] = []
+    for _ in range(connections):
+        start = time.perf_counter()
+        handshake(context, port, session)
+        latencies.append(time.perf_counter() - start)
+    elapsed = sum(latencies)
+    name = "resumed" if resume else "full"
+    print(
+        f"{name:<10} {connections / elapsed:>8.0f} conn/s"
+        f"   p50 {statistics.median(latencies) * 1000:>6.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connections", type=int, default=2000)
+    args = parser.parse_args()
+
+    port = unused_port()
+    with serve(
+        hello_world,
+        port,
+        http=HTTPProtocol,
+        ssl_certfile=str(CERTS / "server.pem"),
+        ssl_keyfile=str(CERTS / "server.key"),
+    ):
+        bench(port, args.connections, resume=False)
+        bench(port, args.connections, resume=True)
+
+
+if __name__ == "__main__":
+    main()
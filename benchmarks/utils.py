@@ -0,0 +1,52 @@
+import contextlib
+import multiprocessing
+import os
+import socket
+import time
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Iterator
+
+import uvicorn
+
+
+def unused_port() -> int:
+    with contextlib.closing(socket.socket()) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError):
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        time.sleep(0.05)
+    raise TimeoutError(f"Server did not start listening on port {port}.")
+
+
+@contextlib.contextmanager
+def serve(app: Callable[..., Any], port: int, **kwargs: Any) -> Iterator[BaseProcess]:
+    """Run `uvicorn.run(app, **kwargs)` on a separate process."""
+    kwargs = {"port": port, "log_level": "warning", "lifespan": "off", **kwargs}
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=uvicorn.run, args=(app,), kwargs=kwargs)
+    process.start()
+    try:
+        wait_for_port(port)
+        yield process
+    finally:
+        process.terminate()
+        process.join()
+
+
+def cpu_time(pid: int) -> float:
+    """The CPU time of the process `pid`, in seconds, on Linux."""
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    # The user and system times, after the state, at the 14th and 15th fields.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def report(name: str, requests: int, elapsed: float) -> None:
+    print(f"{name:<40} {requests / elapsed:>10.0f} req/s {elapsed:>8.2f}s")
@@ -1,7 +1,10 @@
 import sys
 from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
 
-from typing_extensions import NotRequired
+if sys.version_info >= (3, 11):  # pragma: no cover
+    from typing import NotRequired
+else:  # pragma: no cover
+    from typing_extensions import NotRequired
 
 if sys.version_info >= (3, 8):  # pragma: no cover
     from typing import Literal, TypedDict
@@ -1,3 +1,16 @@
-from uvicorn_denial.wsproto_impl import WSProtocol
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from uvicorn_denial.wsproto_impl import WSProtocol
 
 __all__ = ["WSProtocol"]
+
+
+def __getattr__(name: str) -> Any:
+    # The protocol imports `wsproto`, only once it's used.
+    if name == "WSProtocol":
+        from uvicorn_denial.wsproto_impl import WSProtocol
+
+        globals()[name] = WSProtocol
+        return WSProtocol
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
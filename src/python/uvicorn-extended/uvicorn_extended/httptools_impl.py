@@ -1,18 +1,26 @@
 from __future__ import annotations
 
 import asyncio
+import importlib.util
 import logging
-import urllib.parse
-from typing import Callable, cast
+import os
+import sys
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    NamedTuple,
+    Optional,
+    Type,
+    cast,
+)
 
 import httptools
-from asgi_types import (
-    ASGISendEvent,
-    HTTPResponseStartEvent,
-    HTTPResponseTrailersEvent,
-    HTTPScope,
-)
+import uvicorn_denial
 from uvicorn.config import Config
+from uvicorn.logging import TRACE_LOG_LEVEL
 from uvicorn.protocols.http.flow_control import (
     CLOSE_HEADER,
     FlowControl,
@@ -27,9 +35,52 @@ from uvicorn.protocols.http.httptools_impl import (
 )
 from uvicorn.protocols.utils import get_client_addr, get_path_with_query_string
 from uvicorn.server import ServerState
+from uvicorn_target import DEFAULT_TARGET_DECODER, TargetDecoder
+from uvicorn_tls.extension import (
+    get_tls_extension,
+    load_server_cert,
+    record_server_name,
+)
+from uvicorn_tls.ktls import send_file
+
+try:
+    import uvicorn_http2
+    from uvicorn_http2 import CONNECTION_PREFACE
+except ImportError:  # pragma: no cover
+    uvicorn_http2 = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    from asgi_types import (
+        ASGISendEvent,
+        HTTPResponseStartEvent,
+        HTTPResponseTrailersEvent,
+        HTTPScope,
+    )
+    from uvicorn_http2 import H2Protocol
+
+# The WebSocket denial response needs `wsproto`.
+WSPROTO_INSTALLED = importlib.util.find_spec("wsproto") is not None
 
 
 class HTTPProtocol(HttpToolsProtocol):
+    """
+    The Uvicorn `httptools` protocol, with the HTTP trailers, TLS and zero-copy
+    send extensions, the WebSocket denial response, and HTTP/2 with `h2c`.
+
+    What depends on the connection, e.g. the extensions and the template of its
+    scopes, is settled in `connection_made`, rather than checked again for each
+    request.
+    """
+
+    # HTTP/2 connections are handed over to `h2_protocol_class`, or else to
+    # `uvicorn_http2.H2Protocol`, that's imported, with `h2`, once a client speaks
+    # HTTP/2. Without `http2`, they're answered over HTTP/1.1.
+    h2_protocol_class: Type[H2Protocol] | None = None
+    http2 = uvicorn_http2 is not None
+    # The request targets are decoded once each, in a cache shared with the other
+    # protocols.
+    target_decoder: TargetDecoder = DEFAULT_TARGET_DECODER
+
     def __init__(
         self,
         config: Config,
@@ -37,13 +88,38 @@ class HTTPProtocol(HttpToolsProtocol):
         _loop: asyncio.AbstractEventLoop | None = None,
     ) -> None:
         super().__init__(config, server_state, _loop)
+        # The server name is only known by the SNI callback, during the handshake.
+        if config.ssl is not None and config.ssl.sni_callback is None:
+            config.ssl.sni_callback = record_server_name
+        # Unless another WebSocket protocol was chosen, use the one that can deny.
+        # `uvicorn_denial` imports it, with `wsproto`, on first access.
+        if config.ws in ("auto", "wsproto") and WSPROTO_INSTALLED:
+            self.ws_protocol_class = uvicorn_denial.WSProtocol
+        self.extensions: Dict[str, Any] = {}
+        self.scope_template: Dict[str, Any] = {}
         self.expect_trailers = False
+        # The start of the HTTP/2 preface, until it's complete or ruled out.
+        self.preface: bytes | None = b"" if self.http2 else None
+        self.received = b""
 
-    def on_message_begin(self) -> None:
-        self.url = b""
-        self.expect_100_continue = False
-        self.headers = []
-        self.scope = {
+    def connection_made(  # type: ignore[override]
+        self, transport: asyncio.Transport
+    ) -> None:
+        super().connection_made(transport)
+        extensions: Dict[str, Any] = {
+            "http.response.trailers": {},
+            "http.response.zerocopysend": {},
+        }
+        ssl_object = transport.get_extra_info("ssl_object")
+        if ssl_object is not None:
+            server_cert = getattr(ssl_object, "server_cert", None)
+            certfile = self.config.ssl_certfile
+            if server_cert is None and certfile:
+                server_cert = load_server_cert(str(certfile))
+            extensions["tls"] = get_tls_extension(ssl_object, server_cert)
+        self.extensions = extensions
+        # The scope of each request starts as a copy of this one.
+        self.scope_template = {
             "type": "http",
             "asgi": {"version": self.config.asgi_version, "spec_version": "2.3"},
             "http_version": "1.1",
@@ -51,10 +127,103 @@ class HTTPProtocol(HttpToolsProtocol):
             "client": self.client,
             "scheme": self.scheme,
             "root_path": self.root_path,
-            "headers": self.headers,
-            "extensions": {"http.response.trailers": {}},
         }
 
+    def data_received(self, data: bytes) -> None:
+        # Only the first data of a connection can be the HTTP/2 preface, and it may
+        # come in more than one segment: what could still be it is held. It's
+        # checked here, rather than by swapping `data_received`, since `uvloop`
+        # holds on to the method the protocol had before `connection_made`.
+        if self.preface is not None:
+            data = self.preface + data
+            if len(data) < len(CONNECTION_PREFACE) and CONNECTION_PREFACE.startswith(
+                data
+            ):
+                self._unset_keepalive_if_required()
+                self.preface = data
+                return
+            self.preface = None
+            if data.startswith(CONNECTION_PREFACE):
+                self._unset_keepalive_if_required()
+                self.handle_http2_prior_knowledge(data)
+                return
+
+        # For `_should_upgrade_to_ws`, that hands what follows `h2c` over.
+        self.received = data
+        super().data_received(data)
+        self.received = b""
+
+    def _should_upgrade_to_ws(self, upgrade: bytes | None) -> bool:
+        # `data_received` calls it on `httptools.HttpParserUpgrade`, whose argument
+        # is the offset of the data that follows the upgrade request.
+        if upgrade == b"h2c" and self._get_http2_settings() is not None:
+            exc = sys.exc_info()[1]
+            assert isinstance(exc, httptools.HttpParserUpgrade)
+            self.handle_http2_upgrade(self.received[exc.args[0] :])
+            return False
+        return super()._should_upgrade_to_ws(upgrade)
+
+    def _get_http2_settings(self) -> bytes | None:
+        if self.scheme != "http" or self._get_upgrade() != b"h2c":
+            return None
+        protocol_class = self._get_h2_protocol_class()
+        if protocol_class is None:
+            return None
+        return protocol_class.get_upgrade_settings(self.headers)
+
+    def _get_h2_protocol_class(self) -> Type[H2Protocol] | None:
+        if not self.http2:
+            return None
+        return self.h2_protocol_class or uvicorn_http2.H2Protocol
+
+    def _should_upgrade(self) -> bool:
+        if self._get_http2_settings() is not None:
+            return True
+        return super()._should_upgrade()
+
+    def _create_http2_protocol(self) -> H2Protocol:
+        protocol_class = self._get_h2_protocol_class()
+        assert protocol_class is not None
+        if self.logger.level <= TRACE_LOG_LEVEL:  # pragma: to be covered
+            prefix = "%s:%d - " % self.client if self.client else ""
+            self.logger.log(TRACE_LOG_LEVEL, "%sUpgrading to HTTP/2", prefix)
+
+        self.connections.discard(self)
+        protocol = protocol_class(
+            config=self.config, server_state=self.server_state, _loop=self.loop
+        )
+        self.transport.set_protocol(protocol)
+        return protocol
+
+    def handle_http2_prior_knowledge(self, data: bytes) -> None:
+        protocol = self._create_http2_protocol()
+        protocol.connection_made(self.transport)
+        protocol.data_received(data)
+
+    def handle_http2_upgrade(self, data: bytes) -> None:
+        settings = self._get_http2_settings()
+        assert settings is not None
+        protocol = self._create_http2_protocol()
+        protocol.handle_upgrade(
+            self.transport,
+            self.scope["method"].encode("ascii"),
+            self.url,
+            self.headers,
+            settings,
+            data,
+        )
+
+    def on_message_begin(self) -> None:
+        self.url = b""
+        self.expect_100_continue = False
+        self.expect_trailers = False
+        self.headers = []
+        scope = self.scope_template.copy()
+        scope["asgi"] = scope["asgi"].copy()
+        scope["headers"] = self.headers
+        scope["extensions"] = self.extensions.copy()
+        self.scope = cast("HTTPScope", scope)
+
     def on_header(self, name: bytes, value: bytes) -> None:
         name = name.lower()
         if name == b"expect" and value.lower() == b"100-continue":
@@ -73,14 +242,10 @@ class HTTPProtocol(HttpToolsProtocol):
             self.scope["http_version"] = http_version
         if self.parser.should_upgrade() and self._should_upgrade():
             return
-        parsed_url = httptools.parse_url(self.url)
-        raw_path = parsed_url.path
-        path = raw_path.decode("ascii")
-        if "%" in path:
-            path = urllib.parse.unquote(path)
+        path, raw_path, query_string = self.target_decoder(self.url)
         self.scope["path"] = path
         self.scope["raw_path"] = raw_path
-        self.scope["query_string"] = parsed_url.query or b""
+        self.scope["query_string"] = query_string
 
         # Handle 503 responses when 'limit_concurrency' is exceeded.
         if self.limit_concurrency is not None and (
@@ -119,6 +284,53 @@ class HTTPProtocol(HttpToolsProtocol):
             self.pipeline.appendleft((self.cycle, app))
 
 
+# The headers that change how the response is framed.
+FRAMING_HEADERS = frozenset((b"content-length", b"transfer-encoding", b"connection"))
+
+
+class RenderedHeaders:
+    headers: list[tuple[bytes, bytes]] | None = None
+    content: bytes | None = None
+
+
+rendered = RenderedHeaders()
+
+
+def render_default_headers(headers: list[tuple[bytes, bytes]]) -> bytes | None:
+    """
+    The default headers of the server, as written in the responses, or `None` if
+    they change how the responses are framed.
+
+    The server replaces them about once per second, with the `date` header, so
+    they're validated and rendered once for all the responses in between.
+    """
+    if headers is not rendered.headers:
+        for name, value in headers:
+            if HEADER_RE.search(name):  # pragma: to be covered
+                raise RuntimeError("Invalid HTTP header name.")
+            if HEADER_VALUE_RE.search(value):
+                raise RuntimeError("Invalid HTTP header value.")
+        content: bytes | None = b"".join(
+            b"%s: %s\r\n" % (name.lower(), value) for name, value in headers
+        )
+        if any(name.lower() in FRAMING_HEADERS for name, _ in headers):
+            content = None
+        rendered.headers, rendered.content = headers, content
+    return rendered.content
+
+
+Handler = Callable[["RequestResponseCycle", Any], Optional[Awaitable[None]]]
+
+
+class State(NamedTuple):
+    """
+    The messages a response expects next, and the error for any other.
+    """
+
+    handlers: Dict[str, Handler]
+    error: str
+
+
 class RequestResponseCycle(_RequestResponseCycle):
     def __init__(
         self,
@@ -135,168 +347,225 @@ class RequestResponseCycle(_RequestResponseCycle):
         keep_alive: bool,
         on_response: Callable[..., None],
     ) -> None:
-        super().__init__(
-            scope,
-            transport,
-            flow,
-            logger,
-            access_logger,
-            access_log,
-            default_headers,
-            message_event,
-            expect_100_continue,
-            keep_alive,
-            on_response,
-        )
+        # Set here, rather than by `super().__init__`, as it's done per request.
+        self.scope = scope
+        self.transport = transport
+        self.flow = flow
+        self.logger = logger
+        self.access_logger = access_logger
+        self.access_log = access_log
+        self.default_headers = default_headers
+        self.message_event = message_event
+        self.on_response = on_response
+
+        # Connection state
+        self.disconnected = False
+        self.keep_alive = keep_alive
+        self.waiting_for_100_continue = expect_100_continue
+
+        # Request state
+        self.body = b""
+        self.more_body = True
+
+        # Response state
+        self.response_started = False
+        self.response_complete = False
+        self.chunked_encoding: bool | None = None
+        self.expected_content_length = 0
         self.expect_trailers = expect_trailers
         self.send_trailers = False
+        self.state = START
 
     async def send(self, message: ASGISendEvent) -> None:
-        message_type = message["type"]
-
         if self.flow.write_paused and not self.disconnected:
             await self.flow.drain()  # pragma: to be covered
 
         if self.disconnected:
             return  # pragma: to be covered
 
-        if not self.response_started:
-            # Sending response status line and headers
-            if message_type != "http.response.start":
-                msg = "Expected ASGI message 'http.response.start', but got '%s'."
-                raise RuntimeError(msg % message_type)
-            message = cast(HTTPResponseStartEvent, message)
-
-            self.response_started = True
-            self.waiting_for_100_continue = False
-
-            status_code = message["status"]
-            headers = self.default_headers + list(message.get("headers", []))
+        message_type = message["type"]
+        handler = self.state.handlers.get(message_type)
+        if handler is None:
+            raise RuntimeError(self.state.error % message_type)
+        result = handler(self, message)
+        if result is not None:
+            await result
+
+    def send_start(self, message: HTTPResponseStartEvent) -> None:
+        self.response_started = True
+        self.waiting_for_100_continue = False
+        self.state = BODY
+
+        status_code = message["status"]
+        headers = message.get("headers", [])
+
+        self.send_trailers = (
+            message.get("trailers", False) and self.scope["method"] != "HEAD"
+        )
 
-            self.send_trailers = (
-                message.get("trailers", False) and self.scope["method"] != "HEAD"
+        if CLOSE_HEADER in self.scope["headers"] and CLOSE_HEADER not in headers:
+            headers = list(headers) + [CLOSE_HEADER]  # pragma: to be covered
+
+        if self.access_log:
+            self.access_logger.info(
+                '%s - "%s %s HTTP/%s" %d',
+                get_client_addr(self.scope),
+                self.scope["method"],
+                get_path_with_query_string(self.scope),
+                self.scope["http_version"],
+                status_code,
             )
 
-            if CLOSE_HEADER in self.scope["headers"] and CLOSE_HEADER not in headers:
-                headers = headers + [CLOSE_HEADER]  # pragma: to be covered
-
-            if self.access_log:
-                self.access_logger.info(
-                    '%s - "%s %s HTTP/%s" %d',
-                    get_client_addr(self.scope),
-                    self.scope["method"],
-                    get_path_with_query_string(self.scope),
-                    self.scope["http_version"],
-                    status_code,
-                )
-
-            # Write response status line and headers
-            content = [STATUS_LINE[status_code]]
-
-            for name, value in headers:
-                if HEADER_RE.search(name):  # pragma: to be covered
-                    raise RuntimeError("Invalid HTTP header name.")
-                if HEADER_VALUE_RE.search(value):  # pragma: to be covered
-                    raise RuntimeError("Invalid HTTP header value.")
-
-                name = name.lower()
-                if name == b"content-length" and self.chunked_encoding is None:
-                    self.expected_content_length = int(value.decode())
-                    self.chunked_encoding = False
-                elif name == b"transfer-encoding" and value.lower() == b"chunked":
-                    self.expected_content_length = 0
-                    self.chunked_encoding = True
-                elif name == b"connection" and value.lower() == b"close":
-                    self.keep_alive = False
-                content.extend([name, b": ", value, b"\r\n"])
-
-            if (
-                self.chunked_encoding is None
-                and self.scope["method"] != "HEAD"
-                and status_code not in (204, 304)
-            ):
-                # Neither content-length nor transfer-encoding specified
+        # Write response status line and headers
+        content = [STATUS_LINE[status_code]]
+        default_headers = render_default_headers(self.default_headers)
+        if default_headers is None:
+            headers = self.default_headers + list(headers)
+        else:
+            content.append(default_headers)
+
+        for name, value in headers:
+            if HEADER_RE.search(name):  # pragma: to be covered
+                raise RuntimeError("Invalid HTTP header name.")
+            if HEADER_VALUE_RE.search(value):  # pragma: to be covered
+                raise RuntimeError("Invalid HTTP header value.")
+
+            name = name.lower()
+            if name == b"content-length" and self.chunked_encoding is None:
+                self.expected_content_length = int(value.decode())
+                self.chunked_encoding = False
+            elif name == b"transfer-encoding" and value.lower() == b"chunked":
+                self.expected_content_length = 0
                 self.chunked_encoding = True
-                content.append(b"transfer-encoding: chunked\r\n")
+            elif name == b"connection" and value.lower() == b"close":
+                self.keep_alive = False
+            content.extend([name, b": ", value, b"\r\n"])
+
+        if (
+            self.chunked_encoding is None
+            and self.scope["method"] != "HEAD"
+            and status_code not in (204, 304)
+        ):
+            # Neither content-length nor transfer-encoding specified
+            self.chunked_encoding = True
+            content.append(b"transfer-encoding: chunked\r\n")
+
+        content.append(b"\r\n")
+        self.transport.write(b"".join(content))
+
+    def send_body(self, message: Any) -> None:
+        body = cast(bytes, message.get("body", b""))
+        more_body = message.get("more_body", False)
+
+        # Write response body
+        if self.scope["method"] == "HEAD":
+            self.expected_content_length = 0
+        elif self.chunked_encoding:
+            if body:
+                content = [b"%x\r\n" % len(body), body, b"\r\n"]
+            else:
+                content = []
+            if not more_body:
+                content.append(b"0\r\n\r\n")
+            self.transport.write(b"".join(content))
+        else:
+            num_bytes = len(body)
+            if num_bytes > self.expected_content_length:
+                raise RuntimeError("Response content longer than Content-Length")
+            else:
+                self.expected_content_length -= num_bytes
+            self.transport.write(body)
+
+        if not more_body:
+            self.complete_body()
+
+    async def send_file(self, message: Any) -> None:
+        file = message["file"]
+        offset = message.get("offset", 0)
+        count = message.get("count")
+        more_body = message.get("more_body", False)
+        if count is None:
+            count = os.fstat(file.fileno()).st_size - offset
+
+        # Write response body
+        if self.scope["method"] == "HEAD":
+            self.expected_content_length = 0
+        elif self.chunked_encoding:
+            if count:
+                self.transport.write(b"%x\r\n" % count)
+                await send_file(self.transport, file, offset, count, self.flow.drain)
+                self.transport.write(b"\r\n")
+            if not more_body:
+                self.transport.write(b"0\r\n\r\n")
+        else:
+            if count > self.expected_content_length:
+                raise RuntimeError("Response content longer than Content-Length")
+            self.expected_content_length -= count
+            await send_file(self.transport, file, offset, count, self.flow.drain)
+
+        if not more_body:
+            self.complete_body()
+
+    def complete_body(self) -> None:
+        if self.expected_content_length != 0:
+            raise RuntimeError("Response content shorter than Content-Length")
+        self.response_complete = True
+        self.message_event.set()
+
+        if self.send_trailers:
+            self.state = TRAILERS
+        else:
+            self.complete()
 
+    def send_trailers_message(self, message: HTTPResponseTrailersEvent) -> None:
+        trailers = list(message.get("headers", []))
+        more_trailers = message.get("more_trailers", False)
+        content = []
+
+        for name, value in trailers:
+            if HEADER_RE.search(name):  # pragma: to be covered
+                raise RuntimeError("Invalid HTTP header name.")
+            if HEADER_VALUE_RE.search(value):  # pragma: to be covered
+                raise RuntimeError("Invalid HTTP header value.")
+
+            name = name.lower()
+            if name == b"connection" and value.lower() == b"close":
+                self.keep_alive = False  # pragma: to be covered
+            content.extend([name, b": ", value, b"\r\n"])
+
+        if not more_trailers:
             content.append(b"\r\n")
+
+        # Server should only send if the client sent a TE header.
+        if self.expect_trailers:
             self.transport.write(b"".join(content))
 
-        elif not self.response_complete:
-            # Sending response body
-            if message_type != "http.response.body":
-                msg = "Expected ASGI message 'http.response.body', but got '%s'."
-                raise RuntimeError(msg % message_type)
+        if not more_trailers:
+            self.send_trailers = False
+            self.complete()
 
-            body = cast(bytes, message.get("body", b""))
-            more_body = message.get("more_body", False)
+    def complete(self) -> None:
+        self.state = COMPLETE
+        if not self.keep_alive:
+            self.transport.close()
+        self.on_response()
 
-            # Write response body
-            if self.scope["method"] == "HEAD":
-                self.expected_content_length = 0
-            elif self.chunked_encoding:
-                if body:
-                    content = [b"%x\r\n" % len(body), body, b"\r\n"]
-                else:
-                    content = []
-                if not more_body:
-                    content.append(b"0\r\n\r\n")
-                self.transport.write(b"".join(content))
-            else:
-                num_bytes = len(body)
-                if num_bytes > self.expected_content_length:
-                    raise RuntimeError("Response content longer than Content-Length")
-                else:
-                    self.expected_content_length -= num_bytes
-                self.transport.write(body)
-
-            # Handle response completion
-            if not more_body:
-                if self.expected_content_length != 0:
-                    raise RuntimeError("Response content shorter than Content-Length")
-                self.response_complete = True
-                self.message_event.set()
-
-                if not self.send_trailers:
-                    if not self.keep_alive:
-                        self.transport.close()
-                    self.on_response()
-
-        elif self.send_trailers:
-            if message_type != "http.response.trailers":  # pragma: to be covered
-                msg = "Expected ASGI message 'http.response.trailers', but got '%s'."
-                raise RuntimeError(msg % message_type)
-            message = cast("HTTPResponseTrailersEvent", message)
-
-            trailers = list(message.get("headers", []))
-            more_trailers = message.get("more_trailers", False)
-            content = []
-
-            for name, value in trailers:
-                if HEADER_RE.search(name):  # pragma: to be covered
-                    raise RuntimeError("Invalid HTTP header name.")
-                if HEADER_VALUE_RE.search(value):  # pragma: to be covered
-                    raise RuntimeError("Invalid HTTP header value.")
-
-                name = name.lower()
-                if name == b"connection" and value.lower() == b"close":
-                    self.keep_alive = False  # pragma: to be covered
-                content.extend([name, b": ", value, b"\r\n"])
-
-            if not more_trailers:
-                content.append(b"\r\n")
-
-            # Server should only send if the client sent a TE header.
-            if self.expect_trailers:
-                self.transport.write(b"".join(content))
-
-            if not more_trailers:
-                self.send_trailers = False
-                if not self.keep_alive:
-                    self.transport.close()  # pragma: to be covered
-                self.on_response()
 
-        else:
-            # Response already sent
-            msg = "Unexpected ASGI message '%s' sent, after response already completed."
-            raise RuntimeError(msg % message_type)
+START = State(
+    {"http.response.start": RequestResponseCycle.send_start},
+    "Expected ASGI message 'http.response.start', but got '%s'.",
+)
+BODY = State(
+    {
+        "http.response.body": RequestResponseCycle.send_body,
+        "http.response.zerocopysend": RequestResponseCycle.send_file,
+    },
+    "Expected ASGI message 'http.response.body', but got '%s'.",
+)
+TRAILERS = State(
+    {"http.response.trailers": RequestResponseCycle.send_trailers_message},
+    "Expected ASGI message 'http.response.trailers', but got '%s'.",
+)
+COMPLETE = State(
+    {}, "Unexpected ASGI message '%s' sent, after response already completed."
+)
@@ -0,0 +1,18 @@
+from typing import TYPE_CHECKING, Any
+
+from uvicorn_http2.constants import CONNECTION_PREFACE
+
+if TYPE_CHECKING:
+    from uvicorn_http2.protocol import H2Protocol
+
+__all__ = ["CONNECTION_PREFACE", "H2Protocol"]
+
+
+def __getattr__(name: str) -> Any:
+    # The protocol imports `h2`, that takes longer than Uvicorn itself to import.
+    if name == "H2Protocol":
+        from uvicorn_http2.protocol import H2Protocol
+
+        globals()[name] = H2Protocol
+        return H2Protocol
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,3 @@
+# Every HTTP/2 connection starts with this preface, sent by the client.
+# See: https://www.rfc-editor.org/rfc/rfc9113#section-3.4
+CONNECTION_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
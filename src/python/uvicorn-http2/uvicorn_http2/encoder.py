@@ -0,0 +1,145 @@
+from typing import Any, Dict, FrozenSet, Iterable, Tuple
+
+from hpack import Encoder, HeaderTuple
+from hpack.hpack import INDEX_NONE
+from hpack.table import HeaderTable
+
+# Header fields whose values rarely repeat across responses. Adding them to the
+# dynamic table would only evict the entries that do repeat.
+UNINDEXED_HEADERS = frozenset(
+    [
+        b"age",
+        b"content-disposition",
+        b"content-length",
+        b"content-range",
+        b"etag",
+        b"expires",
+        b"last-modified",
+        b"location",
+        b"set-cookie",
+        b"x-request-id",
+    ]
+)
+
+
+class CountingHeaderTable(HeaderTable):
+    """
+    A header table that counts its insertions, so the encoder can tell whether
+    encoding a header block has changed it.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.generation = 0
+
+    def add(self, name: bytes, value: bytes) -> None:
+        self.generation += 1
+        super().add(name, value)
+
+
+class HeaderEncoder(Encoder):
+    """
+    An HPACK encoder tuned for the responses of a server.
+
+    - The dynamic table never grows beyond `max_header_table_size`, whatever the
+      client allows.
+    - Header fields in `unindexed_headers` are sent as literals without indexing.
+    - Encoded header blocks are cached by header list, and encoded header fields
+      by field. They are only cached when encoding them left the dynamic table
+      untouched, so sending them again is exactly what encoding them would
+      produce. Both caches are cleared as soon as the table changes.
+    """
+
+    header_table: CountingHeaderTable
+
+    def __init__(
+        self,
+        max_header_table_size: int = HeaderTable.DEFAULT_SIZE,
+        unindexed_headers: FrozenSet[bytes] = UNINDEXED_HEADERS,
+        cache_size: int = 128,
+    ) -> None:
+        self.max_header_table_size = max_header_table_size
+        self.unindexed_headers = unindexed_headers
+        self.cache_size = cache_size
+        self.cache: Dict[Tuple[Any, ...], bytes] = {}
+        self.field_cache: Dict[Tuple[Any, ...], bytes] = {}
+        super().__init__()
+        self.header_table = CountingHeaderTable()
+        self.header_table_size = HeaderTable.DEFAULT_SIZE
+
+    @property
+    def header_table_size(self) -> int:
+        return self.header_table.maxsize
+
+    @header_table_size.setter
+    def header_table_size(self, value: int) -> None:
+        value = min(value, self.max_header_table_size)
+        if value == self.header_table.maxsize:
+            # Setting the same size again would drop a pending size update.
+            return
+        Encoder.header_table_size.fset(self, value)  # type: ignore[attr-defined]
+
+    def encode(  # type: ignore[override]
+        self, headers: Iterable[Tuple[Any, ...]], huffman: bool = True
+    ) -> bytes:
+        key = tuple(headers)
+        if self.header_table.resized:
+            # The block starts with a table size update, which must be sent once.
+            self.cache.clear()
+            self.field_cache.clear()
+            return super().encode(key, huffman)
+
+        block = self.cache.get(key)
+        if block is not None:
+            return block
+
+        generation = self.header_table.generation
+        fields = []
+        for header in key:
+            field = self.field_cache.get(header)
+            if field is None:
+                field = self._encode_field(header, huffman)
+                if self.header_table.generation == generation:
+                    self._store(self.field_cache, header, field)
+                else:
+                    self.field_cache.clear()
+            fields.append(field)
+        block = b"".join(fields)
+
+        if self.header_table.generation != generation:
+            self.cache.clear()
+            self.field_cache.clear()
+        else:
+            self._store(self.cache, key, block)
+        return block
+
+    def _encode_field(self, header: Tuple[Any, ...], huffman: bool) -> bytes:
+        if isinstance(header, HeaderTuple):
+            sensitive = not header.indexable
+        else:
+            sensitive = len(header) > 2 and bool(header[2])
+        return self.add((header[0], header[1]), sensitive, huffman)
+
+    def _store(
+        self, cache: Dict[Tuple[Any, ...], bytes], key: Any, value: bytes
+    ) -> None:
+        if self.cache_size <= 0:
+            return
+        if len(cache) >= self.cache_size:
+            del cache[next(iter(cache))]
+        cache[key] = value
+
+    def add(
+        self, to_add: Tuple[bytes, bytes], sensitive: bool, huffman: bool = False
+    ) -> bytes:
+        name, value = to_add
+        if sensitive or name not in self.unindexed_headers:
+            return super().add(to_add, sensitive, huffman)
+
+        match = self.header_table.search(name, value)
+        if match is None:
+            return self._encode_literal(name, value, INDEX_NONE, huffman)
+        index, _, perfect = match
+        if perfect is not None:
+            return self._encode_indexed(index)
+        return self._encode_indexed_literal(index, value, INDEX_NONE, huffman)
@@ -0,0 +1,73 @@
+import time
+from typing import Optional
+
+# Opaque data of the PING frames used to measure the round-trip time.
+BDP_PING_DATA = b"bdp-ping"
+
+# Smoothing factor for the round-trip time, after the first samples.
+RTT_ALPHA = 0.9
+# Fraction of the current window the sample must fill for the window to grow.
+WINDOW_FILL_RATIO = 0.66
+# How much bigger than the sample the new window is.
+WINDOW_GROWTH = 2
+
+
+class BDPEstimator:
+    """
+    Estimates the bandwidth-delay product of a connection, the same way gRPC does.
+
+    A PING is sent along with the first DATA frame of a sample, and every
+    flow-controlled byte received until its ACK arrives is accounted for. When the
+    sample fills most of the current window while the bandwidth is at its peak, the
+    window is not large enough to keep the connection busy, so it grows.
+    """
+
+    def __init__(self, window_size: int, max_window_size: int) -> None:
+        self.window_size = window_size
+        self.max_window_size = max_window_size
+
+        self.sample = 0
+        self.sample_count = 0
+        self.sent_at: Optional[float] = None
+        self.rtt = 0.0
+        self.max_bandwidth = 0.0
+
+    def add(self, size: int) -> bool:
+        """
+        Account for received bytes, and return whether a PING should be sent.
+        """
+        if self.window_size >= self.max_window_size:
+            return False
+        if self.sent_at is None:
+            self.sent_at = time.monotonic()
+            self.sample = size
+            self.sample_count += 1
+            return True
+        self.sample += size
+        return False
+
+    def calculate(self) -> Optional[int]:
+        """
+        Called when the PING is acknowledged. Return the new window size, if the
+        window should grow.
+        """
+        if self.sent_at is None:
+            return None
+
+        rtt = time.monotonic() - self.sent_at
+        self.sent_at = None
+        if self.sample_count < 10:
+            self.rtt += (rtt - self.rtt) / self.sample_count
+        else:
+            self.rtt += (rtt - self.rtt) * RTT_ALPHA
+
+        bandwidth = self.sample / (max(self.rtt, 1e-6) * 1.5)
+        if bandwidth < self.max_bandwidth:
+            return None
+        self.max_bandwidth = bandwidth
+
+        if self.sample < WINDOW_FILL_RATIO * self.window_size:
+            return None
+
+        self.window_size = min(int(WINDOW_GROWTH * self.sample), self.max_window_size)
+        return self.window_size
@@ -0,0 +1,921 @@
+import asyncio
+import logging
+import urllib.parse
+from asyncio.events import TimerHandle
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+import h2.settings
+from h2.errors import ErrorCodes
+from h2.settings import SettingCodes
+from hyperframe.frame import ExtensionFrame, GoAwayFrame
+from uvicorn.config import Config
+from uvicorn.logging import TRACE_LOG_LEVEL
+from uvicorn.protocols.http.flow_control import FlowControl, service_unavailable
+from uvicorn.protocols.utils import (
+    get_client_addr,
+    get_local_addr,
+    get_path_with_query_string,
+    get_remote_addr,
+    is_ssl,
+)
+from uvicorn.server import ServerState
+from uvicorn_http2.encoder import UNINDEXED_HEADERS, HeaderEncoder
+from uvicorn_http2.flow_control import BDP_PING_DATA, BDPEstimator
+from uvicorn_http2.scheduler import WriteScheduler, parse_priority
+from uvicorn_target import DEFAULT_TARGET_DECODER, TargetDecoder
+
+if TYPE_CHECKING:
+    from asgi_types import (
+        ASGIApp,
+        ASGIReceiveEvent,
+        ASGISendEvent,
+        HTTPDisconnectEvent,
+        HTTPRequestEvent,
+        HTTPResponseBodyEvent,
+        HTTPResponseStartEvent,
+        HTTPResponseTrailersEvent,
+        HTTPScope,
+        HTTPServerPushEvent,
+    )
+
+# Connection-specific header fields are not allowed on HTTP/2 messages.
+# See: https://www.rfc-editor.org/rfc/rfc9113#section-8.2.2
+CONNECTION_SPECIFIC_HEADERS = frozenset(
+    [
+        b"connection",
+        b"keep-alive",
+        b"proxy-connection",
+        b"transfer-encoding",
+        b"upgrade",
+    ]
+)
+
+SWITCHING_PROTOCOLS = (
+    b"HTTP/1.1 101 Switching Protocols\r\n"
+    b"connection: Upgrade\r\n"
+    b"upgrade: h2c\r\n\r\n"
+)
+
+# Initial flow-control window size, for both streams and the connection.
+# See: https://www.rfc-editor.org/rfc/rfc9113#section-6.9.2
+DEFAULT_WINDOW_SIZE = 65_535
+
+# Frame type of the PRIORITY_UPDATE frame, unknown to h2.
+# See: https://www.rfc-editor.org/rfc/rfc9218#section-7.1
+PRIORITY_UPDATE_FRAME = 0x10
+
+STATUS_HEADER = {
+    status_code: (b":status", str(status_code).encode("ascii"))
+    for status_code in range(100, 600)
+}
+
+
+class H2Protocol(asyncio.Protocol):
+    # Flow control settings, which can be tuned by subclassing the protocol.
+    # The request body buffered per connection is bounded by
+    # `max_concurrent_streams * max_window_size`.
+    initial_window_size = 65_535
+    connection_window_size = 1_048_576
+    max_window_size: Optional[int] = 16_777_216
+    max_concurrent_streams = 100
+
+    # Server push budget, also bounded by the client's SETTINGS_MAX_CONCURRENT_STREAMS.
+    max_concurrent_pushes = 100
+
+    # DATA gathered from the streams, in priority order, for each transport write.
+    write_size = 65_536
+
+    # HPACK settings, for the response headers.
+    # The server's default headers are always indexed.
+    header_table_size = 4_096
+    header_cache_size = 128
+    unindexed_headers = UNINDEXED_HEADERS
+
+    # The request targets are decoded once each, in a cache shared with the other
+    # protocols.
+    target_decoder: TargetDecoder = DEFAULT_TARGET_DECODER
+
+    def __init__(
+        self,
+        config: Config,
+        server_state: ServerState,
+        _loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> None:
+        if not config.loaded:
+            config.load()
+
+        self.config = config
+        self.app = config.loaded_app
+        self.loop = _loop or asyncio.get_event_loop()
+        self.logger = logging.getLogger("uvicorn.error")
+        self.access_logger = logging.getLogger("uvicorn.access")
+        self.access_log = self.access_logger.hasHandlers()
+        self.conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False, header_encoding=None)
+        )
+        self.conn.local_settings = h2.settings.Settings(
+            client=False,
+            initial_values={
+                SettingCodes.INITIAL_WINDOW_SIZE: self.initial_window_size,
+                SettingCodes.MAX_CONCURRENT_STREAMS: self.max_concurrent_streams,
+            },
+        )
+        default_header_names = {name for name, _ in server_state.default_headers}
+        self.conn.encoder = HeaderEncoder(
+            max_header_table_size=self.header_table_size,
+            unindexed_headers=self.unindexed_headers - default_header_names,
+            cache_size=self.header_cache_size,
+        )
+        self.bdp: Optional[BDPEstimator] = None
+        if self.max_window_size is not None:
+            self.bdp = BDPEstimator(self.initial_window_size, self.max_window_size)
+        self.root_path = config.root_path
+        self.limit_concurrency = config.limit_concurrency
+
+        if config.ssl is not None:
+            config.ssl.set_alpn_protocols(["h2"])
+
+        # Timeouts
+        self.timeout_keep_alive_task: Optional[TimerHandle] = None
+        self.timeout_keep_alive = config.timeout_keep_alive
+
+        # Global state
+        self.server_state = server_state
+        # Uvicorn only types them as its own protocols.
+        self.connections: Set[Any] = server_state.connections
+        self.tasks = server_state.tasks
+
+        # Per-connection state
+        self.transport: asyncio.Transport = None  # type: ignore[assignment]
+        self.flow: FlowControl = None  # type: ignore[assignment]
+        self.server: Optional[Tuple[str, int]] = None
+        self.client: Optional[Tuple[str, int]] = None
+        self.scheme: Optional[str] = None
+        self.closing = False
+        self.upgrade_settings: Optional[bytes] = None
+
+        # Per-stream state
+        self.streams: Dict[int, RequestResponseCycle] = {}
+        self.scheduler = WriteScheduler()
+        self.write_scheduled = False
+
+    # Protocol interface
+    def connection_made(  # type: ignore[override]
+        self, transport: asyncio.Transport
+    ) -> None:
+        self.connections.add(self)
+
+        self.transport = transport
+        self.flow = FlowControl(transport)
+        self.server = get_local_addr(transport)
+        self.client = get_remote_addr(transport)
+        self.scheme = "https" if is_ssl(transport) else "http"
+
+        if self.logger.level <= TRACE_LOG_LEVEL:  # pragma: to be covered
+            prefix = "%s:%d - " % self.client if self.client else ""
+            self.logger.log(TRACE_LOG_LEVEL, "%sHTTP/2 connection made", prefix)
+
+        if self.upgrade_settings is None:
+            self.conn.initiate_connection()
+        else:
+            self.conn.initiate_upgrade_connection(self.upgrade_settings)
+        if self.connection_window_size > DEFAULT_WINDOW_SIZE:
+            increment = self.connection_window_size - DEFAULT_WINDOW_SIZE
+            self.conn.increment_flow_control_window(increment)
+        self._flush()
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.connections.discard(self)
+
+        if self.logger.level <= TRACE_LOG_LEVEL:  # pragma: to be covered
+            prefix = "%s:%d - " % self.client if self.client else ""
+            self.logger.log(TRACE_LOG_LEVEL, "%sHTTP/2 connection lost", prefix)
+
+        for cycle in self.streams.values():
+            if not cycle.response_complete:
+                cycle.disconnected = True
+            cycle.message_event.set()
+            cycle.data_sent.set()
+        if self.flow is not None:
+            self.flow.resume_writing()
+        if exc is None:
+            self.transport.close()
+            self._unset_keepalive_if_required()
+
+    def _unset_keepalive_if_required(self) -> None:
+        if self.timeout_keep_alive_task is not None:
+            self.timeout_keep_alive_task.cancel()
+            self.timeout_keep_alive_task = None
+
+    def _flush(self) -> None:
+        data = self.conn.data_to_send()
+        if data and not self.transport.is_closing():
+            self.transport.write(data)
+
+    def data_received(self, data: bytes) -> None:
+        self._unset_keepalive_if_required()
+
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError:
+            msg = "Invalid HTTP/2 request received."
+            self.logger.warning(msg)
+            self._flush()
+            self.transport.close()
+            return
+
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                self._on_request_received(event)
+            elif isinstance(event, h2.events.DataReceived):
+                self._on_data_received(event)
+            elif isinstance(event, h2.events.StreamEnded):
+                self._on_stream_ended(event)
+            elif isinstance(event, h2.events.StreamReset):
+                self._on_stream_reset(event)
+            elif isinstance(event, h2.events.WindowUpdated):
+                self._on_window_updated(event)
+            elif isinstance(event, h2.events.RemoteSettingsChanged):
+                self._on_remote_settings_changed(event)
+            elif isinstance(event, h2.events.PingAckReceived):
+                self._on_ping_ack_received(event)
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self._on_connection_terminated(event)
+            elif isinstance(event, h2.events.PriorityUpdated):
+                self._on_priority_updated(event)
+            elif isinstance(event, h2.events.UnknownFrameReceived):
+                self._on_unknown_frame_received(event)
+
+        self._flush()
+
+    def eof_received(self) -> None:
+        pass
+
+    @staticmethod
+    def get_upgrade_settings(headers: List[Tuple[bytes, bytes]]) -> Optional[bytes]:
+        """
+        Return the `HTTP2-Settings` of an HTTP/1.1 request asking to upgrade to
+        h2c, or `None` if the request can't be upgraded.
+        See: https://www.rfc-editor.org/rfc/rfc7540#section-3.2
+        """
+        connection: List[bytes] = []
+        settings: List[bytes] = []
+        for name, value in headers:
+            if name == b"connection":
+                connection.extend(token.strip().lower() for token in value.split(b","))
+            elif name == b"http2-settings":
+                settings.append(value)
+            elif name == b"content-length" and value.strip() != b"0":
+                # A request body would have to be read as HTTP/1.1 first.
+                return None
+            elif name == b"transfer-encoding":
+                return None
+        if len(settings) != 1 or b"http2-settings" not in connection:
+            return None
+        return settings[0]
+
+    def handle_upgrade(
+        self,
+        transport: asyncio.Transport,
+        method: bytes,
+        target: bytes,
+        headers: List[Tuple[bytes, bytes]],
+        settings: bytes,
+        data: bytes = b"",
+    ) -> None:
+        """
+        Take over a connection upgraded from HTTP/1.1 with `Upgrade: h2c`.
+
+        The request that carried the upgrade is answered on stream 1, and `data` is
+        whatever the client sent after it, usually the connection preface.
+        """
+        transport.write(SWITCHING_PROTOCOLS)
+        self.upgrade_settings = settings
+        self.connection_made(transport)
+
+        excluded = CONNECTION_SPECIFIC_HEADERS | {b"http2-settings"}
+        request_headers = [(b":method", method), (b":path", target)]
+        request_headers.extend(
+            (name, value) for name, value in headers if name not in excluded
+        )
+        self._handle_request(1, request_headers)
+        cycle = self.streams.get(1)
+        if cycle is not None:
+            # The request can't have a body, see `get_upgrade_settings`.
+            cycle.more_body = False
+            cycle.message_event.set()
+
+        if data:
+            self.data_received(data)
+
+    def _on_request_received(self, event: h2.events.RequestReceived) -> None:
+        self._handle_request(
+            cast(int, event.stream_id), cast(List[Tuple[bytes, bytes]], event.headers)
+        )
+        if event.priority_updated is not None:
+            self._on_priority_updated(event.priority_updated)
+
+    def _handle_request(
+        self, stream_id: int, headers: List[Tuple[bytes, bytes]]
+    ) -> None:
+        if self.closing:
+            self.conn.reset_stream(stream_id, ErrorCodes.REFUSED_STREAM)
+            return
+
+        method = target = authority = b""
+        urgency: Optional[int] = None
+        incremental: Optional[bool] = None
+        request_headers = headers
+        headers = []
+        for name, value in request_headers:
+            if name == b":method":
+                method = value
+            elif name == b":path":
+                target = value
+            elif name == b":authority":
+                authority = value
+            elif not name.startswith(b":"):
+                if name == b"priority":
+                    urgency, incremental = parse_priority(value)
+                headers.append((name, value))
+
+        # ASGI applications rely on the `host` header to build URLs.
+        if authority and not any(name == b"host" for name, _ in headers):
+            headers.insert(0, (b"host", authority))
+
+        try:
+            path, raw_path, query_string = self.target_decoder(target)
+            method_name = method.decode("ascii")
+        except UnicodeDecodeError:
+            # The request targets and methods are ASCII, or percent-encoded.
+            self.conn.reset_stream(stream_id, ErrorCodes.PROTOCOL_ERROR)
+            return
+
+        extensions: Dict[str, Dict[object, object]] = {"http.response.trailers": {}}
+        if self._push_enabled(stream_id):
+            extensions["http.response.push"] = {}
+
+        scope: "HTTPScope" = {
+            "type": "http",
+            "asgi": {"version": self.config.asgi_version, "spec_version": "2.3"},
+            "http_version": "2",
+            "server": self.server,
+            "client": self.client,
+            "scheme": str(self.scheme),
+            "root_path": self.root_path,
+            "headers": headers,
+            "method": method_name,
+            "path": path,
+            "raw_path": raw_path,
+            "query_string": query_string,
+            "extensions": extensions,
+        }
+
+        # Handle 503 responses when 'limit_concurrency' is exceeded.
+        if self.limit_concurrency is not None and (
+            len(self.connections) >= self.limit_concurrency
+            or len(self.tasks) >= self.limit_concurrency
+        ):
+            app = service_unavailable
+            message = "Exceeded concurrency limit."
+            self.logger.warning(message)
+        else:
+            app = self.app
+
+        cycle = RequestResponseCycle(
+            stream_id=stream_id,
+            scope=scope,
+            conn=self.conn,
+            transport=self.transport,
+            flow=self.flow,
+            logger=self.logger,
+            access_logger=self.access_logger,
+            access_log=self.access_log,
+            default_headers=self.server_state.default_headers,
+            message_event=asyncio.Event(),
+            expect_trailers=(b"te", b"trailers") in headers,
+            on_response=self._on_response_complete,
+            on_push=self._on_push,
+            on_data=self._on_data_pending,
+        )
+        self.streams[stream_id] = cycle
+        self.scheduler.add(stream_id, urgency, incremental)
+
+        task = self.loop.create_task(cycle.run_asgi(app))
+        task.add_done_callback(self.tasks.discard)
+        self.tasks.add(task)
+
+    def _push_enabled(self, stream_id: int) -> bool:
+        # Pushed streams have even identifiers, and can't push in turn.
+        return bool(
+            stream_id % 2
+            and self.max_concurrent_pushes > 0
+            and self.conn.remote_settings.enable_push
+        )
+
+    def _on_push(self, stream_id: int, message: "HTTPServerPushEvent") -> None:
+        if self.closing or not self._push_enabled(stream_id):
+            return
+
+        budget = min(
+            self.max_concurrent_pushes,
+            self.conn.remote_settings.max_concurrent_streams,
+        )
+        pushed = sum(1 for pushed_id in self.streams if pushed_id % 2 == 0)
+        if pushed >= budget:
+            return
+
+        scope = self.streams[stream_id].scope
+        authority = b""
+        for name, value in scope["headers"]:
+            if name == b"host":
+                authority = value
+                break
+
+        headers = [
+            (b":method", b"GET"),
+            (b":path", urllib.parse.quote(message["path"], safe="/?=&").encode()),
+            (b":scheme", str(self.scheme).encode("ascii")),
+            (b":authority", authority),
+        ]
+        for name, value in message.get("headers", []):
+            name = name.lower()
+            if name not in CONNECTION_SPECIFIC_HEADERS and name != b"host":
+                headers.append((name, value))
+
+        promised_stream_id = self.conn.get_next_available_stream_id()
+        self.conn.push_stream(stream_id, promised_stream_id, headers)
+        self._handle_request(promised_stream_id, headers)
+        cycle = self.streams.get(promised_stream_id)
+        if cycle is not None:
+            # A pushed request has no body.
+            cycle.more_body = False
+            cycle.message_event.set()
+
+    def _on_data_received(self, event: h2.events.DataReceived) -> None:
+        stream_id = cast(int, event.stream_id)
+        flow_controlled_length = cast(int, event.flow_controlled_length)
+
+        if self.bdp is not None and self.bdp.add(flow_controlled_length):
+            self.conn.ping(BDP_PING_DATA)
+
+        cycle = self.streams.get(stream_id)
+        if cycle is None or cycle.response_complete:
+            # Nobody is going to read it, so the window is handed back right away.
+            self.conn.acknowledge_received_data(flow_controlled_length, stream_id)
+            return
+
+        # The window is only handed back once the application reads the body.
+        cycle.body += cast(bytes, event.data)
+        cycle.unacknowledged += flow_controlled_length
+        cycle.message_event.set()
+
+    def _on_stream_ended(self, event: h2.events.StreamEnded) -> None:
+        cycle = self.streams.get(cast(int, event.stream_id))
+        if cycle is not None:
+            cycle.more_body = False
+            cycle.message_event.set()
+
+    def _on_stream_reset(self, event: h2.events.StreamReset) -> None:
+        stream_id = cast(int, event.stream_id)
+        cycle = self.streams.pop(stream_id, None)
+        if cycle is not None:
+            if cycle.unacknowledged:
+                self.conn.acknowledge_received_data(cycle.unacknowledged, stream_id)
+            cycle.disconnected = True
+            cycle.message_event.set()
+            cycle.data_sent.set()
+        self.scheduler.remove(stream_id)
+        if self.closing and not self.streams:
+            self.transport.close()
+
+    def _on_window_updated(self, event: h2.events.WindowUpdated) -> None:
+        if event.stream_id:
+            cycle = self.streams.get(event.stream_id)
+            if cycle is not None and cycle.has_pending_data():
+                self._on_data_pending(event.stream_id)
+        else:
+            self._resume_blocked_streams()
+
+    def _on_remote_settings_changed(
+        self, event: h2.events.RemoteSettingsChanged
+    ) -> None:
+        # A new SETTINGS_INITIAL_WINDOW_SIZE may open up every stream window.
+        self._resume_blocked_streams()
+
+    def _on_priority_updated(self, event: h2.events.PriorityUpdated) -> None:
+        self.scheduler.update(cast(int, event.stream_id), weight=event.weight)
+
+    def _on_unknown_frame_received(self, event: h2.events.UnknownFrameReceived) -> None:
+        # The frames of unknown types are parsed as `ExtensionFrame`, with a body.
+        frame = cast(ExtensionFrame, event.frame)
+        if frame.type != PRIORITY_UPDATE_FRAME or len(frame.body) < 4:
+            return
+        stream_id = int.from_bytes(frame.body[:4], "big") & 0x7FFFFFFF
+        urgency, incremental = parse_priority(frame.body[4:])
+        self.scheduler.update(stream_id, urgency, incremental)
+
+    def _resume_blocked_streams(self) -> None:
+        for stream_id, cycle in self.streams.items():
+            if cycle.has_pending_data():
+                self.scheduler.push(stream_id)
+        self._schedule_write()
+
+    def _on_data_pending(self, stream_id: int) -> None:
+        self.scheduler.push(stream_id)
+        self._schedule_write()
+
+    def _schedule_write(self) -> None:
+        if not self.write_scheduled and self.scheduler:
+            # Deferred, so the data of every stream sending in this loop iteration
+            # can share the same write.
+            self.write_scheduled = True
+            self.loop.call_soon(self._write_data)
+
+    def _write_data(self) -> None:
+        self.write_scheduled = False
+        if self.transport.is_closing() or self.flow.write_paused:
+            # Resumed by `resume_writing`.
+            return
+
+        budget = self.write_size
+        frame_size = self.conn.max_outbound_frame_size
+        while budget > 0 and self.scheduler:
+            stream_id = cast(int, self.scheduler.pop())
+            cycle = self.streams.get(stream_id)
+            if cycle is None:
+                continue
+            quantum = self.scheduler.quantum(stream_id, frame_size, self.write_size)
+            budget -= cycle.send_pending_data(min(quantum, budget))
+            if cycle.has_pending_data() and cycle.window > 0:
+                # Streams waiting on their window are pushed back on WINDOW_UPDATE.
+                self.scheduler.push(stream_id)
+
+        self._flush()
+        self._schedule_write()
+
+    def _on_ping_ack_received(self, event: h2.events.PingAckReceived) -> None:
+        if self.bdp is None or event.ping_data != BDP_PING_DATA:
+            return
+        window_size = self.bdp.calculate()
+        if window_size is not None:
+            self.conn.update_settings({SettingCodes.INITIAL_WINDOW_SIZE: window_size})
+            if window_size > self.connection_window_size:
+                increment = window_size - self.connection_window_size
+                self.conn.increment_flow_control_window(increment)
+                self.connection_window_size = window_size
+
+    def _on_connection_terminated(self, event: h2.events.ConnectionTerminated) -> None:
+        self._flush()
+        self.transport.close()
+
+    def _on_response_complete(self, stream_id: int) -> None:
+        self.server_state.total_requests += 1
+        self.scheduler.remove(stream_id)
+        cycle = self.streams.pop(stream_id, None)
+        if cycle is not None and cycle.unacknowledged:
+            # Hand back the window of any request body the application didn't read.
+            self.conn.acknowledge_received_data(cycle.unacknowledged, stream_id)
+            self._flush()
+
+        if self.transport.is_closing() or self.streams:
+            return
+
+        if self.closing:
+            self.transport.close()
+            return
+
+        # Set a short Keep-Alive timeout once the connection is idle.
+        self._unset_keepalive_if_required()
+
+        self.timeout_keep_alive_task = self.loop.call_later(
+            self.timeout_keep_alive, self.timeout_keep_alive_handler
+        )
+
+    def shutdown(self) -> None:
+        """
+        Called by the server to commence a graceful shutdown.
+        """
+        if self.transport.is_closing():
+            return  # pragma: to be covered
+        self.closing = True
+        if not self.streams:
+            self.conn.close_connection()
+            self._flush()
+            self.transport.close()
+            return
+
+        # `H2Connection.close_connection` would forbid any further frames, so the
+        # GOAWAY is written by hand to let the active streams complete.
+        goaway = GoAwayFrame(stream_id=0)
+        goaway.last_stream_id = self.conn.highest_inbound_stream_id
+        self.transport.write(self.conn.data_to_send() + goaway.serialize())
+
+    def pause_writing(self) -> None:
+        """
+        Called by the transport when the write buffer exceeds the high water mark.
+        """
+        self.flow.pause_writing()  # pragma: to be covered
+
+    def resume_writing(self) -> None:
+        """
+        Called by the transport when the write buffer drops below the low water mark.
+        """
+        self.flow.resume_writing()  # pragma: to be covered
+        self._schedule_write()  # pragma: to be covered
+
+    def timeout_keep_alive_handler(self) -> None:
+        """
+        Called on an idle connection if no new data is received after a short delay.
+        """
+        if not self.transport.is_closing():
+            self.conn.close_connection()
+            self._flush()
+            self.transport.close()
+
+
+class RequestResponseCycle:
+    def __init__(
+        self,
+        stream_id: int,
+        scope: "HTTPScope",
+        conn: h2.connection.H2Connection,
+        transport: asyncio.Transport,
+        flow: FlowControl,
+        logger: logging.Logger,
+        access_logger: logging.Logger,
+        access_log: bool,
+        default_headers: List[Tuple[bytes, bytes]],
+        message_event: asyncio.Event,
+        expect_trailers: bool,
+        on_response: Callable[..., None],
+        on_push: Callable[..., None],
+        on_data: Callable[..., None],
+    ):
+        self.stream_id = stream_id
+        self.scope = scope
+        self.conn = conn
+        self.transport = transport
+        self.flow = flow
+        self.logger = logger
+        self.access_logger = access_logger
+        self.access_log = access_log
+        self.default_headers = default_headers
+        self.message_event = message_event
+        self.expect_trailers = expect_trailers
+        self.on_response = on_response
+        self.on_push = on_push
+        self.on_data = on_data
+
+        # Connection state
+        self.disconnected = False
+
+        # Request state
+        self.body = b""
+        self.more_body = True
+        self.unacknowledged = 0
+
+        # Response state
+        self.response_started = False
+        self.response_complete = False
+        self.send_trailers = False
+        self.trailers: List[Tuple[bytes, bytes]] = []
+        self.pending = memoryview(b"")
+        self.end_stream = False
+        self.data_sent = asyncio.Event()
+
+    # ASGI exception wrapper
+    async def run_asgi(self, app: "ASGIApp") -> None:
+        try:
+            result = await app(  # type: ignore[func-returns-value]
+                self.scope, self.receive, self.send
+            )
+        except BaseException as exc:
+            msg = "Exception in ASGI application\n"
+            self.logger.error(msg, exc_info=exc)
+            if not self.response_started:
+                await self.send_500_response()
+            else:
+                self.reset_stream()
+        else:
+            if result is not None:
+                msg = "ASGI callable should return None, but returned '%s'."
+                self.logger.error(msg, result)
+                self.reset_stream()
+            elif not self.response_started and not self.disconnected:
+                msg = "ASGI callable returned without starting response."
+                self.logger.error(msg)
+                await self.send_500_response()
+            elif not self.response_complete and not self.disconnected:
+                msg = "ASGI callable returned without completing response."
+                self.logger.error(msg)
+                self.reset_stream()
+            elif self.send_trailers and not self.disconnected:
+                msg = "ASGI callable returned without completing trailers."
+                self.logger.error(msg)
+                self.reset_stream()
+        finally:
+            self.on_response = lambda *args: None
+
+    async def send_500_response(self) -> None:
+        response_start_event: "HTTPResponseStartEvent" = {
+            "type": "http.response.start",
+            "status": 500,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+        }
+        await self.send(response_start_event)
+        response_body_event: "HTTPResponseBodyEvent" = {
+            "type": "http.response.body",
+            "body": b"Internal Server Error",
+            "more_body": False,
+        }
+        await self.send(response_body_event)
+
+    def reset_stream(self) -> None:
+        """
+        Abort only this stream, leaving the other streams on the connection intact.
+        """
+        if self.disconnected or self.transport.is_closing():
+            return
+        self.disconnected = True
+        self.conn.reset_stream(self.stream_id, ErrorCodes.INTERNAL_ERROR)
+        self.transport.write(self.conn.data_to_send())
+        self.on_response(self.stream_id)
+
+    # ASGI interface
+    async def send(self, message: "ASGISendEvent") -> None:
+        message_type = message["type"]
+
+        if self.flow.write_paused and not self.disconnected:
+            await self.flow.drain()  # pragma: to be covered
+
+        if self.disconnected:
+            return
+
+        if message_type == "http.response.push" and not self.response_complete:
+            self.on_push(self.stream_id, cast("HTTPServerPushEvent", message))
+            self.transport.write(self.conn.data_to_send())
+
+        elif not self.response_started:
+            # Sending response status and headers
+            if message_type != "http.response.start":
+                msg = "Expected ASGI message 'http.response.start', but got '%s'."
+                raise RuntimeError(msg % message_type)
+            message = cast("HTTPResponseStartEvent", message)
+
+            self.response_started = True
+            self.send_trailers = (
+                message.get("trailers", False) and self.scope["method"] != "HEAD"
+            )
+
+            status_code = message["status"]
+            headers = [STATUS_HEADER[status_code]]
+            for name, value in self.default_headers + list(message.get("headers", [])):
+                name = name.lower()
+                if name not in CONNECTION_SPECIFIC_HEADERS:
+                    headers.append((name, value))
+
+            if self.access_log:
+                self.access_logger.info(
+                    '%s - "%s %s HTTP/%s" %d',
+                    get_client_addr(self.scope),
+                    self.scope["method"],
+                    get_path_with_query_string(self.scope),
+                    self.scope["http_version"],
+                    status_code,
+                )
+
+            self.conn.send_headers(self.stream_id, headers)
+            self.transport.write(self.conn.data_to_send())
+
+        elif not self.response_complete:
+            # Sending response body
+            if message_type != "http.response.body":
+                msg = "Expected ASGI message 'http.response.body', but got '%s'."
+                raise RuntimeError(msg % message_type)
+
+            body = cast(bytes, message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+            if self.scope["method"] == "HEAD":
+                body = b""
+
+            # With trailers, the final HEADERS frame ends the stream instead.
+            await self.send_data(
+                body, end_stream=not more_body and not self.send_trailers
+            )
+
+            # Handle response completion
+            if not more_body and not self.disconnected:
+                self.response_complete = True
+                self.message_event.set()
+                if not self.send_trailers:
+                    self.on_response(self.stream_id)
+
+        elif self.send_trailers:
+            if message_type != "http.response.trailers":
+                msg = "Expected ASGI message 'http.response.trailers', but got '%s'."
+                raise RuntimeError(msg % message_type)
+            message = cast("HTTPResponseTrailersEvent", message)
+
+            for name, value in message.get("headers", []):
+                name = name.lower()
+                if name not in CONNECTION_SPECIFIC_HEADERS:
+                    self.trailers.append((name, value))
+
+            if not message.get("more_trailers", False):
+                # HTTP/2 allows a single trailer section, so they are sent together.
+                # Trailers are only sent if the client sent `te: trailers`.
+                if self.expect_trailers and self.trailers:
+                    self.conn.send_headers(
+                        self.stream_id, self.trailers, end_stream=True
+                    )
+                else:
+                    self.conn.end_stream(self.stream_id)
+                self.transport.write(self.conn.data_to_send())
+                self.send_trailers = False
+                self.on_response(self.stream_id)
+
+        else:
+            # Response already sent
+            msg = "Unexpected ASGI message '%s' sent, after response already completed."
+            raise RuntimeError(msg % message_type)
+
+    async def send_data(self, data: bytes, end_stream: bool) -> None:
+        """
+        Queue the data for the write scheduler, and wait until it's all sent.
+        """
+        if not data and not end_stream:
+            return
+        self.pending = memoryview(data)
+        self.end_stream = end_stream
+        self.data_sent.clear()
+        self.on_data(self.stream_id)
+        await self.data_sent.wait()
+
+    @property
+    def window(self) -> int:
+        return self.conn.local_flow_control_window(self.stream_id)
+
+    def has_pending_data(self) -> bool:
+        return bool(self.pending) or self.end_stream
+
+    def send_pending_data(self, limit: int) -> int:
+        """
+        Called by the write scheduler on the stream's turn. Queue up to `limit` bytes
+        of DATA frames, and return how many bytes were queued.
+        """
+        size = min(limit, self.window, len(self.pending))
+        data, self.pending = self.pending[:size], self.pending[size:]
+        end_stream = self.end_stream and not self.pending
+
+        frame_size = self.conn.max_outbound_frame_size
+        for offset in range(0, size, frame_size):
+            chunk = bytes(data[offset : offset + frame_size])
+            # Flag the last DATA frame instead of sending an empty one.
+            last = end_stream and offset + frame_size >= size
+            self.conn.send_data(self.stream_id, chunk, end_stream=last)
+        if end_stream and not size:
+            self.conn.end_stream(self.stream_id)
+
+        if not self.pending:
+            self.end_stream = False
+            self.data_sent.set()
+        return size
+
+    async def receive(self) -> "ASGIReceiveEvent":
+        if not self.disconnected and not self.response_complete:
+            await self.message_event.wait()
+            self.message_event.clear()
+
+        message: "Union[HTTPDisconnectEvent, HTTPRequestEvent]"
+        if self.disconnected or self.response_complete:
+            message = {"type": "http.disconnect"}
+        else:
+            message = {
+                "type": "http.request",
+                "body": self.body,
+                "more_body": self.more_body,
+            }
+            self.body = b""
+            if self.unacknowledged:
+                self.conn.acknowledge_received_data(self.unacknowledged, self.stream_id)
+                self.unacknowledged = 0
+                self.transport.write(self.conn.data_to_send())
+
+        return message
@@ -0,0 +1,133 @@
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Extensible Priorities for HTTP.
+# See: https://www.rfc-editor.org/rfc/rfc9218#section-4
+DEFAULT_URGENCY = 3
+DEFAULT_INCREMENTAL = False
+URGENCY_LEVELS = 8
+
+# Stream weight, when the client uses the deprecated RFC 7540 priorities.
+# See: https://www.rfc-editor.org/rfc/rfc7540#section-5.3.2
+DEFAULT_WEIGHT = 16
+
+
+def parse_priority(value: bytes) -> Tuple[Optional[int], Optional[bool]]:
+    """
+    Parse the urgency and incremental parameters of a `priority` header field, or
+    of a PRIORITY_UPDATE frame. Invalid or unknown members are ignored.
+    """
+    urgency: Optional[int] = None
+    incremental: Optional[bool] = None
+    for member in value.split(b","):
+        key, _, item = member.strip().partition(b"=")
+        key = key.split(b";", 1)[0]
+        item = item.split(b";", 1)[0]
+        if key == b"u" and item.isdigit() and int(item) < URGENCY_LEVELS:
+            urgency = int(item)
+        elif key == b"i" and item in (b"", b"?1"):
+            incremental = True
+        elif key == b"i" and item == b"?0":
+            incremental = False
+    return urgency, incremental
+
+
+class StreamPriority:
+    __slots__ = ("urgency", "incremental", "weight")
+
+    def __init__(
+        self,
+        urgency: int = DEFAULT_URGENCY,
+        incremental: bool = DEFAULT_INCREMENTAL,
+        weight: int = DEFAULT_WEIGHT,
+    ) -> None:
+        self.urgency = urgency
+        self.incremental = incremental
+        self.weight = weight
+
+
+class WriteScheduler:
+    """
+    Decides which stream sends DATA next.
+
+    Streams are served by urgency, and round-robin within the same urgency, each
+    turn being worth a number of bytes proportional to the stream weight. An
+    incremental stream gets one frame per turn, so its data is interleaved with
+    the other streams, while a non-incremental stream gets a whole write, as its
+    response is of no use to the client until it's complete.
+    """
+
+    def __init__(self) -> None:
+        self.priorities: Dict[int, StreamPriority] = {}
+        self.queues: List[Deque[int]] = [deque() for _ in range(URGENCY_LEVELS)]
+        self.ready: Dict[int, int] = {}
+
+    def add(
+        self,
+        stream_id: int,
+        urgency: Optional[int] = None,
+        incremental: Optional[bool] = None,
+    ) -> None:
+        self.priorities[stream_id] = StreamPriority()
+        self.update(stream_id, urgency, incremental)
+
+    def update(
+        self,
+        stream_id: int,
+        urgency: Optional[int] = None,
+        incremental: Optional[bool] = None,
+        weight: Optional[int] = None,
+    ) -> None:
+        priority = self.priorities.get(stream_id)
+        if priority is None:
+            return
+        if incremental is not None:
+            priority.incremental = incremental
+        if weight is not None:
+            priority.weight = weight
+        if urgency is not None and urgency != priority.urgency:
+            queued = self.ready.get(stream_id)
+            if queued is not None:
+                self.queues[queued].remove(stream_id)
+                self.queues[urgency].append(stream_id)
+                self.ready[stream_id] = urgency
+            priority.urgency = urgency
+
+    def remove(self, stream_id: int) -> None:
+        self.priorities.pop(stream_id, None)
+        queued = self.ready.pop(stream_id, None)
+        if queued is not None:
+            self.queues[queued].remove(stream_id)
+
+    def push(self, stream_id: int) -> None:
+        """
+        Mark the stream as having data it can send.
+        """
+        priority = self.priorities.get(stream_id)
+        if priority is None or stream_id in self.ready:
+            return
+        self.queues[priority.urgency].append(stream_id)
+        self.ready[stream_id] = priority.urgency
+
+    def pop(self) -> Optional[int]:
+        """
+        Return the next stream to send DATA, which must be pushed again if it still
+        has data to send after its turn.
+        """
+        for queue in self.queues:
+            if queue:
+                stream_id = queue.popleft()
+                del self.ready[stream_id]
+                return stream_id
+        return None
+
+    def __bool__(self) -> bool:
+        return bool(self.ready)
+
+    def quantum(self, stream_id: int, frame_size: int, write_size: int) -> int:
+        """
+        How many bytes the stream can send on its turn.
+        """
+        priority = self.priorities[stream_id]
+        size = write_size if not priority.incremental else frame_size
+        return max(size * priority.weight // DEFAULT_WEIGHT, 1)
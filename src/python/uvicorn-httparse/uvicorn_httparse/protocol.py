@@ -3,10 +3,21 @@ import http
 import logging
 import re
 import sys
-import urllib
 from asyncio.events import TimerHandle
 from collections import deque
-from typing import TYPE_CHECKING, Callable, Deque, List, Optional, Tuple, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
 
 import httparse
 from uvicorn.config import Config
@@ -25,6 +36,13 @@ from uvicorn.protocols.utils import (
     is_ssl,
 )
 from uvicorn.server import ServerState
+from uvicorn_target import DEFAULT_TARGET_DECODER, TargetDecoder
+
+try:
+    import uvicorn_http2
+    from uvicorn_http2 import CONNECTION_PREFACE
+except ImportError:  # pragma: no cover
+    uvicorn_http2 = None  # type: ignore[assignment]
 
 if sys.version_info < (3, 8):  # pragma: no cover
     from typing_extensions import Literal
@@ -42,6 +60,7 @@ if TYPE_CHECKING:
         HTTPResponseStartEvent,
         HTTPScope,
     )
+    from uvicorn_http2 import H2Protocol
 
 HEADER_RE = re.compile(b'[\x00-\x1F\x7F()<>@,;:[]={} \t\\"]')
 HEADER_VALUE_RE = re.compile(b"[\x00-\x1F\x7F]")
@@ -55,12 +74,26 @@ def _get_status_line(status_code: int) -> bytes:
     return b"".join([b"HTTP/1.1 ", str(status_code).encode(), b" ", phrase, b"\r\n"])
 
 
-STATUS_LINE = {
-    status_code: _get_status_line(status_code) for status_code in range(100, 600)
-}
+class _StatusLines(Dict[int, bytes]):
+    # Built on first use of each status code, rather than on import.
+    def __missing__(self, status_code: int) -> bytes:
+        status_line = self[status_code] = _get_status_line(status_code)
+        return status_line
+
+
+STATUS_LINE = _StatusLines()
 
 
 class HttparseProtocol(asyncio.Protocol):
+    # HTTP/2 connections are handed over to `h2_protocol_class`, or else to
+    # `uvicorn_http2.H2Protocol`, that's imported, with `h2`, once a client speaks
+    # HTTP/2. Without `http2`, they're answered over HTTP/1.1.
+    h2_protocol_class: Optional[Type["H2Protocol"]] = None
+    http2 = uvicorn_http2 is not None
+    # The request targets are decoded once each, in a cache shared with the other
+    # protocols.
+    target_decoder: TargetDecoder = DEFAULT_TARGET_DECODER
+
     def __init__(
         self,
         config: Config,
@@ -97,6 +130,7 @@ class HttparseProtocol(asyncio.Protocol):
         self.client: Optional[Tuple[str, int]] = None
         self.scheme: Optional[Literal["http", "https"]] = None
         self.pipeline: Deque[Tuple[RequestResponseCycle, "ASGIApp"]] = deque()
+        self.scope_template: Dict[str, Any] = {}
 
         # Per-request state
         self._buffer = b""
@@ -117,6 +151,15 @@ class HttparseProtocol(asyncio.Protocol):
         self.server = get_local_addr(transport)
         self.client = get_remote_addr(transport)
         self.scheme = "https" if is_ssl(transport) else "http"
+        # The scope of each request starts as a copy of this one.
+        self.scope_template = {
+            "type": "http",
+            "asgi": {"version": self.config.asgi_version, "spec_version": "2.3"},
+            "server": self.server,
+            "client": self.client,
+            "scheme": self.scheme,
+            "root_path": self.root_path,
+        }
 
         if self.logger.level <= TRACE_LOG_LEVEL:  # pragma: to be covered
             prefix = "%s:%d - " % self.client if self.client else ""
@@ -168,12 +211,31 @@ class HttparseProtocol(asyncio.Protocol):
             return False
         return True
 
+    def _get_http2_settings(self) -> Optional[bytes]:
+        if self.scheme != "http" or self._get_upgrade() != b"h2c":
+            return None
+        protocol_class = self._get_h2_protocol_class()
+        if protocol_class is None:
+            return None
+        return protocol_class.get_upgrade_settings(self.headers)
+
+    def _get_h2_protocol_class(self) -> Optional[Type["H2Protocol"]]:
+        if not self.http2:
+            return None
+        return self.h2_protocol_class or uvicorn_http2.H2Protocol
+
     def data_received(self, data: bytes) -> None:
         self._unset_keepalive_if_required()
 
         self._buffer += data
 
-        if self._parsed is None:
+        if (
+            self.scope is None
+            and self.http2
+            and self._buffer.startswith(CONNECTION_PREFACE)
+        ):
+            self._handle_http2_prior_knowledge()
+        elif self._parsed is None:
             self._attempt_to_parse_request()
         else:
             self._consume_body()
@@ -222,33 +284,26 @@ class HttparseProtocol(asyncio.Protocol):
             1: "1.1",
         }.get(parsed.version, str(parsed.version))
         method = parsed.method
-        raw_path = parsed.path
-
-        path, _, query = raw_path.partition("?")
-
-        if "%" in path:
-            path = urllib.parse.unquote(path)
-
-        self.scope = {
-            "type": "http",
-            "asgi": {"version": self.config.asgi_version, "spec_version": "2.3"},
-            "http_version": http_version,
-            "server": self.server,
-            "client": self.client,
-            "scheme": str(self.scheme),
-            "root_path": self.root_path,
-            "headers": self.headers,
-            "method": method,
-            "path": path,
-            "raw_path": raw_path.encode("ascii"),
-            "query_string": query.encode("ascii"),
-            "extensions": {},
-        }
+        path, raw_path, query_string = self.target_decoder(parsed.path.encode("ascii"))
+
+        scope = self.scope_template.copy()
+        scope["asgi"] = scope["asgi"].copy()
+        scope["http_version"] = http_version
+        scope["headers"] = self.headers
+        scope["method"] = method
+        scope["path"] = path
+        scope["raw_path"] = raw_path
+        scope["query_string"] = query_string
+        scope["extensions"] = {}
+        self.scope = cast("HTTPScope", scope)
 
         upgrade = self._get_upgrade()
         if upgrade == b"websocket" and self._should_upgrade_to_ws():
             self._handle_websocket_upgrade()
             return
+        if upgrade == b"h2c" and self._get_http2_settings() is not None:
+            self._handle_http2_upgrade(self._buffer[parsed.body_start_offset :])
+            return
 
         # Handle 503 responses when 'limit_concurrency' is exceeded.
         if self.limit_concurrency is not None and (
@@ -311,6 +366,41 @@ class HttparseProtocol(asyncio.Protocol):
         protocol.data_received(b"".join(output))
         self.transport.set_protocol(protocol)
 
+    def _create_http2_protocol(self) -> "H2Protocol":
+        protocol_class = self._get_h2_protocol_class()
+        assert protocol_class is not None
+        if self.logger.level <= TRACE_LOG_LEVEL:  # pragma: to be covered
+            prefix = "%s:%d - " % self.client if self.client else ""
+            self.logger.log(TRACE_LOG_LEVEL, "%sUpgrading to HTTP/2", prefix)
+
+        self.connections.discard(self)
+        protocol = protocol_class(
+            config=self.config, server_state=self.server_state, _loop=self.loop
+        )
+        self.transport.set_protocol(protocol)
+        return protocol
+
+    def _handle_http2_prior_knowledge(self) -> None:
+        data, self._buffer = self._buffer, b""
+        protocol = self._create_http2_protocol()
+        protocol.connection_made(self.transport)
+        protocol.data_received(data)
+
+    def _handle_http2_upgrade(self, data: bytes) -> None:
+        assert self._parsed is not None
+        settings = self._get_http2_settings()
+        assert settings is not None
+        self._buffer = b""
+        protocol = self._create_http2_protocol()
+        protocol.handle_upgrade(
+            self.transport,
+            self.scope["method"].encode("ascii"),
+            self._parsed.path.encode("ascii"),
+            self.headers,
+            settings,
+            data,
+        )
+
     def send_400_response(self, msg: str) -> None:
 
         content = [STATUS_LINE[400]]
@@ -0,0 +1,13 @@
+from uvicorn_manager.manager import Manager, run
+from uvicorn_manager.memory import MemoryUsage, memory_usage
+from uvicorn_manager.metrics import MetricsMiddleware, SharedMetrics, WorkerMetrics
+
+__all__ = [
+    "Manager",
+    "MemoryUsage",
+    "MetricsMiddleware",
+    "SharedMetrics",
+    "WorkerMetrics",
+    "memory_usage",
+    "run",
+]
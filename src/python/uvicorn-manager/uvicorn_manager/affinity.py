@@ -0,0 +1,64 @@
+import os
+import socket
+from pathlib import Path
+from typing import List, Set
+
+NODE_ROOT = "/sys/devices/system/node"
+
+# `socket.SO_INCOMING_CPU` is only defined from Python 3.11.
+SO_INCOMING_CPU = getattr(socket, "SO_INCOMING_CPU", 49)
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """
+    Parse a list of CPUs in the format of the kernel, e.g. `0-3,8,10-11`.
+    """
+    cpus: List[int] = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def numa_nodes(root: str = NODE_ROOT) -> List[List[int]]:
+    """
+    The CPUs this process may run on, grouped by NUMA node.
+
+    Without NUMA information, e.g. off Linux, all the CPUs are in a single node.
+    """
+    available: Set[int] = os.sched_getaffinity(0)
+    nodes = []
+    paths = sorted(Path(root).glob("node[0-9]*"), key=lambda path: int(path.name[4:]))
+    for path in paths:
+        try:
+            cpus = parse_cpu_list((path / "cpulist").read_text())
+        except OSError:  # pragma: no cover
+            continue
+        cpus = [cpu for cpu in cpus if cpu in available]
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [sorted(available)]
+
+
+def worker_cpus(index: int, nodes: List[List[int]], per_core: bool) -> List[int]:
+    """
+    The CPUs of the worker `index`, spreading the workers across the NUMA nodes:
+    worker 0 goes to the first node, worker 1 to the second one, and so on.
+
+    With `per_core`, the worker gets a single CPU of its node, otherwise all of
+    them.
+    """
+    node = nodes[index % len(nodes)]
+    if not per_core:
+        return node
+    return [node[index // len(nodes) % len(node)]]
+
+
+def set_incoming_cpu(sock: socket.socket, cpu: int) -> None:
+    """
+    Prefer the socket, among the ones sharing its port with `SO_REUSEPORT`, for
+    the connections whose packets are received on `cpu`.
+    """
+    sock.setsockopt(socket.SOL_SOCKET, SO_INCOMING_CPU, cpu)
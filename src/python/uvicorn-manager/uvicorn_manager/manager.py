@@ -0,0 +1,809 @@
+import contextlib
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+from types import FrameType
+from typing import Any, Dict, List, Optional
+
+import click
+from uvicorn.config import Config
+from uvicorn_manager.affinity import numa_nodes, worker_cpus
+from uvicorn_manager.memory import MemoryUsage, memory_usage
+from uvicorn_manager.metrics import (
+    BUSY,
+    LAG,
+    PID,
+    REQUESTS,
+    SharedMetrics,
+    WorkerMetrics,
+)
+from uvicorn_manager.worker import Worker, bind_reuse_port_socket, run_worker, send_fd
+
+HANDLED_SIGNALS = (
+    signal.SIGINT,  # Unix signal 2. Sent by Ctrl+C.
+    signal.SIGTERM,  # Unix signal 15. Sent by `kill <pid>`.
+    signal.SIGHUP,  # Unix signal 1. Reload the workers.
+    signal.SIGTTIN,  # Unix signal 21. Increment the number of workers.
+    signal.SIGTTOU,  # Unix signal 22. Decrement the number of workers.
+    signal.SIGUSR1,  # Unix signal 10. Log the memory usage of the workers.
+    signal.SIGCHLD,  # Unix signal 17. A worker exited.
+)
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def exit_code(status: int) -> int:
+    """
+    The exit code of a process from its `os.waitpid` status, negative if it was
+    killed by a signal, as `os.waitstatus_to_exitcode` does from Python 3.9.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class Manager:
+    """
+    Pre-fork process manager: forks the workers, and keeps them running.
+
+    The workers either share a socket bound by the manager, or, with `reuse_port`,
+    each bind their own with `SO_REUSEPORT`, so the kernel balances the incoming
+    connections between them.
+
+    Reloads are rolling: `reload_batch` new workers are started at a time, and the
+    workers they replace are only stopped once the new ones accept connections.
+
+    With `preload`, the application is loaded once by the manager, and shared by
+    the workers through copy-on-write.
+
+    The workers publish their metrics in shared memory, and the manager serves
+    them aggregated on `metrics_uds` or `metrics_port`, if given.
+
+    With `pass_connections`, the manager accepts the connections itself, and
+    passes each of them to the worker with the fewest open connections.
+
+    Workers are recycled, one at a time, once they served `max_requests` requests,
+    plus up to `max_requests_jitter`, use more than `max_rss` bytes of memory, or
+    ran for more than `max_lifetime` seconds.
+
+    With `cpu_affinity`, each worker is pinned to a CPU (`"core"`) or to the CPUs
+    of a NUMA node (`"node"`), the workers being spread across the NUMA nodes.
+
+    With `min_workers` or `max_workers`, the number of workers follows the load of
+    their event loops, between those bounds.
+    """
+
+    # Workers that crash are restarted after `backoff` seconds, doubled on every
+    # consecutive crash, up to `max_backoff`.
+    backoff = 0.5
+    max_backoff = 30.0
+    # Workers still running `kill_timeout` seconds after `graceful_timeout` are
+    # killed.
+    kill_timeout = 5.0
+    # Workers beyond `metrics_slots`, e.g. while reloading, don't report metrics.
+    metrics_slots = 256
+    # Connections accepted at most on each wake up, with `pass_connections`.
+    accept_batch = 64
+    # Seconds between two checks of the workers against the recycling limits.
+    recycle_interval = 1.0
+    # The load of the workers is sampled every `autoscale_interval` seconds. A
+    # worker is added once they were busier than `scale_up_busy`, or lagged more
+    # than `scale_up_lag` seconds, for `scale_up_samples` samples in a row. One is
+    # retired once they were less busy than `scale_down_busy`, for
+    # `scale_down_samples` samples in a row.
+    autoscale_interval = 1.0
+    scale_up_busy = 0.75
+    scale_up_lag = 0.05
+    scale_up_samples = 3
+    scale_down_busy = 0.25
+    scale_down_samples = 60
+
+    def __init__(
+        self,
+        config: Config,
+        workers: Optional[int] = None,
+        reuse_port: bool = False,
+        graceful_timeout: float = 30.0,
+        reload_batch: int = 1,
+        preload: bool = False,
+        metrics_uds: Optional[str] = None,
+        metrics_port: Optional[int] = None,
+        pass_connections: bool = False,
+        max_requests: Optional[int] = None,
+        max_requests_jitter: int = 0,
+        max_rss: Optional[int] = None,
+        max_lifetime: Optional[float] = None,
+        cpu_affinity: Optional[str] = None,
+        min_workers: Optional[int] = None,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        if reuse_port and (config.uds or config.fd):
+            raise ValueError("'reuse_port' requires a TCP host and port.")
+        if reuse_port and pass_connections:
+            raise ValueError("'reuse_port' and 'pass_connections' are exclusive.")
+        if cpu_affinity not in (None, "core", "node"):
+            raise ValueError("'cpu_affinity' must be 'core' or 'node'.")
+
+        self.config = config
+        self.num_workers = workers or config.workers
+        self.autoscaling = min_workers is not None or max_workers is not None
+        self.min_workers = max(min_workers or 1, 1)
+        self.max_workers = max(max_workers or self.num_workers, self.min_workers)
+        if self.autoscaling:
+            self.num_workers = min(
+                max(self.num_workers, self.min_workers), self.max_workers
+            )
+        self.reuse_port = reuse_port
+        self.graceful_timeout = graceful_timeout
+        self.reload_batch = max(reload_batch, 1)
+        self.preload = preload
+        self.metrics_uds = metrics_uds
+        self.metrics_port = metrics_port
+        self.pass_connections = pass_connections
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_rss = max_rss
+        self.max_lifetime = max_lifetime
+        self.cpu_affinity = cpu_affinity
+        self.pid = os.getpid()
+
+        self.sockets: List[socket.socket] = []
+        self.workers: Dict[int, Worker] = {}
+        self.failures: Dict[int, int] = {}
+        self.respawn_at: Dict[int, float] = {}
+        self.metrics = SharedMetrics(self.metrics_slots)
+        self.metrics_sockets: List[socket.socket] = []
+        self.recycled_at = 0.0
+        self.autoscaled_at = 0.0
+        # Consecutive samples above the scale up, or below the scale down,
+        # thresholds.
+        self.overloaded = 0
+        self.underloaded = 0
+        self.numa_nodes: List[List[int]] = []
+
+        self.should_exit = False
+        self.signals: List[int] = []
+        self.wakeup_fds: List[int] = []
+
+    def run(self) -> None:
+        self.startup()
+        self.main_loop()
+        self.shutdown()
+
+    def startup(self) -> None:
+        message = "Started manager process [%d]"
+        color_message = "Started manager process [" + click.style("%d", fg="cyan") + "]"
+        logger.info(message, self.pid, extra={"color_message": color_message})
+
+        if self.reuse_port:
+            message = "Uvicorn running on %s://%s:%d with SO_REUSEPORT"
+            protocol_name = "https" if self.config.is_ssl else "http"
+            logger.info(message, protocol_name, self.config.host, self.config.port)
+        else:
+            self.sockets = [self.config.bind_socket()]
+        if self.pass_connections:
+            for sock in self.sockets:
+                sock.listen(self.config.backlog)
+                sock.setblocking(False)
+
+        if self.cpu_affinity is not None:
+            self.numa_nodes = numa_nodes()
+            message = "Pinning the workers to a %s, across %d NUMA node(s)."
+            logger.info(message, self.cpu_affinity, len(self.numa_nodes))
+
+        if self.preload:
+            self.load_app()
+        self.bind_metrics_sockets()
+
+        self.install_signal_handlers()
+        for index in range(self.num_workers):
+            self.spawn_worker(index)
+
+    def load_app(self) -> None:
+        """
+        Load the application before forking, so the workers share its memory.
+        """
+        # A collection while loading would leave holes in the memory pages, that
+        # the objects allocated later in the workers would fill, copying them.
+        gc.disable()
+        try:
+            self.config.load()
+        finally:
+            gc.enable()
+        # Keep the garbage collector of the workers off the preloaded objects, or
+        # it would write to their pages, and copy them. Only once, so the objects
+        # the manager allocates later are still collected.
+        gc.freeze()
+        logger.info("Loaded the application in the manager process.")
+
+    def bind_metrics_sockets(self) -> None:
+        if self.metrics_uds is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.metrics_uds)
+            sock = socket.socket(socket.AF_UNIX)
+            sock.bind(self.metrics_uds)
+            self.metrics_sockets.append(sock)
+            logger.info("Serving the metrics on unix socket %s", self.metrics_uds)
+        if self.metrics_port is not None:
+            sock = socket.socket()
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("127.0.0.1", self.metrics_port))
+            self.metrics_sockets.append(sock)
+            message = "Serving the metrics on http://127.0.0.1:%d/metrics"
+            logger.info(message, self.metrics_port)
+        for sock in self.metrics_sockets:
+            sock.listen()
+            sock.setblocking(False)
+
+    def serve_metrics(self, sock: socket.socket) -> None:
+        """
+        Answer any request with the metrics, as the client is expected to be local.
+        """
+        try:
+            conn, _ = sock.accept()
+        except BlockingIOError:  # pragma: no cover
+            return
+        with conn:
+            try:
+                conn.settimeout(1.0)
+                conn.recv(65_536)
+                body = self.metrics.render().encode()
+                head = (
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"content-type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    b"content-length: %d\r\n"
+                    b"connection: close\r\n\r\n" % len(body)
+                )
+                conn.sendall(head + body)
+            except OSError:  # pragma: no cover
+                pass
+
+    def install_signal_handlers(self) -> None:
+        # The signal handlers only wake the main loop up, which handles them.
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        self.wakeup_fds = [read_fd, write_fd]
+        signal.set_wakeup_fd(write_fd)
+        for sig in HANDLED_SIGNALS:
+            signal.signal(sig, self.handle_signal)
+
+    def restore_signal_handlers(self) -> None:
+        signal.set_wakeup_fd(-1)
+        for sig in HANDLED_SIGNALS:
+            signal.signal(sig, signal.SIG_DFL)
+        for fd in self.wakeup_fds:
+            os.close(fd)
+        self.wakeup_fds = []
+
+    def handle_signal(self, sig: int, frame: Optional[FrameType]) -> None:
+        self.signals.append(sig)
+
+    def main_loop(self) -> None:
+        while not self.should_exit:
+            self.wait(self.next_timeout())
+            self.reap_workers()
+            self.kill_stale_workers()
+            while self.signals and not self.should_exit:
+                self.on_signal(self.signals.pop(0))
+            if not self.should_exit:
+                self.recycle_workers()
+                self.autoscale()
+                self.manage_workers()
+
+    def wait(self, timeout: float) -> None:
+        """
+        Wait for a signal, for a worker to report it's ready, for a request for
+        the metrics, or for connections to pass to the workers.
+        """
+        read_fd = self.wakeup_fds[0]
+        booting = {
+            worker.ready_fd: worker
+            for worker in self.workers.values()
+            if worker.ready_fd is not None
+        }
+        metrics = {sock.fileno(): sock for sock in self.metrics_sockets}
+        listeners = {}
+        if self.pass_connections and self.connection_targets():
+            listeners = {sock.fileno(): sock for sock in self.sockets}
+        fds = [read_fd, *booting, *metrics, *listeners]
+        try:
+            ready, _, _ = select.select(fds, [], [], timeout)
+        except InterruptedError:  # pragma: no cover
+            return
+        for fd in ready:
+            if fd in booting:
+                self.on_worker_ready(booting[fd])
+                continue
+            if fd in metrics:
+                self.serve_metrics(metrics[fd])
+                continue
+            if fd in listeners:
+                self.pass_connections_to_workers(listeners[fd])
+                continue
+            while True:
+                try:
+                    if not os.read(read_fd, 1024):
+                        break  # pragma: no cover
+                except BlockingIOError:
+                    break
+
+    def on_worker_ready(self, worker: Worker) -> None:
+        assert worker.ready_fd is not None
+        # The pipe is closed without data if the worker died while booting.
+        worker.ready = os.read(worker.ready_fd, 1) != b""
+        os.close(worker.ready_fd)
+        worker.ready_fd = None
+        if worker.ready:
+            logger.info("Worker [%d], with pid %d, is ready", worker.index, worker.pid)
+
+    def connection_targets(self) -> List[Worker]:
+        """
+        The workers connections can be passed to, by increasing load.
+        """
+        workers = [
+            worker for worker in self.active_workers() if worker.channel is not None
+        ]
+        # While reloading, the connections wait for the new workers to be ready.
+        ready = [worker for worker in workers if worker.ready]
+        return sorted(ready or workers, key=lambda worker: worker.load)
+
+    def pass_connections_to_workers(self, sock: socket.socket) -> None:
+        for _ in range(self.accept_batch):
+            try:
+                conn, _ = sock.accept()
+            except (BlockingIOError, ConnectionAbortedError):
+                return
+            with conn:
+                for worker in self.connection_targets():
+                    assert worker.channel is not None
+                    try:
+                        send_fd(worker.channel, conn.fileno())
+                    except OSError:  # pragma: no cover
+                        # Its queue is full, or it's exiting: try the next one.
+                        continue
+                    worker.passed += 1
+                    break
+
+    def next_timeout(self) -> float:
+        if self.signals:
+            return 0.0
+        timeout = 1.0
+        now = time.monotonic()
+        deadlines = list(self.respawn_at.values())
+        for worker in self.workers.values():
+            if worker.stop_deadline is not None:
+                deadlines.append(worker.stop_deadline)
+        for deadline in deadlines:
+            timeout = min(timeout, max(deadline - now, 0.0))
+        return timeout
+
+    def on_signal(self, sig: int) -> None:
+        if sig in (signal.SIGINT, signal.SIGTERM):
+            self.should_exit = True
+        elif sig == signal.SIGHUP:
+            self.reload()
+        elif sig == signal.SIGTTIN:
+            self.num_workers += 1
+            logger.info("Increasing the number of workers to %d.", self.num_workers)
+        elif sig == signal.SIGTTOU:
+            if self.num_workers > 1:
+                self.num_workers -= 1
+                logger.info("Decreasing the number of workers to %d.", self.num_workers)
+        elif sig == signal.SIGUSR1:
+            self.log_memory_usage()
+
+    def memory_usage(self) -> Dict[int, MemoryUsage]:
+        """
+        The memory usage of each worker, by pid.
+        """
+        usage = {}
+        for worker in self.active_workers():
+            try:
+                usage[worker.pid] = memory_usage(worker.pid)
+            except (FileNotFoundError, ProcessLookupError):  # pragma: no cover
+                continue
+        return usage
+
+    def log_memory_usage(self) -> None:
+        message = "Worker [%d], with pid %d, uses %.1f MiB (USS), %.1f MiB (PSS)"
+        usage = self.memory_usage()
+        for worker in self.active_workers():
+            if worker.pid in usage:
+                uss, pss = usage[worker.pid].uss, usage[worker.pid].pss
+                logger.info(
+                    message, worker.index, worker.pid, uss / 2**20, pss / 2**20
+                )
+
+    def reload(self) -> None:
+        """
+        Replace every worker with a new one, `reload_batch` workers at a time.
+        """
+        logger.info("Reloading the workers.")
+        for worker in self.active_workers():
+            worker.outdated = True
+
+    def recycle_workers(self) -> None:
+        """
+        Mark the oldest worker past one of its limits as outdated, so it's replaced
+        the way a reload does.
+        """
+        now = time.monotonic()
+        if now - self.recycled_at < self.recycle_interval:
+            return
+        self.recycled_at = now
+        # A single worker drains at a time, and only when all the others serve.
+        if self.respawn_at or any(
+            worker.stopping or worker.outdated or not worker.ready
+            for worker in self.workers.values()
+        ):
+            return
+        # The oldest first, so a worker recycled often doesn't starve the others.
+        for worker in sorted(self.workers.values(), key=lambda worker: -worker.age):
+            reason = self.recycle_reason(worker)
+            if reason is not None:
+                message = "Recycling worker [%d], with pid %d: %s."
+                logger.info(message, worker.index, worker.pid, reason)
+                worker.outdated = True
+                return
+
+    def recycle_reason(self, worker: Worker) -> Optional[str]:
+        if worker.max_requests is not None and worker.metrics is not None:
+            requests = worker.metrics[REQUESTS]
+            if requests >= worker.max_requests:
+                return f"served {requests} requests"
+        if self.max_lifetime is not None and worker.age >= self.max_lifetime:
+            return f"running for {worker.age:.0f}s"
+        if self.max_rss is not None:
+            try:
+                rss = memory_usage(worker.pid).rss
+            except (FileNotFoundError, ProcessLookupError):  # pragma: no cover
+                return None
+            if rss >= self.max_rss:
+                return f"using {rss / 2**20:.1f} MiB"
+        return None
+
+    def autoscale(self) -> None:
+        """
+        Add or retire a worker, depending on the load of their event loops.
+        """
+        now = time.monotonic()
+        if not self.autoscaling or now - self.autoscaled_at < self.autoscale_interval:
+            return
+        self.autoscaled_at = now
+        # The load is only sampled while the workers serve steadily.
+        active = self.active_workers()
+        slots = [worker.metrics for worker in active if worker.metrics is not None]
+        if (
+            self.respawn_at
+            or len(active) != self.num_workers
+            or len(slots) != len(active)
+            or any(not worker.ready or worker.outdated for worker in active)
+        ):
+            return
+        busy = sum(metrics[BUSY] for metrics in slots) / 1000 / len(slots)
+        lag = max(metrics[LAG] for metrics in slots) / 1_000_000
+
+        if busy > self.scale_up_busy or lag > self.scale_up_lag:
+            self.overloaded += 1
+            self.underloaded = 0
+        elif busy < self.scale_down_busy:
+            self.overloaded = 0
+            self.underloaded += 1
+        else:
+            self.overloaded = self.underloaded = 0
+
+        if self.overloaded >= self.scale_up_samples:
+            if self.num_workers < self.max_workers:
+                self.num_workers += 1
+                message = "Busy %.0f%%, lag %.3fs: increasing the workers to %d."
+                logger.info(message, busy * 100, lag, self.num_workers)
+            self.overloaded = 0
+        elif self.underloaded >= self.scale_down_samples:
+            if self.num_workers > self.min_workers:
+                self.num_workers -= 1
+                message = "Busy %.0f%%, lag %.3fs: decreasing the workers to %d."
+                logger.info(message, busy * 100, lag, self.num_workers)
+            self.underloaded = 0
+
+    def active_workers(self) -> List[Worker]:
+        return [worker for worker in self.workers.values() if not worker.stopping]
+
+    def manage_workers(self) -> None:
+        """
+        Spawn and stop workers until there are `num_workers` up to date workers.
+        """
+        active = self.active_workers()
+        for worker in active:
+            if worker.index >= self.num_workers:
+                self.stop_worker(worker)
+        self.roll_workers()
+
+        # Slots being reloaded are taken care of by `roll_workers`.
+        taken = {worker.index for worker in self.active_workers()}
+        now = time.monotonic()
+        for index in range(self.num_workers):
+            if index in taken:
+                continue
+            if self.respawn_at.get(index, 0.0) > now:
+                continue
+            self.respawn_at.pop(index, None)
+            self.spawn_worker(index)
+
+        for index in list(self.respawn_at):
+            if index >= self.num_workers:
+                del self.respawn_at[index]
+                self.failures.pop(index, None)
+
+    def roll_workers(self) -> None:
+        """
+        Replace the outdated workers, once their replacements are ready.
+        """
+        outdated: Dict[int, List[Worker]] = {}
+        replacements: Dict[int, Worker] = {}
+        for worker in self.active_workers():
+            if worker.outdated:
+                outdated.setdefault(worker.index, []).append(worker)
+            else:
+                replacements[worker.index] = worker
+
+        booting = 0
+        for index, workers in outdated.items():
+            replacement = replacements.get(index)
+            if replacement is None:
+                continue
+            if replacement.ready:
+                for worker in workers:
+                    self.stop_worker(worker)
+            else:
+                booting += 1
+
+        now = time.monotonic()
+        for index in sorted(outdated):
+            if booting >= self.reload_batch:
+                break
+            if index in replacements or self.respawn_at.get(index, 0.0) > now:
+                continue
+            self.respawn_at.pop(index, None)
+            self.spawn_worker(index)
+            booting += 1
+
+    def spawn_worker(self, index: int) -> Worker:
+        metrics = self.metrics.acquire(index)
+        read_fd, write_fd = os.pipe()
+        channel: Optional[socket.socket] = None
+        worker_channel: Optional[socket.socket] = None
+        if self.pass_connections:
+            channel, worker_channel = socket.socketpair(
+                socket.AF_UNIX, socket.SOCK_SEQPACKET
+            )
+        cpus: Optional[List[int]] = None
+        if self.cpu_affinity is not None:
+            per_core = self.cpu_affinity == "core"
+            cpus = worker_cpus(index, self.numa_nodes, per_core=per_core)
+        # The signals received until the worker installs its own handlers are
+        # delivered to it after that, instead of the handlers of the manager.
+        signal.pthread_sigmask(signal.SIG_BLOCK, HANDLED_SIGNALS)
+        try:
+            pid = os.fork()
+            if pid == 0:  # pragma: no cover
+                os.close(read_fd)
+                if channel is not None:
+                    channel.close()
+                self.run_worker(write_fd, metrics, worker_channel, cpus)
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, HANDLED_SIGNALS)
+        os.close(write_fd)
+        if worker_channel is not None:
+            worker_channel.close()
+
+        worker = Worker(index, pid, ready_fd=read_fd)
+        worker.metrics = metrics
+        worker.cpus = cpus
+        if self.max_requests is not None:
+            # Spread the restarts of the workers started together.
+            jitter = random.randint(0, max(self.max_requests_jitter, 0))
+            worker.max_requests = self.max_requests + jitter
+        if channel is not None:
+            channel.setblocking(False)
+            worker.channel = channel
+        if metrics is not None:
+            metrics[PID] = pid
+        self.workers[pid] = worker
+        if cpus is None:
+            logger.info("Booting worker [%d], with pid %d", index, pid)
+        else:
+            cpu_list = ",".join(map(str, cpus))
+            message = "Booting worker [%d], with pid %d, on CPU(s) %s"
+            logger.info(message, index, pid, cpu_list)
+        return worker
+
+    def run_worker(
+        self,
+        ready_fd: int,
+        metrics: Optional[WorkerMetrics],
+        channel: Optional[socket.socket],
+        cpus: Optional[List[int]],
+    ) -> Any:  # pragma: no cover
+        """
+        Entry point of the forked worker process, which never returns.
+        """
+        exit_code = 1
+        try:
+            self.restore_signal_handlers()
+            for sig in (signal.SIGTTIN, signal.SIGTTOU, signal.SIGUSR1):
+                signal.signal(sig, signal.SIG_IGN)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, HANDLED_SIGNALS)
+            for worker in self.workers.values():
+                if worker.ready_fd is not None:
+                    os.close(worker.ready_fd)
+                if worker.channel is not None:
+                    worker.channel.close()
+            for sock in self.metrics_sockets:
+                sock.close()
+            if cpus is not None:
+                os.sched_setaffinity(0, cpus)
+            sockets = self.sockets
+            if self.reuse_port:
+                # Keep the packets of a connection and its worker on the same CPU.
+                incoming_cpu = cpus[0] if cpus is not None and len(cpus) == 1 else None
+                sockets = [bind_reuse_port_socket(self.config, incoming_cpu)]
+            if channel is not None:
+                for sock in self.sockets:
+                    sock.close()
+                sockets = []
+                channel.setblocking(False)
+            exit_code = run_worker(
+                self.config,
+                sockets,
+                ppid=self.pid,
+                ready_fd=ready_fd,
+                drain_timeout=self.graceful_timeout,
+                metrics=metrics,
+                channel=channel,
+            )
+        except BaseException as exc:
+            logger.exception("Exception in worker process", exc_info=exc)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def stop_worker(self, worker: Worker, sig: int = signal.SIGTERM) -> None:
+        """
+        Ask the worker to stop gracefully: it stops accepting connections, and
+        has until its deadline to complete the requests in flight.
+        """
+        if not worker.stopping:
+            worker.stopping = True
+            timeout = self.graceful_timeout + self.kill_timeout
+            worker.stop_deadline = time.monotonic() + timeout
+        try:
+            os.kill(worker.pid, sig)
+        except ProcessLookupError:  # pragma: no cover
+            pass
+
+    def reap_workers(self) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:  # pragma: no cover
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:  # pragma: no cover
+                continue
+            worker.exit_code = exit_code(status)
+            if worker.ready_fd is not None:
+                os.close(worker.ready_fd)
+                worker.ready_fd = None
+            if worker.metrics is not None:
+                self.metrics.release(worker.metrics)
+                worker.metrics = None
+            if worker.channel is not None:
+                worker.channel.close()
+                worker.channel = None
+            self.on_worker_exit(worker)
+
+    def kill_stale_workers(self) -> None:
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.stop_deadline is None or worker.stop_deadline > now:
+                continue
+            message = "Worker [%d], with pid %d, didn't stop in time. Killing it."
+            logger.warning(message, worker.index, worker.pid)
+            worker.stop_deadline = None
+            self.stop_worker(worker, signal.SIGKILL)
+
+    def on_worker_exit(self, worker: Worker) -> None:
+        if worker.stopping or self.should_exit:
+            logger.info("Worker [%d], with pid %d, stopped", worker.index, worker.pid)
+            return
+
+        # A worker that ran for a while before crashing starts over its backoff.
+        failures = self.failures.get(worker.index, 0)
+        if worker.age > self.max_backoff:
+            failures = 0
+        self.failures[worker.index] = failures + 1
+        delay = min(self.backoff * 2**failures, self.max_backoff)
+        self.respawn_at[worker.index] = time.monotonic() + delay
+
+        message = (
+            "Worker [%d], with pid %d, died with exit code %d. Restarting in %.1fs."
+        )
+        logger.warning(message, worker.index, worker.pid, worker.exit_code, delay)
+
+    def shutdown(self) -> None:
+        for worker in list(self.workers.values()):
+            self.stop_worker(worker)
+
+        while self.workers:
+            self.wait(min(self.next_timeout(), 0.1))
+            self.reap_workers()
+            self.kill_stale_workers()
+
+        self.restore_signal_handlers()
+        for sock in self.sockets:
+            sock.close()
+        for sock in self.metrics_sockets:
+            sock.close()
+        if self.metrics_uds is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.metrics_uds)
+
+        message = "Stopping manager process [%d]"
+        color_message = (
+            "Stopping manager process [" + click.style("%d", fg="cyan") + "]"
+        )
+        logger.info(message, self.pid, extra={"color_message": color_message})
+
+
+def run(
+    app: Any,
+    workers: int = 1,
+    reuse_port: bool = False,
+    graceful_timeout: float = 30.0,
+    reload_batch: int = 1,
+    preload: bool = False,
+    metrics_uds: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+    pass_connections: bool = False,
+    max_requests: Optional[int] = None,
+    max_requests_jitter: int = 0,
+    max_rss: Optional[int] = None,
+    max_lifetime: Optional[float] = None,
+    cpu_affinity: Optional[str] = None,
+    min_workers: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    **kwargs: Any,
+) -> None:
+    """
+    Run the application with `workers` processes, the way `uvicorn.run` does.
+    """
+    config = Config(app, workers=workers, **kwargs)
+    manager = Manager(
+        config,
+        workers=workers,
+        reuse_port=reuse_port,
+        graceful_timeout=graceful_timeout,
+        reload_batch=reload_batch,
+        preload=preload,
+        metrics_uds=metrics_uds,
+        metrics_port=metrics_port,
+        pass_connections=pass_connections,
+        max_requests=max_requests,
+        max_requests_jitter=max_requests_jitter,
+        max_rss=max_rss,
+        max_lifetime=max_lifetime,
+        cpu_affinity=cpu_affinity,
+        min_workers=min_workers,
+        max_workers=max_workers,
+    )
+    manager.run()
@@ -0,0 +1,33 @@
+from typing import Dict, NamedTuple
+
+
+class MemoryUsage(NamedTuple):
+    """
+    Memory used by a process, in bytes.
+
+    - `rss`: resident memory, counting the pages shared with other processes.
+    - `pss`: proportional share, each shared page being split between the
+      processes that share it.
+    - `uss`: unique memory, i.e. what would be freed if the process exited.
+    """
+
+    rss: int
+    pss: int
+    uss: int
+
+
+def memory_usage(pid: int) -> MemoryUsage:
+    """
+    Read the memory usage of a process from `/proc/<pid>/smaps_rollup`, on Linux.
+    """
+    fields: Dict[str, int] = {}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            name, _, value = line.partition(":")
+            if value.endswith("kB\n"):
+                fields[name] = int(value.split()[0]) * 1024
+    return MemoryUsage(
+        rss=fields["Rss"],
+        pss=fields["Pss"],
+        uss=fields["Private_Clean"] + fields["Private_Dirty"],
+    )
@@ -0,0 +1,189 @@
+import mmap
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterator, List, Optional
+
+# Upper bounds of the request duration histogram buckets, in seconds. The last
+# bucket, for longer requests, is implicit.
+DURATION_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Fields of a worker slot, each a signed 64-bit integer.
+PID = 0
+WORKER = 1
+REQUESTS = 2
+DURATION = 3  # Sum of the request durations, in microseconds.
+CONNECTIONS = 4
+TASKS = 5
+# Connections received from the manager, as of the last CONNECTIONS update.
+RECEIVED = 6
+# Largest delay of the event loop, in microseconds, and the share of the time it
+# was busy, in thousandths, over the last second.
+LAG = 7
+BUSY = 8
+# TLS handshakes completed, and the ones that resumed a session.
+TLS_HANDSHAKES = 9
+TLS_RESUMED = 10
+BUCKETS = 11
+SLOT_SIZE = BUCKETS + len(DURATION_BUCKETS) + 1
+
+# The fields that only grow, and are kept by the manager once a worker exited.
+COUNTERS = (REQUESTS, DURATION, TLS_HANDSHAKES, TLS_RESUMED, *range(BUCKETS, SLOT_SIZE))
+
+
+class WorkerMetrics:
+    """
+    The metrics slot of a worker.
+
+    Each slot has a single writer, the worker, so it's updated without locks. The
+    manager only reads it, while the worker runs.
+    """
+
+    __slots__ = ("index", "values", "offset")
+
+    def __init__(self, index: int, values: memoryview) -> None:
+        self.index = index
+        self.values = values
+        self.offset = index * SLOT_SIZE
+
+    def __getitem__(self, field: int) -> int:
+        return self.values[self.offset + field]
+
+    def __setitem__(self, field: int, value: int) -> None:
+        self.values[self.offset + field] = value
+
+    def observe(self, duration: float) -> None:
+        """
+        Record a request that took `duration` seconds.
+        """
+        values, offset = self.values, self.offset
+        values[offset + REQUESTS] += 1
+        values[offset + DURATION] += int(duration * 1_000_000)
+        values[offset + BUCKETS + bisect_left(DURATION_BUCKETS, duration)] += 1
+
+    def reset(self) -> None:
+        for field in range(SLOT_SIZE):
+            self[field] = 0
+
+
+class SharedMetrics:
+    """
+    The metrics slots of the workers, in memory shared with the forked workers.
+    """
+
+    def __init__(self, slots: int) -> None:
+        # An anonymous mapping is shared with the forked processes, and released
+        # with the last of them: there's nothing to clean up.
+        self.buffer = mmap.mmap(-1, slots * SLOT_SIZE * 8)
+        self.values = memoryview(self.buffer).cast("q")
+        self.free = [WorkerMetrics(index, self.values) for index in range(slots)]
+        self.free.reverse()
+        self.used: Dict[int, WorkerMetrics] = {}
+        # The counters of the workers that exited.
+        self.totals = [0] * SLOT_SIZE
+
+    def acquire(self, worker: int) -> Optional[WorkerMetrics]:
+        if not self.free:
+            return None
+        metrics = self.free.pop()
+        metrics.reset()
+        metrics[WORKER] = worker
+        self.used[metrics.index] = metrics
+        return metrics
+
+    def release(self, metrics: WorkerMetrics) -> None:
+        for field in COUNTERS:
+            self.totals[field] += metrics[field]
+        metrics.reset()
+        del self.used[metrics.index]
+        self.free.append(metrics)
+
+    def __iter__(self) -> Iterator[WorkerMetrics]:
+        return iter(sorted(self.used.values(), key=lambda metrics: metrics.index))
+
+    def aggregate(self) -> List[int]:
+        """
+        The sum of the fields of all the workers, including the exited ones.
+        """
+        values = list(self.totals)
+        for metrics in self.used.values():
+            for field in range(SLOT_SIZE):
+                values[field] += metrics[field]
+        return values
+
+    def render(self) -> str:
+        """
+        The metrics, in the Prometheus text format.
+        """
+        values = self.aggregate()
+        lines = [
+            "# HELP uvicorn_workers Number of worker processes.",
+            "# TYPE uvicorn_workers gauge",
+            f"uvicorn_workers {len(self.used)}",
+        ]
+        for name, field, kind, help in (
+            ("requests_total", REQUESTS, "counter", "HTTP requests served."),
+            ("connections", CONNECTIONS, "gauge", "Open connections."),
+            ("tasks", TASKS, "gauge", "Background tasks."),
+            ("tls_handshakes_total", TLS_HANDSHAKES, "counter", "TLS handshakes."),
+            ("tls_resumed_total", TLS_RESUMED, "counter", "Resumed TLS sessions."),
+        ):
+            lines.append(f"# HELP uvicorn_{name} {help}")
+            lines.append(f"# TYPE uvicorn_{name} {kind}")
+            lines.append(f"uvicorn_{name} {values[field]}")
+            for metrics in self:
+                labels = f'worker="{metrics[WORKER]}",pid="{metrics[PID]}"'
+                lines.append(f"uvicorn_{name}{{{labels}}} {metrics[field]}")
+
+        for name, field, scale, help in (
+            ("loop_lag_seconds", LAG, 1_000_000, "Event loop lag."),
+            ("busy_ratio", BUSY, 1_000, "Share of the time the event loop is busy."),
+        ):
+            lines.append(f"# HELP uvicorn_{name} {help}")
+            lines.append(f"# TYPE uvicorn_{name} gauge")
+            for metrics in self:
+                labels = f'worker="{metrics[WORKER]}",pid="{metrics[PID]}"'
+                lines.append(f"uvicorn_{name}{{{labels}}} {metrics[field] / scale}")
+
+        name = "uvicorn_request_duration_seconds"
+        lines.append(f"# HELP {name} Duration of the HTTP requests.")
+        lines.append(f"# TYPE {name} histogram")
+        count = 0
+        for index, bound in enumerate([*map(str, DURATION_BUCKETS), "+Inf"]):
+            count += values[BUCKETS + index]
+            lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f"{name}_sum {values[DURATION] / 1_000_000}")
+        lines.append(f"{name}_count {count}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Record the duration of each HTTP request in the metrics slot of the worker.
+    """
+
+    def __init__(self, app: Any, metrics: WorkerMetrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.metrics.observe(time.perf_counter() - start)
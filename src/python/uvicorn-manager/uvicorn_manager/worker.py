@@ -0,0 +1,305 @@
+import array
+import asyncio
+import functools
+import os
+import socket
+import time
+from typing import Any, List, Optional, Set, Tuple
+
+from uvicorn.config import Config
+from uvicorn.main import STARTUP_FAILURE
+from uvicorn.server import Server
+from uvicorn_manager.affinity import set_incoming_cpu
+from uvicorn_manager.metrics import (
+    BUSY,
+    CONNECTIONS,
+    LAG,
+    RECEIVED,
+    TASKS,
+    TLS_HANDSHAKES,
+    TLS_RESUMED,
+    MetricsMiddleware,
+    WorkerMetrics,
+)
+
+# Seconds between two ticks of the Uvicorn main loop.
+TICK = 0.1
+
+
+def send_fd(sock: socket.socket, fd: int) -> None:
+    """
+    Send the file descriptor `fd` over the Unix socket `sock`, with a byte of data,
+    as `socket.send_fds` does from Python 3.9.
+    """
+    fds = array.array("i", [fd])
+    sock.sendmsg([b"\0"], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+
+
+def receive_fds(sock: socket.socket, maxfds: int) -> Tuple[bytes, List[int]]:
+    """
+    Receive a byte of data, and up to `maxfds` file descriptors, from the Unix
+    socket `sock`, as `socket.recv_fds` does from Python 3.9.
+    """
+    fds = array.array("i")
+    message, ancdata, _, _ = sock.recvmsg(1, socket.CMSG_LEN(maxfds * fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[: len(data) - len(data) % fds.itemsize])
+    return message, list(fds)
+
+
+def bind_reuse_port_socket(
+    config: Config, incoming_cpu: Optional[int] = None
+) -> socket.socket:
+    """
+    Bind a socket of its own for a worker, so the kernel balances the connections
+    between the workers listening on the same address.
+
+    With `incoming_cpu`, the kernel prefers this socket for the connections whose
+    packets are received on that CPU.
+    """
+    family = socket.AF_INET6 if config.host and ":" in config.host else socket.AF_INET
+    sock = socket.socket(family=family)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if incoming_cpu is not None:
+        set_incoming_cpu(sock, incoming_cpu)
+    sock.bind((config.host, config.port))
+    return sock
+
+
+class WorkerServer(Server):
+    """
+    The server run by each worker process.
+
+    It tells the manager when it's ready to accept connections, by writing to
+    `ready_fd`. On shutdown, it closes the idle connections, and gives the
+    requests in flight and the WebSockets up to `drain_timeout` seconds to
+    complete on their own.
+
+    The number of connections and tasks, and the load of the event loop, are
+    published in its `metrics` slot.
+
+    With a `channel`, the server doesn't listen, and serves the connections the
+    manager accepts and passes through it instead.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        ppid: int,
+        ready_fd: Optional[int] = None,
+        drain_timeout: float = 30.0,
+        metrics: Optional[WorkerMetrics] = None,
+        channel: Optional[socket.socket] = None,
+    ) -> None:
+        super().__init__(config)
+        self.ppid = ppid
+        self.ready_fd = ready_fd
+        self.drain_timeout = drain_timeout
+        self.metrics = metrics
+        self.channel = channel
+        self.received = 0
+        self.accepting: Set["asyncio.Task[Any]"] = set()
+        # The event loop load, measured between ticks, over the last second.
+        self.last_tick = time.monotonic()
+        self.lag = 0.0
+        self.window_start = (self.last_tick, time.process_time())
+
+    async def startup(self, sockets: Any = None) -> None:
+        await super().startup(sockets=sockets)
+        # Don't count the startup as load.
+        self.last_tick = time.monotonic()
+        self.window_start = (self.last_tick, time.process_time())
+        if self.started and self.channel is not None:
+            loop = asyncio.get_running_loop()
+            loop.add_reader(self.channel.fileno(), self.receive_connections)
+        if self.started and not self.should_exit and self.ready_fd is not None:
+            os.write(self.ready_fd, b"1")
+            os.close(self.ready_fd)
+            self.ready_fd = None
+
+    def receive_connections(self) -> None:
+        assert self.channel is not None
+        while True:
+            try:
+                message, fds = receive_fds(self.channel, 1)
+            except BlockingIOError:
+                return
+            if not message:
+                # The manager is gone.
+                self.close_channel()
+                self.should_exit = True
+                return
+            for fd in fds:
+                self.received += 1
+                task = asyncio.create_task(self.accept(socket.socket(fileno=fd)))
+                self.accepting.add(task)
+                task.add_done_callback(self.accepting.discard)
+
+    async def accept(self, sock: socket.socket) -> None:
+        config = self.config
+        create_protocol = functools.partial(
+            config.http_protocol_class,
+            config=config,  # type: ignore[call-arg]
+            server_state=self.server_state,
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.connect_accepted_socket(create_protocol, sock, ssl=config.ssl)
+        except OSError:  # pragma: no cover
+            sock.close()
+
+    def close_channel(self) -> None:
+        if self.channel is not None:
+            asyncio.get_running_loop().remove_reader(self.channel.fileno())
+            self.channel.close()
+            self.channel = None
+
+    def is_websocket(self, connection: Any) -> bool:
+        ws_protocol_class = self.config.ws_protocol_class
+        return ws_protocol_class is not None and isinstance(
+            connection, ws_protocol_class
+        )
+
+    async def shutdown(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        # Stop accepting new connections.
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        for server in self.servers:
+            await server.wait_closed()
+        if self.channel is not None:
+            # The manager doesn't pass connections to a worker it stops, but the
+            # ones it passed before must be served.
+            self.receive_connections()
+            self.close_channel()
+        if self.accepting:
+            await asyncio.wait(self.accepting)
+
+        # Let the HTTP requests in flight complete, and the WebSockets close on
+        # their own, until the deadline. The Uvicorn shutdown closes the rest.
+        deadline = time.monotonic() + self.drain_timeout
+        closing: Set[Any] = set()
+        while self.server_state.connections and not self.force_exit:
+            # The requests already sent on the connections just accepted are read
+            # first. The idle connections are closed by `shutdown` right away.
+            await asyncio.sleep(0.01)
+            for connection in self.server_state.connections - closing:
+                if self.is_websocket(connection):
+                    continue
+                connection.shutdown()
+                closing.add(connection)
+            if time.monotonic() >= deadline:
+                break
+        await super().shutdown()
+
+    async def on_tick(self, counter: int) -> bool:
+        # Don't outlive the manager, if it's killed without a chance to stop us.
+        if counter % 10 == 0 and os.getppid() != self.ppid:
+            self.should_exit = True
+        if self.metrics is not None:
+            self.metrics[CONNECTIONS] = len(self.server_state.connections)
+            self.metrics[RECEIVED] = self.received
+            self.metrics[TASKS] = len(self.server_state.tasks)
+            self.measure_load(publish=counter % 10 == 0)
+            if counter % 10 == 0 and self.config.ssl is not None:
+                stats = self.config.ssl.session_stats()
+                self.metrics[TLS_HANDSHAKES] = stats["accept_good"]
+                self.metrics[TLS_RESUMED] = stats["hits"]
+        return await super().on_tick(counter)
+
+    def measure_load(self, publish: bool) -> None:
+        """
+        Measure how late the tick is, i.e. the event loop lag, and publish it with
+        the share of the time spent running, as opposed to waiting for events.
+        """
+        assert self.metrics is not None
+        now = time.monotonic()
+        self.lag = max(self.lag, now - self.last_tick - TICK)
+        self.last_tick = now
+        start, cpu_start = self.window_start
+        if not publish or now - start < TICK:
+            return
+        cpu = time.process_time()
+        busy = (cpu - cpu_start) / (now - start)
+        self.metrics[BUSY] = int(min(busy, 1.0) * 1000)
+        self.metrics[LAG] = int(self.lag * 1_000_000)
+        self.lag = 0.0
+        self.window_start = (now, cpu)
+
+
+class Worker:
+    """
+    A worker process, as seen from the manager.
+    """
+
+    def __init__(self, index: int, pid: int, ready_fd: Optional[int] = None) -> None:
+        self.index = index
+        self.pid = pid
+        self.started_at = time.monotonic()
+        # Read end of the pipe the worker writes to once it accepts connections.
+        self.ready_fd = ready_fd
+        self.ready = ready_fd is None
+        # Set on reload, until a new worker took over its place.
+        self.outdated = False
+        # Set once the manager asked the worker to stop, so its exit is expected.
+        self.stopping = False
+        self.stop_deadline: Optional[float] = None
+        self.metrics: Optional[WorkerMetrics] = None
+        # The end of the socket pair connections are passed through, if any.
+        self.channel: Optional[socket.socket] = None
+        self.passed = 0
+        # Number of requests after which the worker is recycled, if any.
+        self.max_requests: Optional[int] = None
+        # The CPUs the worker is pinned to, if any.
+        self.cpus: Optional[List[int]] = None
+        self.exit_code: Optional[int] = None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def load(self) -> int:
+        """
+        The number of open connections of the worker, as far as the manager knows.
+        """
+        if self.metrics is None:
+            return self.passed
+        # Counting the connections passed since the worker last published its own.
+        return self.metrics[CONNECTIONS] + self.passed - self.metrics[RECEIVED]
+
+    def __repr__(self) -> str:
+        return f"<Worker index={self.index} pid={self.pid}>"
+
+
+def run_worker(
+    config: Config,
+    sockets: List[socket.socket],
+    ppid: int,
+    ready_fd: Optional[int] = None,
+    drain_timeout: float = 30.0,
+    metrics: Optional[WorkerMetrics] = None,
+    channel: Optional[socket.socket] = None,
+) -> int:
+    """
+    Run the server on the forked worker process, and return its exit code.
+    """
+    if metrics is not None:
+        if not config.loaded:
+            config.load()
+        config.loaded_app = MetricsMiddleware(config.loaded_app, metrics)
+    server = WorkerServer(
+        config,
+        ppid=ppid,
+        ready_fd=ready_fd,
+        drain_timeout=drain_timeout,
+        metrics=metrics,
+        channel=channel,
+    )
+    server.run(sockets=sockets)
+    if not server.started:
+        return STARTUP_FAILURE
+    return 0
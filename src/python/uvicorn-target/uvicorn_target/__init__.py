@@ -0,0 +1,8 @@
+from uvicorn_target.decoder import (
+    DEFAULT_TARGET_DECODER,
+    Target,
+    TargetDecoder,
+    decode_target,
+)
+
+__all__ = ["DEFAULT_TARGET_DECODER", "Target", "TargetDecoder", "decode_target"]
@@ -0,0 +1,87 @@
+import functools
+import urllib.parse
+from typing import Dict, Tuple, Union
+
+# The `path`, `raw_path` and `query_string` of a scope.
+Target = Tuple[str, bytes, bytes]
+
+# Searched as `int`s, which `bytes` finds faster than `bytes` of one byte.
+QUERY = ord("?")
+FRAGMENT = ord("#")
+
+
+def decode_target(target: Union[bytes, str]) -> Target:
+    """
+    Split a request target into the `path`, `raw_path` and `query_string` of an
+    ASGI scope, dropping the fragment.
+    """
+    if isinstance(target, str):
+        target = target.encode("ascii")
+    if target[:1] == b"/":
+        if FRAGMENT in target:
+            target = target.partition(b"#")[0]
+        raw_path, _, query_string = target.partition(b"?")
+    elif b"://" in target:
+        # The absolute-form, e.g. of the requests to proxies.
+        url = urllib.parse.urlsplit(target)
+        raw_path, query_string = url.path or b"/", url.query
+    else:
+        # The asterisk-form of `OPTIONS *`, or the authority-form of `CONNECT`.
+        raw_path, _, query_string = target.partition(b"?")
+    path = raw_path.decode("ascii")
+    if "%" in path:
+        path = urllib.parse.unquote(path)
+    return path, raw_path, query_string
+
+
+class TargetDecoder:
+    """
+    Decode the request targets with `decode_target`, and keep the last `maxsize`
+    ones in a least recently used cache: most requests are for a few thousand
+    paths, and they're decoded once each.
+
+    The query strings, that change from a request to another, e.g. with the page
+    or the search terms, are left out of the cache: only the path before them is
+    cached, and the query string is split from it for each request.
+
+    The paths longer than `max_length` bytes are decoded without being cached, so
+    the cache holds at most `maxsize * max_length` bytes of paths.
+    """
+
+    def __init__(self, maxsize: int = 4096, max_length: int = 256) -> None:
+        self.maxsize = maxsize
+        self.max_length = max_length
+        self.cached_decode_target = functools.lru_cache(maxsize)(decode_target)
+        self.bypassed = 0
+
+    def __call__(self, target: bytes) -> Target:
+        if QUERY not in target:
+            if len(target) > self.max_length:
+                self.bypassed += 1
+                return decode_target(target)
+            return self.cached_decode_target(target)
+        if FRAGMENT in target:
+            return decode_target(target)
+        raw_path, _, query_string = target.partition(b"?")
+        if len(raw_path) > self.max_length:
+            self.bypassed += 1
+            return decode_target(target)
+        path, raw_path, _ = self.cached_decode_target(raw_path)
+        return path, raw_path, query_string
+
+    def clear(self) -> None:
+        self.cached_decode_target.cache_clear()
+        self.bypassed = 0
+
+    def stats(self) -> Dict[str, int]:
+        info = self.cached_decode_target.cache_info()
+        return {
+            "targets": info.currsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "bypassed": self.bypassed,
+        }
+
+
+# The decoder of the protocols of this repository, unless they're given another.
+DEFAULT_TARGET_DECODER = TargetDecoder()
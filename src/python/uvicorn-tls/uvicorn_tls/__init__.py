@@ -0,0 +1,17 @@
+from uvicorn_tls.buffers import SSLBuffers
+from uvicorn_tls.extension import get_tls_extension
+from uvicorn_tls.httptools_impl import HTTPProtocol
+from uvicorn_tls.ktls import KTLSTransport, enable_ktls
+from uvicorn_tls.resumption import SessionResumption, load_secret
+from uvicorn_tls.sni import SNIContexts
+
+__all__ = [
+    "HTTPProtocol",
+    "KTLSTransport",
+    "SNIContexts",
+    "SSLBuffers",
+    "SessionResumption",
+    "enable_ktls",
+    "get_tls_extension",
+    "load_secret",
+]
@@ -0,0 +1,74 @@
+import asyncio
+import sys
+import weakref
+from asyncio.selector_events import BaseSelectorEventLoop
+from asyncio.sslproto import SSLProtocol
+
+# The versions whose TLS transport is tested with the buffers replaced: it reads
+# in the private `_ssl_buffer` of `SSLProtocol`, that any release may change.
+ADOPTING_VERSIONS = frozenset({(3, 11)})
+
+
+class SSLBuffers:
+    """
+    The buffers of the connections over the TLS transport of asyncio.
+
+    Each connection reads the encrypted data in a buffer of its own, of 256 KiB,
+    that it keeps until it's closed. Its size becomes `read_size`, and with
+    `shared`, the connections of an event loop read in the same buffer: the data
+    is copied out of it as soon as it's read, so only one connection uses it at
+    a time.
+
+    The read buffers are those of the TLS transport of asyncio on CPython 3.11,
+    and they're only replaced once checked to be what it allocates. Elsewhere,
+    the connections keep their own. OpenSSL already frees the buffers of its
+    records while the connections are idle, as the `ssl` module sets
+    `SSL_MODE_RELEASE_BUFFERS` on its contexts.
+    """
+
+    def __init__(self, read_size: int = 64 * 1024, shared: bool = True) -> None:
+        self.read_size = read_size
+        self.shared = shared
+        self.buffers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, bytearray]"
+        self.buffers = weakref.WeakKeyDictionary()
+
+    def get_buffer(self, loop: asyncio.AbstractEventLoop) -> bytearray:
+        if not self.shared:
+            return bytearray(self.read_size)
+        buffer = self.buffers.get(loop)
+        if buffer is None:
+            buffer = self.buffers[loop] = bytearray(self.read_size)
+        return buffer
+
+    def adopt(self, transport: asyncio.BaseTransport) -> bool:
+        """
+        Replace the read buffer of the connection of `transport`, once the
+        handshake is complete. Return whether it was replaced.
+        """
+        if sys.implementation.name != "cpython":  # pragma: no cover
+            return False
+        if sys.version_info[:2] not in ADOPTING_VERSIONS:  # pragma: no cover
+            return False
+        protocol = getattr(transport, "_ssl_protocol", None)
+        if not isinstance(protocol, SSLProtocol):
+            return False
+        loop = getattr(protocol, "_loop", None)
+        # The proactor loops keep the buffer for as long as the read is pending.
+        if not isinstance(loop, BaseSelectorEventLoop):  # pragma: no cover
+            return False
+        max_size = getattr(protocol, "max_size", None)
+        current = getattr(protocol, "_ssl_buffer", None)
+        view = getattr(protocol, "_ssl_buffer_view", None)
+        if not (
+            isinstance(max_size, int)
+            and isinstance(current, bytearray)
+            and isinstance(view, memoryview)
+            and view.obj is current
+            and len(current) == max_size
+        ):
+            return False
+        buffer = self.get_buffer(loop)
+        setattr(protocol, "max_size", self.read_size)
+        setattr(protocol, "_ssl_buffer", buffer)
+        setattr(protocol, "_ssl_buffer_view", memoryview(buffer))
+        return True
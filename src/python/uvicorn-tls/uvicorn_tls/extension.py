@@ -0,0 +1,138 @@
+import functools
+import re
+import ssl
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+# The `tls_version` of the extension is the one of the TLS record layer.
+# See: https://www.rfc-editor.org/rfc/rfc8446#appendix-B.1
+TLS_VERSIONS = {
+    "SSLv3": 0x0300,
+    "TLSv1": 0x0301,
+    "TLSv1.1": 0x0302,
+    "TLSv1.2": 0x0303,
+    "TLSv1.3": 0x0304,
+}
+
+# The short names of the attributes in a distinguished name.
+# See: https://www.rfc-editor.org/rfc/rfc4514#section-3
+ATTRIBUTE_NAMES = {
+    "commonName": "CN",
+    "countryName": "C",
+    "domainComponent": "DC",
+    "localityName": "L",
+    "organizationName": "O",
+    "organizationalUnitName": "OU",
+    "stateOrProvinceName": "ST",
+    "streetAddress": "STREET",
+    "userId": "UID",
+}
+
+PEM_CERTIFICATE_RE = re.compile(
+    "-----BEGIN CERTIFICATE-----.+?-----END CERTIFICATE-----\n?", re.DOTALL
+)
+
+# The IANA identifiers of the cipher suites enabled on each context.
+_cipher_suites: "weakref.WeakKeyDictionary[ssl.SSLContext, Dict[str, int]]"
+_cipher_suites = weakref.WeakKeyDictionary()
+
+
+def escape_attribute_value(value: str) -> str:
+    """
+    Escape a value of a distinguished name, as in RFC 4514, section 2.4.
+    """
+    value = re.sub(r'([\\"+,;<>=])', r"\\\1", value)
+    if value[:1] in ("#", " "):
+        value = "\\" + value
+    if value.endswith(" "):
+        value = value[:-1] + "\\ "
+    return value
+
+
+def distinguished_name(name: Tuple[Tuple[Tuple[str, str], ...], ...]) -> str:
+    """
+    The RFC 4514 string of a name, as returned by `SSLObject.getpeercert()`.
+
+    The relative distinguished names are written in the reverse order, the most
+    specific first.
+    """
+    return ",".join(
+        "+".join(
+            f"{ATTRIBUTE_NAMES.get(key, key)}={escape_attribute_value(value)}"
+            for key, value in rdn
+        )
+        for rdn in reversed(name)
+    )
+
+
+def cipher_suite(context: ssl.SSLContext, name: str) -> Optional[int]:
+    """
+    The IANA identifier of the cipher suite with the OpenSSL `name`.
+    """
+    try:
+        suites = _cipher_suites[context]
+    except KeyError:
+        # OpenSSL prefixes the 2 bytes identifier with the SSL version.
+        suites = {
+            cipher["name"]: cipher["id"] & 0xFFFF for cipher in context.get_ciphers()
+        }
+        _cipher_suites[context] = suites
+    return suites.get(name)
+
+
+@functools.lru_cache(maxsize=16)
+def load_server_cert(certfile: str) -> Optional[str]:
+    """
+    The PEM of the certificate the server sends, the first one of `certfile`.
+    """
+    with open(certfile) as file:
+        match = PEM_CERTIFICATE_RE.search(file.read())
+    return match.group() if match else None
+
+
+def get_client_cert_chain(ssl_object: ssl.SSLObject) -> List[str]:
+    # Only Python 3.13 exposes the certificates that come after the client's one.
+    get_verified_chain = getattr(ssl_object, "get_verified_chain", None)
+    if get_verified_chain is not None:  # pragma: no cover
+        return [ssl.DER_cert_to_PEM_cert(cert) for cert in get_verified_chain()]
+    der = ssl_object.getpeercert(binary_form=True)
+    return [ssl.DER_cert_to_PEM_cert(der)] if der else []
+
+
+def get_tls_extension(
+    ssl_object: ssl.SSLObject, server_cert: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    The `tls` extension of the scopes on a TLS connection, once the handshake is
+    complete.
+
+    See: https://asgi.readthedocs.io/en/latest/specs/tls.html
+    """
+    client_cert = ssl_object.getpeercert()
+    cipher = ssl_object.cipher()
+    version = ssl_object.version()
+    return {
+        "server_cert": server_cert,
+        "client_cert_chain": get_client_cert_chain(ssl_object),
+        "client_cert_name": (
+            distinguished_name(client_cert["subject"])  # type: ignore[arg-type]
+            if client_cert
+            else None
+        ),
+        "client_cert_error": None,
+        "tls_version": TLS_VERSIONS.get(version) if version else None,
+        "cipher_suite": (
+            cipher_suite(ssl_object.context, cipher[0]) if cipher else None
+        ),
+        "server_name": getattr(ssl_object, "server_name", None),
+    }
+
+
+def record_server_name(
+    ssl_object: ssl.SSLObject, server_name: Optional[str], context: ssl.SSLContext
+) -> None:
+    """
+    An `SSLContext.sni_callback` that keeps the server name the client asked for
+    on the connection, as `server_name`.
+    """
+    ssl_object.server_name = server_name  # type: ignore[attr-defined]
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import ssl
+import weakref
+from typing import Any, Dict, Optional
+
+from uvicorn.config import Config
+from uvicorn.protocols.http.flow_control import service_unavailable
+from uvicorn.protocols.http.httptools_impl import (
+    HttpToolsProtocol,
+    RequestResponseCycle as _RequestResponseCycle,
+)
+from uvicorn.protocols.utils import is_ssl
+from uvicorn.server import ServerState
+from uvicorn_target import DEFAULT_TARGET_DECODER, TargetDecoder
+from uvicorn_tls.buffers import SSLBuffers
+from uvicorn_tls.extension import (
+    get_tls_extension,
+    load_server_cert,
+    record_server_name,
+)
+from uvicorn_tls.ktls import KTLSTransport, send_file
+from uvicorn_tls.resumption import SessionResumption
+from uvicorn_tls.sni import SNIContexts
+
+# The configs of the servers whose contexts are configured, in this process.
+CONFIGURED: "weakref.WeakSet[Config]" = weakref.WeakSet()
+
+
+class HTTPProtocol(HttpToolsProtocol):
+    """
+    The Uvicorn `httptools` protocol, with the ASGI TLS and zero-copy send
+    extensions.
+
+    The TLS extension is computed once the handshake is complete, and shared by
+    the requests of the connection.
+
+    Set `session_resumption` to share the session ticket keys between workers,
+    `sni` to select the certificate by the server name, `ssl_buffers` to bound
+    the memory of each connection, and `ktls_context` to terminate TLS on plain
+    connections with a `KTLSTransport`.
+
+    The request targets are decoded by `target_decoder`, in a cache shared with
+    the other protocols.
+    """
+
+    session_resumption: Optional[SessionResumption] = None
+    sni: Optional[SNIContexts] = None
+    ssl_buffers: Optional[SSLBuffers] = None
+    ktls_context: Optional[ssl.SSLContext] = None
+    target_decoder: TargetDecoder = DEFAULT_TARGET_DECODER
+
+    def __init__(
+        self,
+        config: Config,
+        server_state: ServerState,
+        _loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> None:
+        super().__init__(config, server_state, _loop)
+        if config not in CONFIGURED:
+            self.configure_contexts(config, self.loop)
+        self.extensions: Dict[str, Any] = {"http.response.zerocopysend": {}}
+        self.tls: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def configure_contexts(
+        cls, config: Config, loop: asyncio.AbstractEventLoop
+    ) -> None:
+        """
+        Configure the contexts of the server of `config`, once, on its first
+        connection, rather than on each of them.
+        """
+        CONFIGURED.add(config)
+        for context in (config.ssl, cls.ktls_context):
+            if context is None:
+                continue
+            # The server name is only known by the SNI callback, in the handshake.
+            if context.sni_callback is None:
+                context.sni_callback = (
+                    record_server_name if cls.sni is None else cls.sni.sni_callback
+                )
+            resumption = cls.session_resumption
+            if resumption is not None:
+                resumption.configure(context)
+                rotated = resumption.epochs.get(context) is not None
+                if resumption.use_ctypes and rotated:  # pragma: no cover
+                    # Before OpenSSL 3, no callback rotates the ticket key.
+                    resumption.schedule_rotation(context, loop)
+
+    def connection_made(  # type: ignore[override]
+        self, transport: asyncio.Transport
+    ) -> None:
+        if self.ktls_context is not None and not is_ssl(transport):
+            # It's made again, with the TLS transport, once the handshake is over.
+            KTLSTransport(self.loop, transport, self.ktls_context, self)
+            return
+        super().connection_made(transport)
+        if self.ssl_buffers is not None:
+            self.ssl_buffers.adopt(transport)
+        ssl_object: Optional[ssl.SSLObject] = transport.get_extra_info("ssl_object")
+        if ssl_object is not None:
+            # The certificate selected by the SNI callback, if any.
+            server_cert = getattr(ssl_object, "server_cert", None)
+            certfile = self.config.ssl_certfile
+            if server_cert is None and certfile:
+                server_cert = load_server_cert(str(certfile))
+            self.tls = get_tls_extension(ssl_object, server_cert)
+            self.extensions["tls"] = self.tls
+
+    def on_message_begin(self) -> None:
+        super().on_message_begin()
+        self.scope["extensions"] = dict(self.extensions)
+
+    def on_headers_complete(self) -> None:
+        http_version = self.parser.get_http_version()
+        method = self.parser.get_method()
+        self.scope["method"] = method.decode("ascii")
+        if http_version != "1.1":
+            self.scope["http_version"] = http_version
+        if self.parser.should_upgrade() and self._should_upgrade():
+            return
+        path, raw_path, query_string = self.target_decoder(self.url)
+        self.scope["path"] = path
+        self.scope["raw_path"] = raw_path
+        self.scope["query_string"] = query_string
+
+        # Handle 503 responses when 'limit_concurrency' is exceeded.
+        if self.limit_concurrency is not None and (
+            len(self.connections) >= self.limit_concurrency
+            or len(self.tasks) >= self.limit_concurrency
+        ):
+            app = service_unavailable
+            message = "Exceeded concurrency limit."
+            self.logger.warning(message)
+        else:
+            app = self.app
+
+        existing_cycle = self.cycle
+        self.cycle = RequestResponseCycle(
+            scope=self.scope,
+            transport=self.transport,
+            flow=self.flow,
+            logger=self.logger,
+            access_logger=self.access_logger,
+            access_log=self.access_log,
+            default_headers=self.server_state.default_headers,
+            message_event=asyncio.Event(),
+            expect_100_continue=self.expect_100_continue,
+            keep_alive=http_version != "1.0",
+            on_response=self.on_response_complete,
+        )
+        if existing_cycle is None or existing_cycle.response_complete:
+            # Standard case - start processing the request.
+            task = self.loop.create_task(self.cycle.run_asgi(app))
+            task.add_done_callback(self.tasks.discard)
+            self.tasks.add(task)
+        else:
+            # Pipelined HTTP requests need to be queued up.
+            self.flow.pause_reading()
+            self.pipeline.appendleft((self.cycle, app))
+
+
+class RequestResponseCycle(_RequestResponseCycle):
+    async def send(self, message: Any) -> None:
+        if message["type"] != "http.response.zerocopysend":
+            await super().send(message)
+            return
+
+        if self.flow.write_paused and not self.disconnected:
+            await self.flow.drain()
+
+        if self.disconnected:
+            return
+
+        if not self.response_started or self.response_complete:
+            msg = "Unexpected ASGI message 'http.response.zerocopysend' sent."
+            raise RuntimeError(msg)
+
+        file = message["file"]
+        offset = message.get("offset", 0)
+        count = message.get("count")
+        more_body = message.get("more_body", False)
+        if count is None:
+            count = os.fstat(file.fileno()).st_size - offset
+
+        # Write response body
+        if self.scope["method"] == "HEAD":
+            self.expected_content_length = 0
+        elif self.chunked_encoding:
+            if count:
+                self.transport.write(b"%x\r\n" % count)
+                await send_file(self.transport, file, offset, count, self.flow.drain)
+                self.transport.write(b"\r\n")
+            if not more_body:
+                self.transport.write(b"0\r\n\r\n")
+        else:
+            if count > self.expected_content_length:
+                raise RuntimeError("Response content longer than Content-Length")
+            self.expected_content_length -= count
+            await send_file(self.transport, file, offset, count, self.flow.drain)
+
+        # Handle response completion
+        if not more_body:
+            if self.expected_content_length != 0:
+                raise RuntimeError("Response content shorter than Content-Length")
+            self.response_complete = True
+            self.message_event.set()
+            if not self.keep_alive:
+                self.transport.close()
+            self.on_response()
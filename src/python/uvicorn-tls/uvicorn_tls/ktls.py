@@ -0,0 +1,384 @@
+import asyncio
+import os
+import socket
+import ssl
+import sys
+from collections import deque
+from typing import IO, Any, Awaitable, Callable, Deque, List, Optional, Union
+
+# OpenSSL hands the encryption over to the kernel, when it can. The `ssl` module
+# only defines it from Python 3.12, with the value of the OpenSSL it's built with.
+OP_ENABLE_KTLS: Optional[int] = getattr(ssl, "OP_ENABLE_KTLS", None)
+
+# See: https://github.com/torvalds/linux/blob/master/include/uapi/linux/tls.h
+SOL_TLS = 282
+TLS_TX = 1
+TCP_ULP = 31
+
+
+def enable_ktls(context: ssl.SSLContext) -> bool:
+    """
+    Let OpenSSL use kernel TLS on the sockets of `context`, when the kernel, the
+    cipher suite and the OpenSSL build support it.
+
+    Returns whether the option could be set: the `ssl` module doesn't define it
+    before Python 3.12, and its value depends on the OpenSSL version.
+    """
+    if OP_ENABLE_KTLS is None:  # pragma: no cover
+        return False
+    context.options |= OP_ENABLE_KTLS  # pragma: no cover
+    return True  # pragma: no cover
+
+
+def ktls_send_enabled(sock: socket.socket) -> bool:
+    """
+    Whether the kernel encrypts what's sent on `sock`, so that `os.sendfile` sends
+    TLS records.
+    """
+    if sys.platform != "linux":  # pragma: no cover
+        return False
+    try:
+        ulp = sock.getsockopt(socket.IPPROTO_TCP, TCP_ULP, 16)
+        if ulp.rstrip(b"\0") != b"tls":
+            return False
+        # It fails until the transmit keys are set.
+        sock.getsockopt(SOL_TLS, TLS_TX, 64)  # pragma: no cover
+    except OSError:
+        return False
+    return True  # pragma: no cover
+
+
+class KTLSTransport(asyncio.Transport):
+    """
+    A TLS transport over an `ssl.SSLSocket`, that OpenSSL reads and writes itself.
+
+    The TLS transport of asyncio feeds OpenSSL through memory buffers, so OpenSSL
+    never gets to use the socket with kernel TLS. This one takes over the socket
+    of a plain transport, once `connection_made`, and reports to the protocol once
+    the handshake is complete. With kernel TLS on, files are sent with
+    `os.sendfile`, without copying them to user space.
+    """
+
+    max_read = 256 * 1024
+    high_water = 64 * 1024
+    low_water = 16 * 1024
+    handshake_timeout = 60.0
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        transport: asyncio.Transport,
+        context: ssl.SSLContext,
+        protocol: asyncio.Protocol,
+    ) -> None:
+        super().__init__()
+        self.loop = loop
+        self.protocol = protocol
+        raw_sock = transport.get_extra_info("socket")
+        sock = socket.socket(fileno=os.dup(raw_sock.fileno()))
+        sock.setblocking(False)
+        # The plain transport closes its own file descriptor, and no one hears.
+        transport.set_protocol(asyncio.Protocol())
+        transport.close()
+        self.sock = context.wrap_socket(
+            sock, server_side=True, do_handshake_on_connect=False
+        )
+        self.fd = self.sock.fileno()
+        self.peername = transport.get_extra_info("peername")
+        self.sockname = transport.get_extra_info("sockname")
+        self.buffer: Deque[Union[bytes, memoryview]] = deque()
+        self.buffer_size = 0
+        self.drain_waiters: List["asyncio.Future[None]"] = []
+        self.reading = False
+        self.writing_paused = False
+        self.connected = False
+        self.closing = False
+        self.closed = False
+        self.ktls_send = False
+        self.handshake_timer = loop.call_later(
+            self.handshake_timeout, self.force_close, None
+        )
+        self.do_handshake()
+
+    def do_handshake(self) -> None:
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        try:
+            self.sock.do_handshake()
+        except ssl.SSLWantReadError:
+            self.loop.add_reader(self.fd, self.do_handshake)
+            return
+        except ssl.SSLWantWriteError:  # pragma: no cover
+            self.loop.add_writer(self.fd, self.do_handshake)
+            return
+        except (OSError, ValueError) as exc:
+            self.force_close(exc)
+            return
+        self.handshake_timer.cancel()
+        self.ktls_send = ktls_send_enabled(self.sock)
+        self.connected = True
+        self.protocol.connection_made(self)
+        if not self.closing:
+            self.resume_reading()
+
+    # Reading
+
+    def read_ready(self) -> None:
+        while self.reading:
+            try:
+                data = self.sock.recv(self.max_read)
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                return
+            except OSError as exc:
+                self.force_close(exc)
+                return
+            if not data:
+                self.pause_reading()
+                if not self.protocol.eof_received():
+                    self.close()
+                return
+            self.protocol.data_received(data)
+            # OpenSSL may hold decrypted data the selector doesn't know about.
+            if not self.sock.pending():
+                return
+
+    def is_reading(self) -> bool:
+        return self.reading
+
+    def pause_reading(self) -> None:
+        if self.reading:
+            self.reading = False
+            self.loop.remove_reader(self.fd)
+
+    def resume_reading(self) -> None:
+        if not self.reading and not self.closing:
+            self.reading = True
+            self.loop.add_reader(self.fd, self.read_ready)
+
+    # Writing
+
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        if self.closing or not data:
+            return
+        self.buffer.append(bytes(data))
+        self.buffer_size += len(data)
+        if len(self.buffer) == 1:
+            self.flush()
+        if self.buffer_size > self.high_water and not self.writing_paused:
+            self.writing_paused = True
+            self.protocol.pause_writing()
+
+    def flush(self) -> None:
+        while self.buffer:
+            chunk = self.buffer[0]
+            try:
+                # On a retry, OpenSSL expects the same chunk it was given.
+                sent = self.sock.send(chunk)
+            except (ssl.SSLWantWriteError, ssl.SSLWantReadError, BlockingIOError):
+                self.loop.add_writer(self.fd, self.flush)
+                return
+            except OSError as exc:
+                self.force_close(exc)
+                return
+            if sent < len(chunk):  # pragma: no cover
+                self.buffer[0] = memoryview(chunk)[sent:]
+            else:
+                self.buffer.popleft()
+            self.buffer_size -= sent
+        self.loop.remove_writer(self.fd)
+        if self.writing_paused and self.buffer_size <= self.low_water:
+            self.writing_paused = False
+            self.protocol.resume_writing()
+        for waiter in self.drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.drain_waiters.clear()
+        if self.closing:
+            self.shutdown()
+
+    async def drain(self) -> None:
+        if self.buffer and not self.closed:
+            waiter = self.loop.create_future()
+            self.drain_waiters.append(waiter)
+            await waiter
+
+    async def sendfile(
+        self, file: IO[bytes], offset: int = 0, count: Optional[int] = None
+    ) -> int:
+        """
+        Send `count` bytes of `file` from `offset`, with `os.sendfile` if the kernel
+        encrypts them, or through OpenSSL otherwise.
+        """
+        await self.drain()
+        if count is None:
+            count = os.fstat(file.fileno()).st_size - offset
+        if not self.ktls_send:
+            return await self.sendfile_fallback(file, offset, count)
+        sent = 0  # pragma: no cover
+        while sent < count and not self.closing:  # pragma: no cover
+            try:
+                sent_now = os.sendfile(
+                    self.fd, file.fileno(), offset + sent, count - sent
+                )
+            except BlockingIOError:
+                await self.writable()
+                continue
+            if sent_now == 0:
+                break
+            sent += sent_now
+        return sent  # pragma: no cover
+
+    async def sendfile_fallback(self, file: IO[bytes], offset: int, count: int) -> int:
+        sent = 0
+        file.seek(offset)
+        while sent < count and not self.closing:
+            chunk = file.read(min(self.max_read, count - sent))
+            if not chunk:
+                break
+            self.write(chunk)
+            sent += len(chunk)
+            if self.buffer_size > self.high_water:
+                await self.drain()
+        return sent
+
+    async def writable(self) -> None:  # pragma: no cover
+        waiter = self.loop.create_future()
+        self.loop.add_writer(self.fd, waiter.set_result, None)
+        try:
+            await waiter
+        finally:
+            self.loop.remove_writer(self.fd)
+
+    def get_write_buffer_size(self) -> int:
+        return self.buffer_size
+
+    def get_write_buffer_limits(self) -> "tuple[int, int]":
+        return self.low_water, self.high_water
+
+    def set_write_buffer_limits(
+        self, high: Optional[int] = None, low: Optional[int] = None
+    ) -> None:
+        if high is not None:
+            self.high_water = high
+        if low is not None:
+            self.low_water = low
+
+    def can_write_eof(self) -> bool:
+        return False
+
+    # Closing
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+    def close(self) -> None:
+        if self.closing:
+            return
+        self.closing = True
+        self.pause_reading()
+        if not self.buffer:
+            self.loop.call_soon(self.shutdown)
+
+    def abort(self) -> None:
+        self.force_close(None)
+
+    def shutdown(self) -> None:
+        """
+        Send the close_notify alert, so that the peer knows the response wasn't
+        truncated, and close without waiting for its own.
+        """
+        if self.connected and not self.closed:
+            try:
+                self.sock.unwrap()
+            except (OSError, ValueError):
+                # `ssl.SSLWantReadError`, once the alert is sent: the peer's is
+                # still to come. Or the connection is already gone.
+                pass
+        self.force_close(None)
+
+    def force_close(self, exc: Optional[Exception]) -> None:
+        if self.closed:
+            return
+        self.closed = self.closing = True
+        self.reading = False
+        self.handshake_timer.cancel()
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.buffer.clear()
+        self.buffer_size = 0
+        for waiter in self.drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.drain_waiters.clear()
+        self.sock.close()
+        if self.connected:
+            self.loop.call_soon(self.protocol.connection_lost, exc)
+
+    # Information
+
+    def get_extra_info(self, name: str, default: Any = None) -> Any:
+        if name == "peername":
+            return self.peername
+        if name == "sockname":
+            return self.sockname
+        if name in ("socket", "ssl_object"):
+            return self.sock
+        if name == "sslcontext":
+            return self.sock.context
+        if name == "peercert":
+            return self.sock.getpeercert()
+        if name == "cipher":
+            return self.sock.cipher()
+        return default
+
+    def set_protocol(self, protocol: asyncio.BaseProtocol) -> None:
+        self.protocol = protocol  # type: ignore[assignment]
+
+    def get_protocol(self) -> asyncio.BaseProtocol:
+        return self.protocol
+
+
+async def send_file(
+    transport: asyncio.Transport,
+    file: IO[bytes],
+    offset: int = 0,
+    count: Optional[int] = None,
+    drain: Optional[Callable[[], Awaitable[None]]] = None,
+) -> None:
+    """
+    Send a file on any transport: with `KTLSTransport.sendfile`, or with
+    `loop.sendfile`, that uses `os.sendfile` on plain transports, and copies the
+    file through the asyncio TLS ones.
+
+    The loops that don't implement `loop.sendfile`, e.g. `uvloop`, get the file
+    copied in chunks, awaiting `drain`, the flow control of the protocol, between
+    them.
+    """
+    if isinstance(transport, KTLSTransport):
+        await transport.sendfile(file, offset, count)
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.sendfile(transport, file, offset, count)
+    except NotImplementedError:
+        await copy_file(transport, file, offset, count, drain)
+
+
+async def copy_file(
+    transport: asyncio.Transport,
+    file: IO[bytes],
+    offset: int,
+    count: Optional[int],
+    drain: Optional[Callable[[], Awaitable[None]]],
+) -> None:
+    if count is None:
+        count = os.fstat(file.fileno()).st_size - offset
+    file.seek(offset)
+    while count > 0 and not transport.is_closing():
+        chunk = file.read(min(KTLSTransport.max_read, count))
+        if not chunk:
+            break
+        transport.write(chunk)
+        count -= len(chunk)
+        if drain is not None:
+            await drain()
@@ -0,0 +1,250 @@
+"""
+The OpenSSL settings of an `SSLContext` that the `ssl` module doesn't expose, set
+with `ctypes` on the `SSL_CTX` of the context.
+"""
+import ctypes
+import functools
+import ssl
+import sys
+import weakref
+from typing import Any, Callable, Optional, Sequence
+
+# See: https://github.com/openssl/openssl/blob/openssl-3.0/include/openssl/ssl.h.in
+SSL_CTRL_SET_SESS_CACHE_SIZE = 42
+SSL_CTRL_GET_SESS_CACHE_SIZE = 43
+SSL_CTRL_SET_TLSEXT_TICKET_KEYS = 59
+
+# The key of the session tickets: a 16 bytes name, then the 32 bytes HMAC and
+# 32 bytes AES keys.
+TICKET_KEY_LENGTH = 80
+
+# See: https://github.com/openssl/openssl/blob/openssl-3.0/include/openssl/core.h
+OSSL_PARAM_UTF8_STRING = 4
+OSSL_PARAM_OCTET_STRING = 5
+
+
+class OSSLParam(ctypes.Structure):
+    _fields_ = [
+        ("key", ctypes.c_char_p),
+        ("data_type", ctypes.c_uint),
+        ("data", ctypes.c_void_p),
+        ("data_size", ctypes.c_size_t),
+        ("return_size", ctypes.c_size_t),
+    ]
+
+
+# int (*cb)(SSL *s, unsigned char key_name[16], unsigned char iv[16],
+#           EVP_CIPHER_CTX *ctx, EVP_MAC_CTX *hctx, int enc)
+TICKET_KEY_CALLBACK = ctypes.CFUNCTYPE(
+    ctypes.c_int,
+    ctypes.c_void_p,
+    ctypes.c_void_p,
+    ctypes.c_void_p,
+    ctypes.c_void_p,
+    ctypes.c_void_p,
+    ctypes.c_int,
+)
+
+# The callbacks of the contexts, that must outlive them.
+ticket_key_callbacks: "weakref.WeakKeyDictionary[ssl.SSLContext, object]"
+ticket_key_callbacks = weakref.WeakKeyDictionary()
+
+# The CPython versions whose `PySSLContext` starts with the `SSL_CTX` pointer.
+# See: https://github.com/python/cpython/blob/3.13/Modules/_ssl.c
+SSL_CTX_FIRST = ((3, 7), (3, 14))
+
+
+@functools.lru_cache(maxsize=None)
+def libssl() -> Optional[ctypes.CDLL]:
+    """
+    The OpenSSL library the `ssl` module is linked to, or `None` if it can't be
+    loaded.
+    """
+    if sys.implementation.name != "cpython":  # pragma: no cover
+        return None
+    import _ssl
+
+    try:
+        lib = ctypes.CDLL(_ssl.__file__)
+        lib.SSL_CTX_ctrl.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_int,
+            ctypes.c_long,
+            ctypes.c_void_p,
+        ]
+        lib.SSL_CTX_ctrl.restype = ctypes.c_long
+        lib.SSL_CTX_set_timeout.argtypes = [ctypes.c_void_p, ctypes.c_long]
+        lib.SSL_CTX_set_timeout.restype = ctypes.c_long
+        lib.SSL_CTX_get_options.argtypes = [ctypes.c_void_p]
+        lib.SSL_CTX_get_options.restype = ctypes.c_uint64
+    except (AttributeError, OSError):  # pragma: no cover
+        return None
+    return lib
+
+
+def ssl_ctx(context: ssl.SSLContext) -> Optional[int]:
+    """
+    The address of the `SSL_CTX` of `context`, or `None` if it's not reachable.
+
+    It's read from the memory of the context, which is only done for the callers
+    that opt in, e.g. `SessionResumption(use_ctypes=True)`, and on the CPython
+    versions whose layout is known. The options of the `SSL_CTX` are then read
+    through it, and the address is only returned if they're those of `context`:
+    otherwise, the settings are left to OpenSSL.
+    """
+    lower, upper = SSL_CTX_FIRST
+    if not lower <= sys.version_info[:2] < upper:  # pragma: no cover
+        return None
+    lib = libssl()
+    if lib is None:  # pragma: no cover
+        return None
+    # The `SSL_CTX` pointer is the first field of the context, after the header.
+    address = ctypes.c_void_p.from_address(id(context) + object.__basicsize__).value
+    if not address or lib.SSL_CTX_get_options(address) != int(context.options):
+        return None  # pragma: no cover
+    return address
+
+
+def set_ticket_key(context: ssl.SSLContext, key: bytes) -> bool:
+    """
+    Encrypt the session tickets of `context` with `key`, instead of the random one
+    OpenSSL generates for each context. Return whether the key was set.
+    """
+    if len(key) != TICKET_KEY_LENGTH:
+        raise ValueError(f"The ticket key must be {TICKET_KEY_LENGTH} bytes long.")
+    address = ssl_ctx(context)
+    if address is None:  # pragma: no cover
+        return False
+    lib = libssl()
+    assert lib is not None
+    buffer = ctypes.create_string_buffer(key, len(key))
+    result = lib.SSL_CTX_ctrl(
+        address, SSL_CTRL_SET_TLSEXT_TICKET_KEYS, len(key), buffer
+    )
+    return result == 1
+
+
+@functools.lru_cache(maxsize=None)
+def libssl_ticket_key_callback() -> Optional[ctypes.CDLL]:
+    """
+    The OpenSSL library, if it's OpenSSL 3, with the functions of the ticket key
+    callbacks, or `None`.
+    """
+    lib = libssl()
+    if lib is None:  # pragma: no cover
+        return None
+    try:
+        lib.SSL_CTX_set_tlsext_ticket_key_evp_cb.argtypes = [
+            ctypes.c_void_p,
+            TICKET_KEY_CALLBACK,
+        ]
+        lib.SSL_CTX_set_tlsext_ticket_key_evp_cb.restype = ctypes.c_int
+        lib.RAND_bytes.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.RAND_bytes.restype = ctypes.c_int
+        lib.EVP_aes_256_cbc.argtypes = []
+        lib.EVP_aes_256_cbc.restype = ctypes.c_void_p
+        for init in (lib.EVP_EncryptInit_ex, lib.EVP_DecryptInit_ex):
+            init.argtypes = [ctypes.c_void_p] * 5
+            init.restype = ctypes.c_int
+        lib.EVP_MAC_CTX_set_params.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        lib.EVP_MAC_CTX_set_params.restype = ctypes.c_int
+    except AttributeError:  # pragma: no cover
+        return None
+    return lib
+
+
+def ticket_key_callback(lib: ctypes.CDLL, keys: Callable[[], Sequence[bytes]]) -> Any:
+    """
+    The callback that encrypts the session tickets with the first of `keys`, and
+    decrypts them with the one of their name, as OpenSSL does with its own keys:
+    AES-256-CBC, and HMAC-SHA256.
+    """
+
+    def callback(
+        _ssl: int, key_name: int, iv: int, cipher_ctx: int, mac_ctx: int, enc: int
+    ) -> int:
+        try:
+            candidates = keys()
+            if enc:
+                key = candidates[0]
+                ctypes.memmove(key_name, key[:16], 16)
+                if lib.RAND_bytes(iv, 16) != 1:  # pragma: no cover
+                    return -1
+                init = lib.EVP_EncryptInit_ex
+            else:
+                name = ctypes.string_at(key_name, 16)
+                for index, key in enumerate(candidates):
+                    if key[:16] == name:
+                        break
+                else:
+                    # A full handshake, and a new ticket.
+                    return 0
+                init = lib.EVP_DecryptInit_ex
+            hmac_key = ctypes.create_string_buffer(key[16:48], 32)
+            aes_key = ctypes.create_string_buffer(key[48:80], 32)
+            digest = ctypes.create_string_buffer(b"SHA256")
+            params = (OSSLParam * 3)(
+                OSSLParam(
+                    b"key", OSSL_PARAM_OCTET_STRING, ctypes.addressof(hmac_key), 32, 0
+                ),
+                OSSLParam(
+                    b"digest", OSSL_PARAM_UTF8_STRING, ctypes.addressof(digest), 6, 0
+                ),
+                OSSLParam(),
+            )
+            if lib.EVP_MAC_CTX_set_params(mac_ctx, params) != 1:  # pragma: no cover
+                return -1
+            cipher = lib.EVP_aes_256_cbc()
+            if init(cipher_ctx, cipher, None, aes_key, iv) != 1:  # pragma: no cover
+                return -1
+            # The tickets of the previous keys are replaced by new ones.
+            return 2 if not enc and index else 1
+        except Exception:  # pragma: no cover
+            return -1
+
+    return TICKET_KEY_CALLBACK(callback)
+
+
+def set_ticket_keys(
+    context: ssl.SSLContext, keys: Callable[[], Sequence[bytes]]
+) -> bool:
+    """
+    Encrypt the session tickets of `context` with the first of the keys `keys()`
+    returns, on each ticket, and decrypt them with any of them, e.g. the key of the
+    previous rotation period. Return whether it's set: it needs OpenSSL 3.
+    """
+    for key in keys():
+        if len(key) != TICKET_KEY_LENGTH:
+            raise ValueError(f"The ticket key must be {TICKET_KEY_LENGTH} bytes long.")
+    address = ssl_ctx(context)
+    lib = libssl_ticket_key_callback()
+    if address is None or lib is None:  # pragma: no cover
+        return False
+    callback = ticket_key_callback(lib, keys)
+    if lib.SSL_CTX_set_tlsext_ticket_key_evp_cb(address, callback) != 1:
+        return False  # pragma: no cover
+    ticket_key_callbacks[context] = callback
+    return True
+
+
+def set_session_cache(context: ssl.SSLContext, size: int, timeout: int) -> bool:
+    """
+    Keep up to `size` sessions in the server-side cache of `context`, for `timeout`
+    seconds. Return whether the cache was configured.
+    """
+    address = ssl_ctx(context)
+    if address is None:  # pragma: no cover
+        return False
+    lib = libssl()
+    assert lib is not None
+    lib.SSL_CTX_ctrl(address, SSL_CTRL_SET_SESS_CACHE_SIZE, size, None)
+    lib.SSL_CTX_set_timeout(address, timeout)
+    return True
+
+
+def get_session_cache_size(context: ssl.SSLContext) -> Optional[int]:
+    address = ssl_ctx(context)
+    lib = libssl()
+    if address is None or lib is None:  # pragma: no cover
+        return None
+    return int(lib.SSL_CTX_ctrl(address, SSL_CTRL_GET_SESS_CACHE_SIZE, 0, None))
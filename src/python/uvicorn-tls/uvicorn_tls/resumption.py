@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import ssl
+import time
+import weakref
+from typing import Dict, List, Optional
+
+from uvicorn_tls.openssl import (
+    TICKET_KEY_LENGTH,
+    set_session_cache,
+    set_ticket_key,
+    set_ticket_keys,
+)
+
+SECRET_LENGTH = 32
+
+
+def load_secret(path: str) -> bytes:
+    """
+    The secret stored at `path`, created by the first process that loads it.
+
+    Every worker, and every server, that loads the same file derives the same
+    ticket keys.
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, "wb") as file:
+            file.write(os.urandom(SECRET_LENGTH))
+    # A process that lost the race may read it before it's written.
+    deadline = time.monotonic() + 1.0
+    while True:
+        with open(path, "rb") as file:
+            secret = file.read()
+        if len(secret) >= SECRET_LENGTH or time.monotonic() > deadline:
+            break
+        time.sleep(0.01)  # pragma: no cover
+    if len(secret) < SECRET_LENGTH:
+        raise ValueError(f"The secret in {path} is shorter than {SECRET_LENGTH} bytes.")
+    return secret
+
+
+def derive_ticket_key(secret: bytes, epoch: int) -> bytes:
+    """
+    The session ticket key of the `epoch`-th rotation period.
+    """
+    info = b"uvicorn-tls ticket key" + epoch.to_bytes(8, "big")
+    key = b"".join(
+        hmac.new(secret, info + bytes([counter]), hashlib.sha512).digest()
+        for counter in range(2)
+    )
+    return key[:TICKET_KEY_LENGTH]
+
+
+class SessionResumption:
+    """
+    The TLS session resumption settings of a server.
+
+    The session tickets are encrypted with a key derived from `secret` and the
+    current rotation period, of `rotation_interval` seconds, and the key of the
+    previous period still decrypts them, so a rotation doesn't reject the tickets
+    issued just before it. The processes that share the secret, e.g. the workers
+    forked from the one that created it, or that loaded it with `load_secret`,
+    resume the sessions of each other.
+
+    The clients that don't support tickets resume from the server-side cache, of
+    `cache_size` sessions kept for `session_timeout` seconds. It's per process.
+
+    The `ssl` module doesn't expose the ticket keys, nor the size of the cache, so
+    they're set with `ctypes` on the OpenSSL context, only with `use_ctypes`.
+    Otherwise, each context keeps the random ticket key OpenSSL generates for it,
+    and only `num_tickets` applies.
+    """
+
+    def __init__(
+        self,
+        secret: Optional[bytes] = None,
+        rotation_interval: float = 3600.0,
+        num_tickets: int = 2,
+        cache_size: int = 20_480,
+        session_timeout: int = 7200,
+        use_ctypes: bool = False,
+    ) -> None:
+        self.secret = os.urandom(SECRET_LENGTH) if secret is None else secret
+        self.rotation_interval = rotation_interval
+        self.num_tickets = num_tickets
+        self.cache_size = cache_size
+        self.session_timeout = session_timeout
+        self.use_ctypes = use_ctypes
+        # The rotation period of the ticket key of each configured context, or
+        # `None` if its callback picks the keys.
+        self.epochs: "weakref.WeakKeyDictionary[ssl.SSLContext, Optional[int]]"
+        self.epochs = weakref.WeakKeyDictionary()
+        self.keys: Dict[int, bytes] = {}
+
+    def epoch(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        return int(now // self.rotation_interval)
+
+    def ticket_key(self, epoch: int) -> bytes:
+        key = self.keys.get(epoch)
+        if key is None:
+            # Only the keys of this period, and of the previous one, are kept.
+            self.keys = {
+                kept: self.keys[kept]
+                for kept in (epoch - 1, epoch)
+                if kept in self.keys
+            }
+            key = self.keys[epoch] = derive_ticket_key(self.secret, epoch)
+        return key
+
+    def ticket_keys(self) -> List[bytes]:
+        """
+        The key that encrypts the new tickets, then the one of the previous period.
+        """
+        epoch = self.epoch()
+        return [self.ticket_key(epoch), self.ticket_key(epoch - 1)]
+
+    def configure(self, context: ssl.SSLContext, now: Optional[float] = None) -> None:
+        """
+        Configure `context`, and rotate its ticket key if the rotation period is
+        over. With OpenSSL 3, a callback picks the keys of each ticket, and it
+        only needs to be called once.
+        """
+        epoch = self.epoch(now)
+        if context in self.epochs:
+            configured = self.epochs[context]
+            if configured is None or configured == epoch:
+                return
+        else:
+            context.num_tickets = self.num_tickets
+            if self.use_ctypes:
+                set_session_cache(context, self.cache_size, self.session_timeout)
+                if set_ticket_keys(context, self.ticket_keys):
+                    # The callback picks the keys of each ticket.
+                    self.epochs[context] = None
+                    return
+        if self.use_ctypes:  # pragma: no cover
+            # Before OpenSSL 3, a single key: the tickets issued before the
+            # rotation are rejected.
+            set_ticket_key(context, self.ticket_key(epoch))
+        self.epochs[context] = epoch
+
+    def schedule_rotation(
+        self, context: ssl.SSLContext, loop: asyncio.AbstractEventLoop
+    ) -> None:  # pragma: no cover
+        """
+        Rotate the single ticket key of `context` at the end of each rotation
+        period, on `loop`.
+        """
+        self.configure(context)
+        delay = self.rotation_interval - time.time() % self.rotation_interval
+        loop.call_later(delay, self.schedule_rotation, context, loop)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        The handshakes of the configured contexts in this process, and how many of
+        them resumed a session.
+        """
+        handshakes = resumed = 0
+        for context in list(self.epochs):
+            stats = context.session_stats()
+            handshakes += stats["accept_good"]
+            resumed += stats["hits"]
+        return {
+            "handshakes": handshakes,
+            "resumed": resumed,
+            "hit_rate": resumed / handshakes if handshakes else 0.0,
+        }
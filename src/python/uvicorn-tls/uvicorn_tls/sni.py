@@ -0,0 +1,164 @@
+import logging
+import os
+import ssl
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+
+from uvicorn_tls.extension import PEM_CERTIFICATE_RE
+
+logger = logging.getLogger("uvicorn.error")
+
+# The certificate and private key files of a server name.
+Files = Tuple[str, str]
+
+
+class Entry(NamedTuple):
+    context: ssl.SSLContext
+    server_cert: Optional[str]
+    mtimes: Tuple[float, float]
+
+
+def get_mtimes(files: Files) -> Tuple[float, float]:
+    certfile, keyfile = files
+    return os.stat(certfile).st_mtime, os.stat(keyfile).st_mtime
+
+
+def load_entry(files: Files) -> Entry:
+    mtimes = get_mtimes(files)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*files)
+    with open(files[0]) as file:
+        match = PEM_CERTIFICATE_RE.search(file.read())
+    return Entry(context, match.group() if match else None, mtimes)
+
+
+class SNIContexts:
+    """
+    Select the certificate of the handshakes by the server name the client asks
+    for, with SNI.
+
+    `certificates` maps the server names, e.g. `example.com` or `*.example.com`,
+    to their certificate and private key files. The names that match none are
+    served the certificate of the server.
+
+    The `SSLContext` of each certificate is built once, and kept in a cache of
+    up to `maxsize` contexts, the least recently used evicted first. The first
+    `maxsize` certificates are loaded upfront, so only the ones evicted are
+    loaded during a handshake.
+
+    A thread checks the files of the cached certificates every `reload_interval`
+    seconds, and reloads the ones that changed, out of the handshakes.
+    """
+
+    def __init__(
+        self,
+        certificates: Mapping[str, Files],
+        maxsize: int = 128,
+        reload_interval: Optional[float] = 5.0,
+        preload: bool = True,
+    ) -> None:
+        self.certificates = {
+            name.lower(): files for name, files in certificates.items()
+        }
+        self.maxsize = maxsize
+        self.reload_interval = reload_interval
+        self.entries: "OrderedDict[Files, Entry]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.watcher_pid: Optional[int] = None
+        self.hits = self.misses = self.reloads = 0
+        if preload:
+            for files in list(dict.fromkeys(self.certificates.values()))[:maxsize]:
+                self.entries[files] = load_entry(files)
+
+    def find(self, server_name: str) -> Optional[Files]:
+        server_name = server_name.lower()
+        files = self.certificates.get(server_name)
+        if files is None and "." in server_name:
+            files = self.certificates.get("*." + server_name.split(".", 1)[1])
+        return files
+
+    def get(self, files: Files) -> Entry:
+        with self.lock:
+            entry = self.entries.get(files)
+            if entry is not None:
+                self.entries.move_to_end(files)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = load_entry(files)
+        with self.lock:
+            self.entries[files] = entry
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return entry
+
+    def sni_callback(
+        self,
+        ssl_object: ssl.SSLObject,
+        server_name: Optional[str],
+        context: ssl.SSLContext,
+    ) -> None:
+        ssl_object.server_name = server_name  # type: ignore[attr-defined]
+        self.watch()
+        files = self.find(server_name) if server_name else None
+        if files is None:
+            return
+        try:
+            entry = self.get(files)
+        except (OSError, ssl.SSLError) as exc:
+            logger.error("Failed to load the certificate of %s: %s", server_name, exc)
+            return
+        # OpenSSL only takes the certificate and the key of the new context: the
+        # settings and the session tickets remain the ones of the server.
+        ssl_object.context = entry.context
+        ssl_object.server_cert = entry.server_cert  # type: ignore[attr-defined]
+
+    def reload(self) -> int:
+        """
+        Reload the cached certificates whose files changed, and return how many.
+        """
+        reloaded = 0
+        for files, entry in list(self.entries.items()):
+            try:
+                if get_mtimes(files) == entry.mtimes:
+                    continue
+                new_entry = load_entry(files)
+            except (OSError, ssl.SSLError) as exc:
+                # Keep serving the previous one, e.g. until both files are written.
+                logger.warning("Failed to reload %s: %s", files[0], exc)
+                continue
+            with self.lock:
+                if files in self.entries:
+                    self.entries[files] = new_entry
+            reloaded += 1
+        self.reloads += reloaded
+        return reloaded
+
+    def watch(self) -> None:
+        """
+        Start the thread that reloads the certificates, in this process.
+        """
+        pid = os.getpid()
+        if self.reload_interval is None or self.watcher_pid == pid:
+            return
+        self.watcher_pid = pid
+        thread = threading.Thread(
+            target=self.run_watcher, name="uvicorn-tls-sni", daemon=True
+        )
+        thread.start()
+
+    def run_watcher(self) -> None:
+        assert self.reload_interval is not None
+        while True:
+            time.sleep(self.reload_interval)
+            self.reload()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "contexts": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
@@ -2,17 +2,12 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import urllib.parse
-from typing import Callable, cast
+import sys
+from typing import TYPE_CHECKING, Any, Callable, Dict, Type, cast
 
 import httptools
-from asgi_types import (
-    ASGISendEvent,
-    HTTPResponseStartEvent,
-    HTTPResponseTrailersEvent,
-    HTTPScope,
-)
 from uvicorn.config import Config
+from uvicorn.logging import TRACE_LOG_LEVEL
 from uvicorn.protocols.http.flow_control import (
     CLOSE_HEADER,
     FlowControl,
@@ -27,9 +22,34 @@ from uvicorn.protocols.http.httptools_impl import (
 )
 from uvicorn.protocols.utils import get_client_addr, get_path_with_query_string
 from uvicorn.server import ServerState
+from uvicorn_target import DEFAULT_TARGET_DECODER, TargetDecoder
+
+try:
+    import uvicorn_http2
+    from uvicorn_http2 import CONNECTION_PREFACE
+except ImportError:  # pragma: no cover
+    uvicorn_http2 = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    from asgi_types import (
+        ASGISendEvent,
+        HTTPResponseStartEvent,
+        HTTPResponseTrailersEvent,
+        HTTPScope,
+    )
+    from uvicorn_http2 import H2Protocol
 
 
 class HTTPProtocol(HttpToolsProtocol):
+    # HTTP/2 connections are handed over to `h2_protocol_class`, or else to
+    # `uvicorn_http2.H2Protocol`, that's imported, with `h2`, once a client speaks
+    # HTTP/2. Without `http2`, they're answered over HTTP/1.1.
+    h2_protocol_class: Type[H2Protocol] | None = None
+    http2 = uvicorn_http2 is not None
+    # The request targets are decoded once each, in a cache shared with the other
+    # protocols.
+    target_decoder: TargetDecoder = DEFAULT_TARGET_DECODER
+
     def __init__(
         self,
         config: Config,
@@ -37,13 +57,18 @@ class HTTPProtocol(HttpToolsProtocol):
         _loop: asyncio.AbstractEventLoop | None = None,
     ) -> None:
         super().__init__(config, server_state, _loop)
+        self.scope_template: Dict[str, Any] = {}
         self.expect_trailers = False
+        # The start of the HTTP/2 preface, until it's complete or ruled out.
+        self.preface: bytes | None = b"" if self.http2 else None
+        self.received = b""
 
-    def on_message_begin(self) -> None:
-        self.url = b""
-        self.expect_100_continue = False
-        self.headers = []
-        self.scope = {
+    def connection_made(  # type: ignore[override]
+        self, transport: asyncio.Transport
+    ) -> None:
+        super().connection_made(transport)
+        # The scope of each request starts as a copy of this one.
+        self.scope_template = {
             "type": "http",
             "asgi": {"version": self.config.asgi_version, "spec_version": "2.3"},
             "http_version": "1.1",
@@ -51,10 +76,102 @@ class HTTPProtocol(HttpToolsProtocol):
             "client": self.client,
             "scheme": self.scheme,
             "root_path": self.root_path,
-            "headers": self.headers,
-            "extensions": {"http.response.trailers": {}},
         }
 
+    def data_received(self, data: bytes) -> None:
+        # Only the first data of a connection can be the HTTP/2 preface, and it may
+        # come in more than one segment: what could still be it is held. It's
+        # checked here, rather than by swapping `data_received`, since `uvloop`
+        # holds on to the method the protocol had before `connection_made`.
+        if self.preface is not None:
+            data = self.preface + data
+            if len(data) < len(CONNECTION_PREFACE) and CONNECTION_PREFACE.startswith(
+                data
+            ):
+                self._unset_keepalive_if_required()
+                self.preface = data
+                return
+            self.preface = None
+            if data.startswith(CONNECTION_PREFACE):
+                self._unset_keepalive_if_required()
+                self.handle_http2_prior_knowledge(data)
+                return
+
+        # For `_should_upgrade_to_ws`, that hands what follows `h2c` over.
+        self.received = data
+        super().data_received(data)
+        self.received = b""
+
+    def _should_upgrade_to_ws(self, upgrade: bytes | None) -> bool:
+        # `data_received` calls it on `httptools.HttpParserUpgrade`, whose argument
+        # is the offset of the data that follows the upgrade request.
+        if upgrade == b"h2c" and self._get_http2_settings() is not None:
+            exc = sys.exc_info()[1]
+            assert isinstance(exc, httptools.HttpParserUpgrade)
+            self.handle_http2_upgrade(self.received[exc.args[0] :])
+            return False
+        return super()._should_upgrade_to_ws(upgrade)
+
+    def _get_http2_settings(self) -> bytes | None:
+        if self.scheme != "http" or self._get_upgrade() != b"h2c":
+            return None
+        protocol_class = self._get_h2_protocol_class()
+        if protocol_class is None:
+            return None
+        return protocol_class.get_upgrade_settings(self.headers)
+
+    def _get_h2_protocol_class(self) -> Type[H2Protocol] | None:
+        if not self.http2:
+            return None
+        return self.h2_protocol_class or uvicorn_http2.H2Protocol
+
+    def _should_upgrade(self) -> bool:
+        if self._get_http2_settings() is not None:
+            return True
+        return super()._should_upgrade()
+
+    def _create_http2_protocol(self) -> H2Protocol:
+        protocol_class = self._get_h2_protocol_class()
+        assert protocol_class is not None
+        if self.logger.level <= TRACE_LOG_LEVEL:  # pragma: to be covered
+            prefix = "%s:%d - " % self.client if self.client else ""
+            self.logger.log(TRACE_LOG_LEVEL, "%sUpgrading to HTTP/2", prefix)
+
+        self.connections.discard(self)
+        protocol = protocol_class(
+            config=self.config, server_state=self.server_state, _loop=self.loop
+        )
+        self.transport.set_protocol(protocol)
+        return protocol
+
+    def handle_http2_prior_knowledge(self, data: bytes) -> None:
+        protocol = self._create_http2_protocol()
+        protocol.connection_made(self.transport)
+        protocol.data_received(data)
+
+    def handle_http2_upgrade(self, data: bytes) -> None:
+        settings = self._get_http2_settings()
+        assert settings is not None
+        protocol = self._create_http2_protocol()
+        protocol.handle_upgrade(
+            self.transport,
+            self.scope["method"].encode("ascii"),
+            self.url,
+            self.headers,
+            settings,
+            data,
+        )
+
+    def on_message_begin(self) -> None:
+        self.url = b""
+        self.expect_100_continue = False
+        self.headers = []
+        scope = self.scope_template.copy()
+        scope["asgi"] = scope["asgi"].copy()
+        scope["headers"] = self.headers
+        scope["extensions"] = {"http.response.trailers": {}}
+        self.scope = cast("HTTPScope", scope)
+
     def on_header(self, name: bytes, value: bytes) -> None:
         name = name.lower()
         if name == b"expect" and value.lower() == b"100-continue":
@@ -73,14 +190,10 @@ class HTTPProtocol(HttpToolsProtocol):
             self.scope["http_version"] = http_version
         if self.parser.should_upgrade() and self._should_upgrade():
             return
-        parsed_url = httptools.parse_url(self.url)
-        raw_path = parsed_url.path
-        path = raw_path.decode("ascii")
-        if "%" in path:
-            path = urllib.parse.unquote(path)
+        path, raw_path, query_string = self.target_decoder(self.url)
         self.scope["path"] = path
         self.scope["raw_path"] = raw_path
-        self.scope["query_string"] = parsed_url.query or b""
+        self.scope["query_string"] = query_string
 
         # Handle 503 responses when 'limit_concurrency' is exceeded.
         if self.limit_concurrency is not None and (
@@ -165,7 +278,7 @@ class RequestResponseCycle(_RequestResponseCycle):
             if message_type != "http.response.start":
                 msg = "Expected ASGI message 'http.response.start', but got '%s'."
                 raise RuntimeError(msg % message_type)
-            message = cast(HTTPResponseStartEvent, message)
+            message = cast("HTTPResponseStartEvent", message)
 
             self.response_started = True
             self.waiting_for_100_continue = False
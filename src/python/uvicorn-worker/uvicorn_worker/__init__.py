@@ -0,0 +1,4 @@
+from uvicorn_worker.server import WorkerServer
+from uvicorn_worker.workers import UvicornWorker, UvloopWorker
+
+__all__ = ["UvicornWorker", "UvloopWorker", "WorkerServer"]
@@ -0,0 +1,113 @@
+import asyncio
+import contextlib
+import time
+from email.utils import formatdate
+from typing import Any, Optional
+
+from uvicorn.server import Server
+
+# Resolution of the `date` header, in seconds.
+DATE_INTERVAL = 1.0
+
+
+class WorkerServer(Server):
+    """
+    A Uvicorn server that doesn't wake up when there's nothing to do.
+
+    The Uvicorn main loop ticks ten times per second, to refresh the `date`
+    header, notify the Gunicorn arbiter, and check `limit_max_requests`. This one
+    ticks once per `DATE_INTERVAL` while it has open connections. Idle, it sleeps
+    until the next heartbeat is due, every `timeout_notify / 2` seconds, or a
+    connection comes in. The requests are counted against `limit_max_requests`
+    as they complete.
+    """
+
+    def __init__(self, config: Any) -> None:
+        super().__init__(config)
+        self.wakeup: Optional[asyncio.Event] = None
+        self.headers_updated_at = 0.0
+
+    async def startup(self, sockets: Any = None) -> None:
+        # The event must be created in the running loop, before Python 3.10.
+        self.wakeup = asyncio.Event()
+        config = self.config
+        if not config.loaded:
+            config.load()
+        protocol_class = config.http_protocol_class
+
+        def create_protocol(*args: Any, **kwargs: Any) -> Any:
+            self.on_connection()
+            return protocol_class(*args, **kwargs)
+
+        config.http_protocol_class = create_protocol  # type: ignore[assignment]
+        if config.limit_max_requests is not None:
+            limit = config.limit_max_requests
+            config.loaded_app = self.count_requests(config.loaded_app, limit)
+        await super().startup(sockets=sockets)
+
+    def count_requests(self, app: Any, limit: int) -> Any:
+        async def wrapper(scope: Any, receive: Any, send: Any) -> None:
+            try:
+                await app(scope, receive, send)
+            finally:
+                if self.server_state.total_requests >= limit and self.wakeup:
+                    self.should_exit = True
+                    self.wakeup.set()
+
+        return wrapper
+
+    def on_connection(self) -> None:
+        now = time.time()
+        if now - self.headers_updated_at >= DATE_INTERVAL:
+            self.update_default_headers(now)
+        # The first connection after a while: tick while it's open.
+        if not self.server_state.connections and self.wakeup is not None:
+            self.wakeup.set()
+
+    def update_default_headers(self, now: float) -> None:
+        date_header = []
+        if self.config.date_header:
+            date_header = [(b"date", formatdate(now, usegmt=True).encode())]
+        self.server_state.default_headers = date_header + self.config.encoded_headers
+        self.headers_updated_at = now
+
+    def next_tick(self) -> Optional[float]:
+        """
+        Seconds until the next tick, or `None` to wait for a connection or signal.
+        """
+        if self.server_state.connections:
+            return DATE_INTERVAL
+        if self.config.callback_notify is None:
+            return None
+        timeout = self.last_notified + self.notify_interval - time.time()
+        return max(timeout, 0.0)
+
+    @property
+    def notify_interval(self) -> float:
+        # Halfway to `timeout_notify`, so that a late tick doesn't miss it.
+        return self.config.timeout_notify / 2
+
+    async def main_loop(self) -> None:
+        assert self.wakeup is not None
+        while not await self.on_tick(0):
+            self.wakeup.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.wakeup.wait(), self.next_tick())
+
+    async def on_tick(self, counter: int) -> bool:
+        now = time.time()
+        self.update_default_headers(now)
+        if self.config.callback_notify is not None:
+            if now - self.last_notified >= self.notify_interval:
+                self.last_notified = now
+                await self.config.callback_notify()
+
+        if self.should_exit:
+            return True
+        limit = self.config.limit_max_requests
+        return limit is not None and self.server_state.total_requests >= limit
+
+    def handle_exit(self, sig: int, frame: Any) -> None:
+        super().handle_exit(sig, frame)
+        if self.wakeup is not None:
+            self.wakeup.set()
@@ -0,0 +1,67 @@
+import asyncio
+import signal
+import sys
+from typing import Any, Container, Dict
+
+import uvicorn.workers
+from gunicorn.arbiter import Arbiter
+from uvicorn.config import HTTP_PROTOCOLS, WS_PROTOCOLS
+from uvicorn.importer import import_from_string
+from uvicorn_worker.server import WorkerServer
+
+
+def resolve_protocol(protocol: Any, builtin: Container[str]) -> Any:
+    """
+    Resolve a protocol: the name of one of Uvicorn, a protocol class, or its
+    import string, e.g. `uvicorn_httparse:HttparseProtocol`.
+    """
+    if not isinstance(protocol, str) or protocol in builtin:
+        return protocol
+    return import_from_string(protocol)
+
+
+class UvicornWorker(uvicorn.workers.UvicornWorker):
+    """
+    A Gunicorn worker that runs an ASGI application with Uvicorn, and a
+    `WorkerServer`.
+
+    The protocols are the ones of `CONFIG_KWARGS`, where `http` and `ws` can also
+    be the import strings of protocol classes: subclass the worker to select
+    others.
+    """
+
+    CONFIG_KWARGS: Dict[str, Any] = {"loop": "asyncio", "http": "auto"}
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        config = self.config
+        config.http = resolve_protocol(config.http, HTTP_PROTOCOLS)
+        config.ws = resolve_protocol(config.ws, WS_PROTOCOLS)
+        # Gunicorn sets `max_requests` to `sys.maxsize` when there's no limit.
+        if self.max_requests == sys.maxsize:
+            config.limit_max_requests = None
+        # The arbiter doesn't kill the workers when `timeout` is 0.
+        if not self.timeout:
+            config.callback_notify = None
+
+    async def _serve(self) -> None:
+        self.config.app = self.wsgi
+        server = WorkerServer(config=self.config)
+        # Uvicorn doesn't handle SIGQUIT, the Gunicorn signal for a quick exit.
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGQUIT, self.quit_server, server)
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+    def quit_server(self, server: WorkerServer) -> None:
+        server.force_exit = True
+        server.handle_exit(signal.SIGQUIT, None)
+
+
+class UvloopWorker(UvicornWorker):
+    """
+    A Gunicorn worker that runs an ASGI application with Uvicorn, on `uvloop`.
+    """
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "auto"}
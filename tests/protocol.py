@@ -1,3 +1,5 @@
+import asyncio
+
 from uvicorn.config import Config
 from uvicorn.server import ServerState
 
@@ -54,6 +56,9 @@ class MockLoop:
     def call_later(self, delay, callback, *args):
         self._later.insert(0, (delay, callback, args))
 
+    def call_soon(self, callback, *args):
+        return asyncio.get_running_loop().call_soon(callback, *args)
+
     async def run_one(self):
         return await self._tasks.pop()
 
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+from typing import List, Set
+
+import pytest
+
+# Uvicorn imports it anyway, so it's imported before the package, and not counted.
+BASELINE = "uvicorn.server"
+
+
+def import_package(package: str) -> Set[str]:
+    """
+    Import `package` on a new interpreter, after `BASELINE`, and return the modules
+    it has imported in turn.
+    """
+    code = f"import {BASELINE}; import {package}"
+    command = [sys.executable, "-X", "importtime", "-c", code]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    process = subprocess.run(command, env=env, capture_output=True, text=True)
+    assert process.returncode == 0, process.stderr
+    modules: Set[str] = set()
+    imported: Set[str] = set()
+    for line in process.stderr.splitlines():
+        # Anything else on stderr, e.g. warnings, isn't part of the report.
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # The modules are listed once imported, after the ones they import, with
+        # one more level of indentation.
+        modules.add(name.strip())
+        if not name.startswith("  "):
+            if name.strip() == package:
+                imported = modules
+            modules = set()
+    assert package in imported, f"{package} wasn't imported."
+    return imported
+
+
+@pytest.mark.parametrize(
+    "package, deferred",
+    [
+        ("asgi_trailers", ["h2", "wsproto"]),
+        ("asgi_types", ["starlette"]),
+        ("uvicorn_denial", ["wsproto"]),
+        ("uvicorn_extended", ["h2", "wsproto"]),
+        ("uvicorn_http2", ["h2"]),
+        ("uvicorn_httparse", ["h2"]),
+        ("uvicorn_manager", ["httptools", "h2"]),
+        ("uvicorn_target", ["httptools"]),
+        ("uvicorn_tls", ["h2", "wsproto"]),
+        ("uvicorn_trailers", ["h2"]),
+        ("uvicorn_worker", ["h2", "wsproto"]),
+    ],
+)
+def test_deferred_imports(package: str, deferred: List[str]):
+    modules = import_package(package)
+    assert not set(deferred) & modules
@@ -0,0 +1,223 @@
+import asyncio
+import socket
+import ssl
+from pathlib import Path
+
+import pytest
+import uvicorn_extended
+from uvicorn.config import Config
+from uvicorn.server import ServerState
+from uvicorn_denial import WSProtocol
+from uvicorn_http2 import CONNECTION_PREFACE
+
+from tests.constants import SIMPLE_GET_REQUEST
+from tests.protocol import MockLoop, MockTransport, get_connected_protocol
+from tests.utils import run_server, to_thread
+
+CERTS = Path(__file__).parent / "certs"
+
+EXPECT_TRAILERS_REQUEST = b"\r\n".join(
+    [b"GET / HTTP/1.1", b"Host: example.org", b"TE: trailers", b"", b""]
+)
+
+
+def request(port: int, data: bytes) -> bytes:
+    context = ssl.create_default_context(cafile=str(CERTS / "ca.pem"))
+    with socket.create_connection(("127.0.0.1", port)) as raw:
+        with context.wrap_socket(raw, server_hostname="localhost") as sock:
+            sock.sendall(data)
+            response = b""
+            while chunk := sock.recv(65536):
+                response += chunk
+            return response
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("loop_sendfile", [True, False])
+async def test_extensions(
+    tmp_path: Path, loop_sendfile: bool, monkeypatch: pytest.MonkeyPatch
+):
+    if not loop_sendfile:
+        # As with `uvloop`, that doesn't implement `loop.sendfile`.
+        monkeypatch.setattr(
+            asyncio.AbstractEventLoop, "sendfile", asyncio.AbstractEventLoop.sendfile
+        )
+        monkeypatch.delattr(asyncio.BaseEventLoop, "sendfile")
+    path = tmp_path / "file"
+    path.write_bytes(b"Hello, world!")
+    extensions = []
+
+    async def app(scope, receive, send):
+        extensions.append(scope["extensions"])
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [],
+                "trailers": True,
+            }
+        )
+        with open(path, "rb") as file:
+            await send({"type": "http.response.zerocopysend", "file": file})
+        await send({"type": "http.response.trailers", "headers": [(b"x-test", b"1")]})
+
+    config = Config(
+        app=app,
+        http=uvicorn_extended.HTTPProtocol,
+        port=0,
+        ssl_certfile=str(CERTS / "server.pem"),
+        ssl_keyfile=str(CERTS / "server.key"),
+        lifespan="off",
+    )
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        async with run_server(config, sockets=[sock]):
+            data = EXPECT_TRAILERS_REQUEST.replace(
+                b"\r\n\r\n", b"\r\nConnection: close\r\n\r\n"
+            )
+            response = await to_thread(request, port, data)
+
+    assert b"d\r\nHello, world!\r\n" in response
+    assert response.endswith(b"x-test: 1\r\n\r\n")
+    assert set(extensions[0]) == {
+        "http.response.trailers",
+        "http.response.zerocopysend",
+        "tls",
+    }
+    assert extensions[0]["tls"]["server_name"] == "localhost"
+
+
+@pytest.mark.anyio
+async def test_trailers_are_expected_per_request():
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-length", b"2")],
+                "trailers": True,
+            }
+        )
+        await send({"type": "http.response.body", "body": b"OK"})
+        await send({"type": "http.response.trailers", "headers": [(b"x-test", b"1")]})
+
+    protocol = get_connected_protocol(app, uvicorn_extended.HTTPProtocol)
+    assert "tls" not in protocol.extensions
+    protocol.data_received(EXPECT_TRAILERS_REQUEST)
+    await protocol.loop.run_one()
+    assert b"x-test: 1" in protocol.transport.buffer
+
+    protocol.transport.clear_buffer()
+    protocol.data_received(SIMPLE_GET_REQUEST)
+    await protocol.loop.run_one()
+    assert protocol.transport.buffer.endswith(b"OK")
+
+
+@pytest.mark.anyio
+async def test_data_received_bound_before_connection_made():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 204})
+        await send({"type": "http.response.body"})
+
+    # `uvloop` binds `data_received` once, before `connection_made`.
+    protocol = uvicorn_extended.HTTPProtocol(
+        config=Config(app=app), server_state=ServerState(), _loop=MockLoop()
+    )
+    data_received = protocol.data_received
+    protocol.connection_made(MockTransport())
+    for _ in range(2):
+        data_received(SIMPLE_GET_REQUEST)
+        await protocol.loop.run_one()
+    assert protocol.transport.buffer.count(b"HTTP/1.1 204 No Content") == 2
+
+    protocol = uvicorn_extended.HTTPProtocol(
+        config=Config(app=app), server_state=ServerState(), _loop=MockLoop()
+    )
+    data_received = protocol.data_received
+    protocol.connection_made(MockTransport())
+    assert protocol in protocol.connections
+    data_received(CONNECTION_PREFACE)
+    # Handed over to the HTTP/2 protocol.
+    assert protocol not in protocol.connections
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "messages, error",
+    [
+        (
+            [{"type": "http.response.body", "body": b""}],
+            "Expected ASGI message 'http.response.start', but got "
+            "'http.response.body'.",
+        ),
+        (
+            [
+                {"type": "http.response.start", "status": 200},
+                {"type": "http.response.start", "status": 200},
+            ],
+            "Expected ASGI message 'http.response.body', but got "
+            "'http.response.start'.",
+        ),
+        (
+            [
+                {"type": "http.response.start", "status": 200, "trailers": True},
+                {"type": "http.response.body", "body": b""},
+                {"type": "http.response.body", "body": b""},
+            ],
+            "Expected ASGI message 'http.response.trailers', but got "
+            "'http.response.body'.",
+        ),
+        (
+            [
+                {"type": "http.response.start", "status": 200},
+                {"type": "http.response.body", "body": b""},
+                {"type": "http.response.body", "body": b""},
+            ],
+            "Unexpected ASGI message 'http.response.body' sent, after response "
+            "already completed.",
+        ),
+    ],
+)
+async def test_unexpected_message(messages, error):
+    errors = []
+
+    async def app(scope, receive, send):
+        try:
+            for message in messages:
+                await send(message)
+        except RuntimeError as exc:
+            errors.append(str(exc))
+
+    protocol = get_connected_protocol(app, uvicorn_extended.HTTPProtocol)
+    protocol.data_received(EXPECT_TRAILERS_REQUEST)
+    await protocol.loop.run_one()
+    assert errors == [error]
+
+
+@pytest.mark.anyio
+async def test_invalid_default_headers():
+    errors = []
+
+    async def app(scope, receive, send):
+        try:
+            await send({"type": "http.response.start", "status": 200})
+        except RuntimeError as exc:
+            errors.append(str(exc))
+
+    protocol = get_connected_protocol(app, uvicorn_extended.HTTPProtocol)
+    # As the server does, with the `headers` of the configuration.
+    protocol.server_state.default_headers = [(b"x-test", b"1\r\nx-injected: 1")]
+    protocol.data_received(SIMPLE_GET_REQUEST)
+    await protocol.loop.run_one()
+    assert errors == ["Invalid HTTP header value."]
+    assert b"x-injected" not in protocol.transport.buffer
+
+
+@pytest.mark.parametrize("ws, expected", [("auto", True), ("none", False)])
+def test_websocket_denial(ws: str, expected: bool):
+    async def app(scope, receive, send):  # pragma: no cover
+        pass
+
+    protocol = get_connected_protocol(app, uvicorn_extended.HTTPProtocol, ws=ws)
+    assert (protocol.ws_protocol_class is WSProtocol) is expected
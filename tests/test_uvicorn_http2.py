@@ -0,0 +1,978 @@
+import asyncio
+
+import h2.config
+import h2.connection
+import h2.events
+import httpx
+import pytest
+from asgi_trailers import StreamingResponse
+from h2.errors import ErrorCodes
+from h2.settings import SettingCodes
+from hpack import Decoder
+from hyperframe.frame import Frame, HeadersFrame
+from uvicorn.config import Config
+from uvicorn_http2 import H2Protocol
+from uvicorn_http2.encoder import HeaderEncoder
+from uvicorn_http2.scheduler import parse_priority
+
+from tests.protocol import get_connected_protocol
+from tests.response import Response
+from tests.utils import run_server
+
+
+def get_h2_client() -> h2.connection.H2Connection:
+    client = h2.connection.H2Connection(
+        config=h2.config.H2Configuration(client_side=True, header_encoding=None)
+    )
+    client.initiate_connection()
+    return client
+
+
+def request_headers(method: bytes = b"GET", path: bytes = b"/") -> list:
+    return [
+        (b":method", method),
+        (b":path", path),
+        (b":scheme", b"http"),
+        (b":authority", b"example.org"),
+    ]
+
+
+def send_request(
+    protocol, client, stream_id: int = 1, path: bytes = b"/", body: bytes = b""
+) -> None:
+    method = b"POST" if body else b"GET"
+    client.send_headers(stream_id, request_headers(method, path), end_stream=not body)
+    if body:
+        client.send_data(stream_id, body, end_stream=True)
+    protocol.data_received(client.data_to_send())
+
+
+def send_body(client, stream_id: int, body: bytes) -> None:
+    for offset in range(0, len(body), client.max_outbound_frame_size):
+        chunk = body[offset : offset + client.max_outbound_frame_size]
+        client.send_data(stream_id, chunk)
+
+
+def receive_events(protocol, client) -> list:
+    events = client.receive_data(protocol.transport.buffer)
+    protocol.transport.clear_buffer()
+    return events
+
+
+def get_response(events: list, stream_id: int = 1) -> tuple:
+    headers: dict = {}
+    body = b""
+    ended = False
+    for event in events:
+        if getattr(event, "stream_id", None) != stream_id:
+            continue
+        if isinstance(event, h2.events.ResponseReceived):
+            headers = dict(event.headers)
+        elif isinstance(event, h2.events.DataReceived):
+            body += event.data
+        elif isinstance(event, h2.events.StreamEnded):
+            ended = True
+    return headers, body, ended
+
+
+@pytest.mark.anyio
+async def test_get_request():
+    app = Response("Hello, world", media_type="text/plain")
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    await protocol.loop.run_one()
+
+    headers, body, ended = get_response(receive_events(protocol, client))
+    assert headers[b":status"] == b"200"
+    assert headers[b"content-type"] == b"text/plain; charset=utf-8"
+    assert body == b"Hello, world"
+    assert ended
+
+
+@pytest.mark.anyio
+async def test_request_scope():
+    scopes = []
+
+    async def app(scope, receive, send):
+        scopes.append(scope)
+        await Response(b"")(scope, receive, send)
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client, path=b"/one%2Ftwo?foo=bar")
+    await protocol.loop.run_one()
+
+    scope = scopes[0]
+    assert scope["http_version"] == "2"
+    assert scope["method"] == "GET"
+    assert scope["path"] == "/one/two"
+    assert scope["raw_path"] == b"/one%2Ftwo"
+    assert scope["query_string"] == b"foo=bar"
+    assert (b"host", b"example.org") in scope["headers"]
+    assert not any(name.startswith(b":") for name, _ in scope["headers"])
+
+
+@pytest.mark.anyio
+async def test_post_request():
+    async def app(scope, receive, send):
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        response = Response(b"Body: " + body, media_type="text/plain")
+        await response(scope, receive, send)
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client, body=b'{"hello": "world"}')
+    await protocol.loop.run_one()
+
+    _, body, ended = get_response(receive_events(protocol, client))
+    assert body == b'Body: {"hello": "world"}'
+    assert ended
+
+
+@pytest.mark.anyio
+async def test_multiplexed_streams():
+    fast_done = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/slow":
+            await fast_done.wait()
+        await Response(scope["path"])(scope, receive, send)
+        if scope["path"] == "/fast":
+            fast_done.set()
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client, stream_id=1, path=b"/slow")
+    send_request(protocol, client, stream_id=3, path=b"/fast")
+    assert len(protocol.streams) == 2
+    await asyncio.gather(protocol.loop.run_one(), protocol.loop.run_one())
+
+    events = receive_events(protocol, client)
+    data = [event for event in events if isinstance(event, h2.events.DataReceived)]
+    assert [event.stream_id for event in data] == [3, 1]
+    assert get_response(events, stream_id=1)[1] == b"/slow"
+    assert get_response(events, stream_id=3)[1] == b"/fast"
+    assert not protocol.streams
+    assert protocol.server_state.total_requests == 2
+
+
+@pytest.mark.anyio
+async def test_connection_specific_headers_are_removed():
+    app = Response(b"", headers={"connection": "keep-alive", "x-test": "1"})
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    await protocol.loop.run_one()
+
+    headers, _, _ = get_response(receive_events(protocol, client))
+    assert b"connection" not in headers
+    assert headers[b"x-test"] == b"1"
+
+
+@pytest.mark.anyio
+async def test_head_request():
+    app = Response("Hello, world", media_type="text/plain")
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    client.send_headers(1, request_headers(b"HEAD"), end_stream=True)
+    protocol.data_received(client.data_to_send())
+    await protocol.loop.run_one()
+
+    headers, body, ended = get_response(receive_events(protocol, client))
+    assert headers[b"content-length"] == b"12"
+    assert body == b""
+    assert ended
+
+
+@pytest.mark.anyio
+async def test_large_response_waits_for_window_update():
+    app = Response(b"x" * 100_000)
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    task = asyncio.ensure_future(protocol.loop.run_one())
+    await asyncio.sleep(0.01)
+
+    _, body, ended = get_response(receive_events(protocol, client))
+    assert len(body) == 65_535
+    assert not ended
+    assert not task.done()
+
+    client.increment_flow_control_window(100_000)
+    client.increment_flow_control_window(100_000, stream_id=1)
+    protocol.data_received(client.data_to_send())
+    await task
+
+    _, body, ended = get_response(receive_events(protocol, client))
+    assert len(body) == 100_000 - 65_535
+    assert ended
+
+
+def window_updates(events: list) -> dict:
+    updates: dict = {}
+    for event in events:
+        if isinstance(event, h2.events.WindowUpdated):
+            updates[event.stream_id] = updates.get(event.stream_id, 0) + event.delta
+    return updates
+
+
+@pytest.mark.anyio
+async def test_window_update_only_when_body_is_consumed():
+    consumed = asyncio.Event()
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        message = await receive()
+        consumed.set()
+        await Response(b"%d" % len(message["body"]))(scope, receive, send)
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    client.send_headers(1, request_headers(b"POST"))
+    send_body(client, 1, b"x" * 40_000)
+    protocol.data_received(client.data_to_send())
+    task = asyncio.ensure_future(protocol.loop.run_one())
+    await asyncio.sleep(0.01)
+
+    assert window_updates(receive_events(protocol, client)).get(1) is None
+
+    release.set()
+    await consumed.wait()
+    assert window_updates(receive_events(protocol, client))[1] == 40_000
+
+    client.end_stream(1)
+    protocol.data_received(client.data_to_send())
+    await task
+
+
+@pytest.mark.anyio
+async def test_unread_body_window_is_handed_back():
+    class CustomH2Protocol(H2Protocol):
+        connection_window_size = 65_535
+
+    app = Response(b"")
+
+    protocol = get_connected_protocol(app, CustomH2Protocol)
+    client = get_h2_client()
+    client.send_headers(1, request_headers(b"POST"))
+    send_body(client, 1, b"x" * 40_000)
+    protocol.data_received(client.data_to_send())
+    await protocol.loop.run_one()
+
+    assert not protocol.streams
+    assert window_updates(receive_events(protocol, client)).get(0) == 40_000
+
+
+@pytest.mark.anyio
+async def test_configurable_window_sizes():
+    class CustomH2Protocol(H2Protocol):
+        initial_window_size = 1_048_576
+        connection_window_size = 4_194_304
+        max_window_size = None
+
+    protocol = get_connected_protocol(Response(b""), CustomH2Protocol)
+    client = get_h2_client()
+    protocol.data_received(client.data_to_send())
+
+    events = receive_events(protocol, client)
+    settings = [e for e in events if isinstance(e, h2.events.RemoteSettingsChanged)]
+    changed = settings[0].changed_settings[SettingCodes.INITIAL_WINDOW_SIZE]
+    assert changed.new_value == 1_048_576
+    assert window_updates(events)[0] == 4_194_304 - 65_535
+    assert protocol.bdp is None
+
+
+@pytest.mark.anyio
+async def test_window_autotuning():
+    async def app(scope, receive, send):
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message["more_body"]
+        await Response(b"")(scope, receive, send)
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    client.send_headers(1, request_headers(b"POST"))
+    send_body(client, 1, b"x" * 60_000)
+    protocol.data_received(client.data_to_send())
+
+    # The PING sent with the first DATA frame is acknowledged by the client.
+    events = receive_events(protocol, client)
+    assert any(isinstance(event, h2.events.PingReceived) for event in events)
+    protocol.data_received(client.data_to_send())
+
+    events = receive_events(protocol, client)
+    settings = [e for e in events if isinstance(e, h2.events.RemoteSettingsChanged)]
+    changed = settings[0].changed_settings[SettingCodes.INITIAL_WINDOW_SIZE]
+    assert changed.new_value == 120_000
+    assert protocol.bdp is not None
+    assert protocol.bdp.window_size == 120_000
+
+    client.end_stream(1)
+    protocol.data_received(client.data_to_send())
+    await protocol.loop.run_one()
+
+
+@pytest.mark.anyio
+async def test_exception_before_response():
+    async def app(scope, receive, send):
+        raise RuntimeError()
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    await protocol.loop.run_one()
+
+    headers, body, _ = get_response(receive_events(protocol, client))
+    assert headers[b":status"] == b"500"
+    assert body == b"Internal Server Error"
+    assert not protocol.transport.is_closing()
+
+
+@pytest.mark.anyio
+async def test_exception_during_response_resets_stream_only():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200})
+        raise RuntimeError()
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    await protocol.loop.run_one()
+
+    events = receive_events(protocol, client)
+    resets = [event for event in events if isinstance(event, h2.events.StreamReset)]
+    assert resets[0].error_code == ErrorCodes.INTERNAL_ERROR
+    assert not protocol.streams
+    assert not protocol.transport.is_closing()
+
+
+@pytest.mark.anyio
+async def test_client_reset_disconnects_stream():
+    messages = []
+
+    async def app(scope, receive, send):
+        messages.append(await receive())
+        messages.append(await receive())
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    client.reset_stream(1)
+    protocol.data_received(client.data_to_send())
+    await protocol.loop.run_one()
+
+    assert messages[1] == {"type": "http.disconnect"}
+    assert not protocol.streams
+
+
+@pytest.mark.anyio
+async def test_refuse_streams_after_shutdown():
+    app = Response(b"")
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    protocol.data_received(client.data_to_send())
+    protocol.shutdown()
+    assert protocol.transport.is_closing()
+
+    events = receive_events(protocol, client)
+    assert any(isinstance(event, h2.events.ConnectionTerminated) for event in events)
+
+
+@pytest.mark.anyio
+async def test_shutdown_waits_for_active_streams():
+    app = Response(b"")
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    protocol.shutdown()
+    assert not protocol.transport.is_closing()
+
+    await protocol.loop.run_one()
+    assert protocol.transport.is_closing()
+
+
+@pytest.mark.anyio
+async def test_keepalive_timeout():
+    app = Response(b"", status_code=204)
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    await protocol.loop.run_one()
+    assert not protocol.transport.is_closing()
+    protocol.loop.run_later(with_delay=1)
+    assert not protocol.transport.is_closing()
+    protocol.loop.run_later(with_delay=5)
+    assert protocol.transport.is_closing()
+
+
+def test_invalid_preface():
+    app = Response(b"")
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    protocol.data_received(b"GET / HTTP/1.1\r\nHost: example.org\r\n\r\n")
+    assert protocol.transport.is_closing()
+
+
+@pytest.mark.anyio
+async def test_concurrent_requests_over_one_connection(unused_tcp_port: int):
+    app = Response("Hello, world", media_type="text/plain")
+
+    config = Config(app=app, http=H2Protocol, lifespan="off", port=unused_tcp_port)
+    async with run_server(config) as server:
+        async with httpx.AsyncClient(http1=False, http2=True) as client:
+            url = f"http://127.0.0.1:{unused_tcp_port}"
+            responses = await asyncio.gather(*[client.get(url) for _ in range(10)])
+
+        assert len(server.server_state.connections) == 1
+
+    assert all(response.http_version == "HTTP/2" for response in responses)
+    assert all(response.text == "Hello, world" for response in responses)
+
+
+@pytest.mark.anyio
+async def test_prior_knowledge(http_protocol):
+    app = Response("Hello, world", media_type="text/plain")
+
+    protocol = get_connected_protocol(app, http_protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    await protocol.loop.run_one()
+
+    headers, body, ended = get_response(receive_events(protocol, client))
+    assert headers[b":status"] == b"200"
+    assert body == b"Hello, world"
+    assert ended
+    assert protocol not in protocol.connections
+
+
+@pytest.mark.anyio
+async def test_prior_knowledge_in_segments(http_protocol):
+    app = Response("Hello, world", media_type="text/plain")
+
+    protocol = get_connected_protocol(app, http_protocol)
+    client = get_h2_client()
+    client.send_headers(1, request_headers(), end_stream=True)
+    data = client.data_to_send()
+    # The preface is split, as a client or proxy may do.
+    for chunk in (data[:3], data[3:10], data[10:]):
+        protocol.data_received(chunk)
+    await protocol.loop.run_one()
+
+    headers, body, ended = get_response(receive_events(protocol, client))
+    assert headers[b":status"] == b"200"
+    assert body == b"Hello, world"
+    assert protocol not in protocol.connections
+
+
+@pytest.mark.anyio
+async def test_request_starting_like_the_preface(http_protocol):
+    app = Response("Hello, world", media_type="text/plain")
+
+    protocol = get_connected_protocol(app, http_protocol)
+    protocol.data_received(b"P")
+    protocol.data_received(b"OST / HTTP/1.1\r\nHost: example.org\r\n")
+    protocol.data_received(b"Content-Length: 0\r\n\r\n")
+    await protocol.loop.run_one()
+    assert protocol.transport.buffer.startswith(b"HTTP/1.1 200 OK")
+    assert protocol in protocol.connections
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "method, path", [(b"GET", b"/caf\xc3\xa9"), (b"G\xc3\x89T", b"/")]
+)
+async def test_non_ascii_request_resets_stream(
+    http_protocol, method: bytes, path: bytes
+):
+    app = Response("Hello, world", media_type="text/plain")
+
+    protocol = get_connected_protocol(app, http_protocol)
+    client = get_h2_client()
+    client.send_headers(1, request_headers(method, path), end_stream=True)
+    send_request(protocol, client, stream_id=3)
+    await protocol.loop.run_one()
+
+    events = receive_events(protocol, client)
+    reset = [event for event in events if isinstance(event, h2.events.StreamReset)]
+    assert [(event.stream_id, event.error_code) for event in reset] == [
+        (1, ErrorCodes.PROTOCOL_ERROR)
+    ]
+    # The connection still serves the other streams.
+    headers, body, _ = get_response(events, stream_id=3)
+    assert headers[b":status"] == b"200"
+    assert body == b"Hello, world"
+
+
+def h2c_upgrade_request(settings: bytes, extra: bytes = b"") -> bytes:
+    return b"\r\n".join(
+        [
+            b"GET /path?foo=bar HTTP/1.1",
+            b"Host: example.org",
+            b"Connection: Upgrade, HTTP2-Settings",
+            b"Upgrade: h2c",
+            b"HTTP2-Settings: " + settings,
+            extra,
+            b"",
+        ]
+    )
+
+
+@pytest.mark.anyio
+async def test_h2c_upgrade(http_protocol):
+    scopes = []
+
+    async def app(scope, receive, send):
+        scopes.append(scope)
+        await Response("Hello, world", media_type="text/plain")(scope, receive, send)
+
+    protocol = get_connected_protocol(app, http_protocol)
+    client = h2.connection.H2Connection(
+        config=h2.config.H2Configuration(client_side=True, header_encoding=None)
+    )
+    settings = client.initiate_upgrade_connection()
+    protocol.data_received(h2c_upgrade_request(settings) + client.data_to_send())
+    await protocol.loop.run_one()
+
+    switching, _, frames = protocol.transport.buffer.partition(b"\r\n\r\n")
+    assert switching.startswith(b"HTTP/1.1 101 Switching Protocols")
+    assert b"upgrade: h2c" in switching
+
+    headers, body, ended = get_response(client.receive_data(frames))
+    assert headers[b":status"] == b"200"
+    assert body == b"Hello, world"
+    assert ended
+
+    scope = scopes[0]
+    assert scope["http_version"] == "2"
+    assert scope["path"] == "/path"
+    assert scope["query_string"] == b"foo=bar"
+    assert (b"host", b"example.org") in scope["headers"]
+    assert not any(name == b"http2-settings" for name, _ in scope["headers"])
+
+
+@pytest.mark.anyio
+async def test_h2c_upgrade_disabled(http_protocol):
+    app = Response("Hello, world", media_type="text/plain")
+    http_protocol = type("HTTPProtocol", (http_protocol,), {"http2": False})
+
+    protocol = get_connected_protocol(app, http_protocol)
+    client = h2.connection.H2Connection(
+        config=h2.config.H2Configuration(client_side=True, header_encoding=None)
+    )
+    settings = client.initiate_upgrade_connection()
+    protocol.data_received(h2c_upgrade_request(settings))
+    await protocol.loop.run_one()
+    assert protocol.transport.buffer.startswith(b"HTTP/1.1 200 OK")
+    assert protocol in protocol.connections
+
+
+@pytest.mark.anyio
+async def test_h2c_upgrade_with_body_is_ignored(http_protocol):
+    app = Response("Hello, world", media_type="text/plain")
+
+    protocol = get_connected_protocol(app, http_protocol)
+    client = h2.connection.H2Connection(
+        config=h2.config.H2Configuration(client_side=True, header_encoding=None)
+    )
+    settings = client.initiate_upgrade_connection()
+    request = h2c_upgrade_request(settings, b"Content-Length: 3\r\n") + b"abc"
+    protocol.data_received(request)
+    await protocol.loop.run_one()
+    assert b"HTTP/1.1 200 OK" in protocol.transport.buffer
+    assert b"Hello, world" in protocol.transport.buffer
+
+
+@pytest.mark.anyio
+async def test_h2c_upgrade_request_body(http_protocol):
+    messages = []
+
+    async def app(scope, receive, send):
+        messages.append(await receive())
+        await Response("Hello, world", media_type="text/plain")(scope, receive, send)
+
+    protocol = get_connected_protocol(app, http_protocol)
+    client = h2.connection.H2Connection(
+        config=h2.config.H2Configuration(client_side=True, header_encoding=None)
+    )
+    settings = client.initiate_upgrade_connection()
+    protocol.data_received(h2c_upgrade_request(settings) + client.data_to_send())
+    await asyncio.wait_for(protocol.loop.run_one(), timeout=1)
+
+    frames = protocol.transport.buffer.partition(b"\r\n\r\n")[2]
+    headers, body, ended = get_response(client.receive_data(frames))
+    assert headers[b":status"] == b"200"
+    assert ended
+    assert messages == [{"type": "http.request", "body": b"", "more_body": False}]
+
+
+@pytest.mark.anyio
+async def test_prior_knowledge_over_http1_server(http_protocol, unused_tcp_port: int):
+    app = Response("Hello, world", media_type="text/plain")
+
+    config = Config(app=app, http=http_protocol, lifespan="off", port=unused_tcp_port)
+    async with run_server(config):
+        async with httpx.AsyncClient(http1=False, http2=True) as client:
+            url = f"http://127.0.0.1:{unused_tcp_port}"
+            responses = await asyncio.gather(*[client.get(url) for _ in range(5)])
+
+    assert all(response.http_version == "HTTP/2" for response in responses)
+    assert all(response.text == "Hello, world" for response in responses)
+
+
+def test_header_encoder_caches_blocks():
+    encoder = HeaderEncoder()
+    decoder = Decoder()
+    headers = [(b":status", b"200"), (b"content-type", b"application/json")]
+
+    blocks = [encoder.encode(iter(headers)) for _ in range(3)]
+    assert all(decoder.decode(block, raw=True) == headers for block in blocks)
+    # The first block adds `content-type` to the table, the others refer to it.
+    assert len(blocks[1]) < len(blocks[0])
+    assert blocks[1] == blocks[2]
+    assert list(encoder.cache.values()) == [blocks[1]]
+
+    other = [(b":status", b"200"), (b"content-type", b"text/plain")]
+    assert decoder.decode(encoder.encode(other), raw=True) == other
+    assert encoder.cache == {}
+
+
+def test_header_encoder_unindexed_headers():
+    encoder = HeaderEncoder()
+    decoder = Decoder()
+
+    for length in (b"12", b"345"):
+        headers = [(b"content-length", length), (b"server", b"uvicorn")]
+        assert decoder.decode(encoder.encode(headers), raw=True) == headers
+
+    assert list(encoder.header_table.dynamic_entries) == [(b"server", b"uvicorn")]
+    assert len(encoder.cache) == 1
+
+
+def test_header_encoder_max_table_size():
+    encoder = HeaderEncoder(max_header_table_size=1_024)
+    decoder = Decoder()
+
+    encoder.header_table_size = 65_536
+    assert encoder.header_table_size == 1_024
+
+    headers = [(b"x-large", b"x" * 2_000), (b"x-small", b"y")]
+    for _ in range(2):
+        assert decoder.decode(encoder.encode(headers), raw=True) == headers
+    assert decoder.header_table_size == 1_024
+    assert list(encoder.header_table.dynamic_entries) == [(b"x-small", b"y")]
+
+
+def headers_frame_length(data: bytes) -> int:
+    while data:
+        frame, length = Frame.parse_frame_header(memoryview(data[:9]))
+        if isinstance(frame, HeadersFrame):
+            return length
+        data = data[9 + length :]
+    raise AssertionError("No HEADERS frame")
+
+
+@pytest.mark.anyio
+async def test_response_headers_are_compressed():
+    lengths = iter(range(1, 100))
+
+    async def app(scope, receive, send):
+        body = b"x" * next(lengths)
+        await Response(body, media_type="application/json")(scope, receive, send)
+
+    class Protocol(H2Protocol):
+        header_table_size = 256
+
+    protocol = get_connected_protocol(app, Protocol)
+    client = get_h2_client()
+    sizes = []
+    for stream_id in range(1, 12, 2):
+        send_request(protocol, client, stream_id=stream_id)
+        await protocol.loop.run_one()
+        frames = protocol.transport.buffer
+        headers, body, _ = get_response(receive_events(protocol, client), stream_id)
+        assert headers[b"content-length"] == str(len(body)).encode()
+        assert headers[b"content-type"] == b"application/json"
+        sizes.append(headers_frame_length(frames))
+
+    assert client.decoder.header_table_size == 256
+    assert sizes[1] < sizes[0]
+    assert len(set(sizes[1:])) == 1
+
+
+async def trailers_app(scope, receive, send):
+    async def trailers():
+        yield "grpc-status", "0"
+        yield "grpc-message", "OK"
+
+    response = StreamingResponse(
+        content=iter([b"Hello, ", b"world"]), trailers=trailers()
+    )
+    await response(scope, receive, send)
+
+
+@pytest.mark.anyio
+async def test_trailers():
+    protocol = get_connected_protocol(trailers_app, H2Protocol)
+    client = get_h2_client()
+    client.send_headers(1, request_headers() + [(b"te", b"trailers")], end_stream=True)
+    protocol.data_received(client.data_to_send())
+    await protocol.loop.run_one()
+
+    events = receive_events(protocol, client)
+    headers, body, ended = get_response(events)
+    assert headers[b":status"] == b"200"
+    assert body == b"Hello, world"
+    assert ended
+    trailers = [e for e in events if isinstance(e, h2.events.TrailersReceived)]
+    assert trailers[0].headers == [(b"grpc-status", b"0"), (b"grpc-message", b"OK")]
+    assert trailers[0].stream_ended is not None
+    assert protocol.streams == {}
+
+
+@pytest.mark.anyio
+async def test_trailers_without_te_header():
+    protocol = get_connected_protocol(trailers_app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    await protocol.loop.run_one()
+
+    events = receive_events(protocol, client)
+    _, body, ended = get_response(events)
+    assert body == b"Hello, world"
+    assert ended
+    assert not any(isinstance(e, h2.events.TrailersReceived) for e in events)
+
+
+@pytest.mark.anyio
+async def test_trailers_scope_extension():
+    scopes = []
+
+    async def app(scope, receive, send):
+        scopes.append(scope)
+        await Response(b"")(scope, receive, send)
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    send_request(protocol, get_h2_client())
+    await protocol.loop.run_one()
+    assert "http.response.trailers" in scopes[0]["extensions"]
+
+
+@pytest.mark.anyio
+async def test_return_without_trailers():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "trailers": True})
+        await send({"type": "http.response.body", "body": b"abc"})
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    client.send_headers(1, request_headers() + [(b"te", b"trailers")], end_stream=True)
+    protocol.data_received(client.data_to_send())
+    await protocol.loop.run_one()
+
+    events = receive_events(protocol, client)
+    resets = [e for e in events if isinstance(e, h2.events.StreamReset)]
+    assert resets[0].error_code == ErrorCodes.INTERNAL_ERROR
+    assert protocol.streams == {}
+
+
+async def push_app(scope, receive, send):
+    if scope["path"] == "/":
+        assert "http.response.push" in scope["extensions"]
+        for path in ("/style.css", "/script.js"):
+            await send({"type": "http.response.push", "path": path, "headers": []})
+        await Response("<html></html>", media_type="text/html")(scope, receive, send)
+    else:
+        assert "http.response.push" not in scope["extensions"]
+        await Response(scope["path"], media_type="text/plain")(scope, receive, send)
+
+
+@pytest.mark.anyio
+async def test_server_push():
+    protocol = get_connected_protocol(push_app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    for _ in range(3):
+        await protocol.loop.run_one()
+
+    events = receive_events(protocol, client)
+    promises = [e for e in events if isinstance(e, h2.events.PushedStreamReceived)]
+    assert [(e.parent_stream_id, e.pushed_stream_id) for e in promises] == [
+        (1, 2),
+        (1, 4),
+    ]
+    assert (b":path", b"/style.css") in promises[0].headers
+    assert (b":authority", b"example.org") in promises[0].headers
+
+    assert get_response(events, 1)[1] == b"<html></html>"
+    assert get_response(events, 2)[1:] == (b"/style.css", True)
+    assert get_response(events, 4)[1:] == (b"/script.js", True)
+    assert protocol.streams == {}
+
+
+@pytest.mark.anyio
+async def test_server_push_request_body():
+    messages = []
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/":
+            await send({"type": "http.response.push", "path": "/a", "headers": []})
+        else:
+            messages.append(await receive())
+        await Response(scope["path"], media_type="text/plain")(scope, receive, send)
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    for _ in range(2):
+        await asyncio.wait_for(protocol.loop.run_one(), timeout=1)
+
+    events = receive_events(protocol, client)
+    assert get_response(events, 2)[1:] == (b"/a", True)
+    assert messages == [{"type": "http.request", "body": b"", "more_body": False}]
+
+
+@pytest.mark.anyio
+async def test_server_push_disabled_by_client():
+    scopes = []
+
+    async def app(scope, receive, send):
+        scopes.append(scope)
+        await send({"type": "http.response.push", "path": "/style.css", "headers": []})
+        await Response(b"")(scope, receive, send)
+
+    protocol = get_connected_protocol(app, H2Protocol)
+    client = get_h2_client()
+    client.update_settings({SettingCodes.ENABLE_PUSH: 0})
+    send_request(protocol, client)
+    await protocol.loop.run_one()
+
+    events = receive_events(protocol, client)
+    assert "http.response.push" not in scopes[0]["extensions"]
+    assert not any(isinstance(e, h2.events.PushedStreamReceived) for e in events)
+    assert get_response(events)[2]
+
+
+@pytest.mark.anyio
+async def test_server_push_budget():
+    class Protocol(H2Protocol):
+        max_concurrent_pushes = 1
+
+    protocol = get_connected_protocol(push_app, Protocol)
+    client = get_h2_client()
+    send_request(protocol, client)
+    for _ in range(2):
+        await protocol.loop.run_one()
+
+    events = receive_events(protocol, client)
+    promises = [e for e in events if isinstance(e, h2.events.PushedStreamReceived)]
+    assert [e.pushed_stream_id for e in promises] == [2]
+    assert get_response(events, 2)[1] == b"/style.css"
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (b"u=1", (1, None)),
+        (b"u=5, i", (5, True)),
+        (b"i=?0, u=0", (0, False)),
+        (b"u=8, i=?1", (None, True)),
+        (b"u=2;foo=bar, x=y", (2, None)),
+        (b"", (None, None)),
+    ],
+)
+def test_parse_priority(value: bytes, expected: tuple):
+    assert parse_priority(value) == expected
+
+
+async def sized_app(scope, receive, send):
+    size = int(scope["path"][1:])
+    await Response(b"x" * size, media_type="application/octet-stream")(
+        scope, receive, send
+    )
+
+
+def get_h2_client_with_large_window() -> h2.connection.H2Connection:
+    client = get_h2_client()
+    client.update_settings({SettingCodes.INITIAL_WINDOW_SIZE: 2**24})
+    client.increment_flow_control_window(2**24)
+    return client
+
+
+def ended_streams(events: list) -> list:
+    return [e.stream_id for e in events if isinstance(e, h2.events.StreamEnded)]
+
+
+async def run_streams(protocol, client, requests: list, extra: bytes = b"") -> list:
+    for stream_id, path, headers in requests:
+        client.send_headers(
+            stream_id, request_headers(path=path) + headers, end_stream=True
+        )
+    protocol.data_received(client.data_to_send() + extra)
+    await asyncio.gather(*[protocol.loop.run_one() for _ in requests])
+    return receive_events(protocol, client)
+
+
+@pytest.mark.anyio
+async def test_small_response_is_not_starved():
+    protocol = get_connected_protocol(sized_app, H2Protocol)
+    client = get_h2_client_with_large_window()
+    requests = [(1, b"/1000000", []), (3, b"/10", [])]
+    events = await run_streams(protocol, client, requests)
+
+    assert ended_streams(events) == [3, 1]
+    assert get_response(events, 1)[1] == b"x" * 1_000_000
+
+
+@pytest.mark.anyio
+async def test_urgency():
+    protocol = get_connected_protocol(sized_app, H2Protocol)
+    client = get_h2_client_with_large_window()
+    requests = [
+        (1, b"/200000", []),
+        (3, b"/200000", [(b"priority", b"u=1")]),
+        (5, b"/200000", [(b"priority", b"u=5")]),
+    ]
+    events = await run_streams(protocol, client, requests)
+
+    assert ended_streams(events) == [3, 1, 5]
+
+
+@pytest.mark.anyio
+async def test_priority_update_frame():
+    protocol = get_connected_protocol(sized_app, H2Protocol)
+    client = get_h2_client_with_large_window()
+    payload = (3).to_bytes(4, "big") + b"u=0"
+    frame = len(payload).to_bytes(3, "big") + b"\x10\x00" + bytes(4) + payload
+    requests = [(1, b"/200000", []), (3, b"/200000", [])]
+    events = await run_streams(protocol, client, requests, extra=frame)
+
+    assert ended_streams(events) == [3, 1]
+
+
+@pytest.mark.anyio
+async def test_incremental_streams_are_interleaved():
+    protocol = get_connected_protocol(sized_app, H2Protocol)
+    client = get_h2_client_with_large_window()
+    incremental = [(b"priority", b"i")]
+    requests = [(1, b"/50000", incremental), (3, b"/50000", incremental)]
+    events = await run_streams(protocol, client, requests)
+
+    data = [e.stream_id for e in events if isinstance(e, h2.events.DataReceived)]
+    assert data[:4] == [1, 3, 1, 3]
+    assert get_response(events, 3)[1] == b"x" * 50_000
@@ -17,3 +17,27 @@ async def test_huge_headers_httparse():
     await protocol.loop.run_one()
     assert b"HTTP/1.1 200 OK" in protocol.transport.buffer
     assert b"Hello, world" in protocol.transport.buffer
+
+
+@pytest.mark.anyio
+async def test_scope_httparse():
+    scopes = []
+
+    async def app(scope, receive, send) -> None:
+        scopes.append(scope)
+        await Response("Hello, world", media_type="text/plain")(scope, receive, send)
+
+    protocol = get_connected_protocol(app, HttparseProtocol)
+    protocol.data_received(b"GET /caf%C3%A9?a=1 HTTP/1.1\r\nHost: example.org\r\n\r\n")
+    protocol.eof_received()
+    await protocol.loop.run_one()
+    (scope,) = scopes
+    assert scope["asgi"] == {"version": "3.0", "spec_version": "2.3"}
+    assert scope["server"] == ("127.0.0.1", 8000)
+    assert scope["client"] == ("127.0.0.1", 8001)
+    assert scope["scheme"] == "http"
+    assert scope["path"] == "/café"
+    # Without the query string, as with the other protocols.
+    assert scope["raw_path"] == b"/caf%C3%A9"
+    assert scope["query_string"] == b"a=1"
+    assert protocol.scope_template["scheme"] == "http"
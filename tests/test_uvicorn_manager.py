@@ -0,0 +1,475 @@
+import asyncio
+import gc
+import http.client
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List
+
+import httpx
+import pytest
+from uvicorn.config import Config
+from uvicorn_manager import Manager, SharedMetrics, memory_usage
+from uvicorn_manager.affinity import numa_nodes, parse_cpu_list, worker_cpus
+from uvicorn_manager.manager import exit_code
+from uvicorn_manager.metrics import BUSY, CONNECTIONS, LAG
+from uvicorn_manager.worker import Worker, WorkerServer, receive_fds, send_fd
+
+ROOT = Path(__file__).parent.parent
+
+# With `preload`, the application is imported by the manager.
+IMPORTED_BY = os.getpid()
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="The manager tests rely on /proc."
+)
+
+
+async def app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/crash":
+        os._exit(1)
+    if scope["path"] == "/slow":
+        await asyncio.sleep(0.2)
+    pid = IMPORTED_BY if scope["path"] == "/imported-by" else os.getpid()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(pid).encode()})
+
+
+def children(pid: int) -> List[int]:
+    path = Path(f"/proc/{pid}/task/{pid}/children")
+    return sorted(int(child) for child in path.read_text().split())
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.05)
+
+
+def get(port: int, path: str = "/") -> httpx.Response:
+    return httpx.get(f"http://127.0.0.1:{port}{path}", headers={"connection": "close"})
+
+
+def is_serving(port: int) -> bool:
+    try:
+        return get(port).status_code == 200
+    except httpx.TransportError:
+        return False
+
+
+@contextmanager
+def run_manager(port: int, workers: int = 2, **kwargs) -> Iterator[subprocess.Popen]:
+    options = ", ".join(f"{key}={value!r}" for key, value in kwargs.items())
+    script = (
+        "import uvicorn_httparse, uvicorn_manager\n"
+        "uvicorn_manager.Manager.backoff = 0.1\n"
+        f"uvicorn_manager.run('tests.test_uvicorn_manager:app', workers={workers},"
+        f" port={port}, http=uvicorn_httparse.HttparseProtocol, {options})\n"
+    )
+    process = subprocess.Popen([sys.executable, "-c", script], cwd=ROOT)
+    try:
+        wait_for(lambda: len(children(process.pid)) == workers)
+        wait_for(lambda: is_serving(port))
+        yield process
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+@pytest.mark.parametrize(
+    "options", [{}, {"reuse_port": True}, {"pass_connections": True}]
+)
+def test_serve(unused_tcp_port: int, options: dict):
+    with run_manager(unused_tcp_port, workers=2, **options) as process:
+        pids = children(process.pid)
+        responses = [get(unused_tcp_port) for _ in range(10)]
+        assert {int(response.text) for response in responses} <= set(pids)
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=10) == 0
+
+
+def test_restart_crashed_worker(unused_tcp_port: int):
+    with run_manager(unused_tcp_port, workers=1) as process:
+        (pid,) = children(process.pid)
+        with pytest.raises(httpx.TransportError):
+            get(unused_tcp_port, "/crash")
+
+        wait_for(lambda: children(process.pid) not in ([], [pid]))
+        wait_for(lambda: is_serving(unused_tcp_port))
+        assert int(get(unused_tcp_port).text) != pid
+
+
+def test_scale_workers(unused_tcp_port: int):
+    with run_manager(unused_tcp_port, workers=2) as process:
+        process.send_signal(signal.SIGTTIN)
+        wait_for(lambda: len(children(process.pid)) == 3)
+
+        process.send_signal(signal.SIGTTOU)
+        wait_for(lambda: len(children(process.pid)) == 2)
+        process.send_signal(signal.SIGTTOU)
+        wait_for(lambda: len(children(process.pid)) == 1)
+
+        # There's always at least one worker.
+        process.send_signal(signal.SIGTTOU)
+        time.sleep(0.5)
+        assert len(children(process.pid)) == 1
+        assert is_serving(unused_tcp_port)
+
+
+def test_reload_workers(unused_tcp_port: int):
+    with run_manager(unused_tcp_port, workers=2) as process:
+        pids = children(process.pid)
+        process.send_signal(signal.SIGHUP)
+
+        def reloaded() -> bool:
+            current = children(process.pid)
+            return len(current) == 2 and not set(current) & set(pids)
+
+        wait_for(reloaded)
+        wait_for(lambda: is_serving(unused_tcp_port))
+        assert int(get(unused_tcp_port).text) not in pids
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{"reload_batch": 1}, {"reload_batch": 2}, {"pass_connections": True}],
+)
+def test_rolling_reload_without_errors(unused_tcp_port: int, options: dict):
+    with run_manager(unused_tcp_port, workers=2, **options) as process:
+        pids = children(process.pid)
+        served: List[int] = []
+        errors: List[Exception] = []
+        done = threading.Event()
+
+        def load(path: str) -> None:
+            while not done.is_set():
+                try:
+                    response = get(unused_tcp_port, path)
+                    assert response.status_code == 200
+                    served.append(int(response.text))
+                except Exception as exc:  # pragma: no cover
+                    errors.append(exc)
+
+        threads = [
+            threading.Thread(target=load, args=(path,))
+            for path in ["/", "/", "/slow", "/slow"]
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            time.sleep(0.5)
+            process.send_signal(signal.SIGHUP)
+
+            def reloaded() -> bool:
+                current = children(process.pid)
+                return len(current) == 2 and not set(current) & set(pids)
+
+            wait_for(reloaded)
+            time.sleep(0.5)
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+
+        assert errors == []
+        assert set(served) & set(pids)
+        assert set(served) - set(pids)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"max_requests": 5, "max_requests_jitter": 2},
+        {"max_rss": 1},
+        {"max_lifetime": 1.0},
+    ],
+)
+def test_recycle_workers(unused_tcp_port: int, options: dict):
+    with run_manager(unused_tcp_port, workers=2, **options) as process:
+        pids = children(process.pid)
+        counts = set()
+
+        def recycled() -> bool:
+            current = children(process.pid)
+            counts.add(len(current))
+            if "max_requests" in options:
+                get(unused_tcp_port)
+            return not set(current) & set(pids)
+
+        wait_for(recycled, timeout=20)
+        # One worker at a time is replaced, and only once its replacement started.
+        assert counts <= {2, 3}
+        assert is_serving(unused_tcp_port)
+
+
+@pytest.mark.parametrize("preload", [False, True])
+def test_preload(unused_tcp_port: int, preload: bool):
+    with run_manager(unused_tcp_port, workers=2, preload=preload) as process:
+        imported_by = int(get(unused_tcp_port, "/imported-by").text)
+        if preload:
+            assert imported_by == process.pid
+        else:
+            assert imported_by in children(process.pid)
+
+
+def test_preload_freezes_once(monkeypatch: pytest.MonkeyPatch):
+    freezes = []
+    monkeypatch.setattr(gc, "freeze", lambda: freezes.append(None))
+    # The workers aren't forked: the manager only sees their pids.
+    pids = iter(range(1 << 22, (1 << 22) + 2))
+    monkeypatch.setattr(os, "fork", lambda: next(pids))
+    manager = Manager(Config(app, lifespan="off"), preload=True)
+    manager.load_app()
+    for index in range(2):
+        worker = manager.spawn_worker(index)
+        os.close(worker.ready_fd)
+    assert len(freezes) == 1
+
+
+def test_memory_usage():
+    usage = memory_usage(os.getpid())
+    assert 0 < usage.uss <= usage.pss <= usage.rss
+
+
+def get_metrics(path: str) -> dict:
+    transport = httpx.HTTPTransport(uds=path)
+    with httpx.Client(transport=transport) as client:
+        response = client.get("http://manager/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    metrics = {}
+    for line in response.text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            metrics[name] = float(value)
+    return metrics
+
+
+def test_metrics(unused_tcp_port: int, tmp_path: Path):
+    path = str(tmp_path / "metrics.sock")
+    with run_manager(unused_tcp_port, workers=2, metrics_uds=path) as process:
+        before = get_metrics(path)
+        for _ in range(5):
+            get(unused_tcp_port, "/slow")
+        after = get_metrics(path)
+        assert after["uvicorn_workers"] == 2
+        assert after["uvicorn_requests_total"] - before["uvicorn_requests_total"] == 5
+        assert after["uvicorn_tls_handshakes_total"] == 0
+        bucket = 'uvicorn_request_duration_seconds_bucket{le="0.1"}'
+        assert after[bucket] == before[bucket]
+        bucket = 'uvicorn_request_duration_seconds_bucket{le="0.25"}'
+        assert after[bucket] - before[bucket] == 5
+        for pid in children(process.pid):
+            assert any(f'pid="{pid}"' in name for name in after)
+            assert any(
+                name.startswith("uvicorn_busy_ratio") and f'pid="{pid}"' in name
+                for name in after
+            )
+
+        # The requests served by the workers that exited are still counted.
+        pids = children(process.pid)
+        process.send_signal(signal.SIGHUP)
+        wait_for(lambda: not set(children(process.pid)) & set(pids))
+        reloaded = get_metrics(path)
+        total = reloaded["uvicorn_requests_total"]
+        assert total == after["uvicorn_requests_total"]
+
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=10)
+        assert not os.path.exists(path)
+
+
+def test_shared_metrics():
+    metrics = SharedMetrics(slots=2)
+    first = metrics.acquire(0)
+    second = metrics.acquire(1)
+    assert first is not None and second is not None
+    assert metrics.acquire(2) is None
+
+    first.observe(0.003)
+    second.observe(0.2)
+    second[CONNECTIONS] = 3
+    assert "uvicorn_requests_total 2\n" in metrics.render()
+    assert "uvicorn_connections 3\n" in metrics.render()
+
+    metrics.release(second)
+    rendered = metrics.render()
+    assert "uvicorn_requests_total 2\n" in rendered
+    assert "uvicorn_connections 0\n" in rendered
+    assert 'uvicorn_request_duration_seconds_bucket{le="0.0025"} 0\n' in rendered
+    assert 'uvicorn_request_duration_seconds_bucket{le="0.005"} 1\n' in rendered
+    assert 'uvicorn_request_duration_seconds_bucket{le="+Inf"} 2\n' in rendered
+    assert "uvicorn_request_duration_seconds_sum 0.203\n" in rendered
+    assert metrics.acquire(1) is not None
+
+
+def test_reuse_port_requires_tcp():
+    config = Config(app, uds="/tmp/uvicorn-manager.sock")
+    with pytest.raises(ValueError):
+        Manager(config, reuse_port=True)
+    with pytest.raises(ValueError):
+        Manager(Config(app), reuse_port=True, pass_connections=True)
+
+
+def test_pass_connections_to_least_loaded(unused_tcp_port: int):
+    with run_manager(unused_tcp_port, workers=2, pass_connections=True) as process:
+        pids = children(process.pid)
+        connections = []
+        try:
+            # Each worker gets half of the connections, that are kept open.
+            for _ in range(10):
+                conn = http.client.HTTPConnection("127.0.0.1", unused_tcp_port)
+                conn.request("GET", "/")
+                connections.append(conn)
+                time.sleep(0.05)
+            served = [int(conn.getresponse().read()) for conn in connections]
+            assert sorted(served.count(pid) for pid in pids) == [5, 5]
+        finally:
+            for conn in connections:
+                conn.close()
+
+
+@pytest.mark.anyio
+async def test_shutdown_closes_idle_connections(unused_tcp_port: int):
+    config = Config(app, port=unused_tcp_port, lifespan="off", log_level="warning")
+    server = WorkerServer(config, ppid=os.getppid(), drain_timeout=5.0)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    writers = []
+
+    async def request(path: str) -> "tuple[asyncio.StreamReader, asyncio.Task]":
+        reader, writer = await asyncio.open_connection("127.0.0.1", unused_tcp_port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        # The connection is closed with its writer.
+        writers.append(writer)
+        return reader, asyncio.create_task(reader.readuntil(b"0\r\n\r\n"))
+
+    # A kept-alive connection, once its response is read, and a request in flight.
+    idle, response = await request("/")
+    await response
+    slow, slow_response = await request("/slow")
+    # And a connection that's yet to send its request.
+    new, writer = await asyncio.open_connection("127.0.0.1", unused_tcp_port)
+    writers.append(writer)
+    await asyncio.sleep(0.05)
+
+    start = time.monotonic()
+    server.should_exit = True
+    await task
+    # The idle connections didn't hold the shutdown until `drain_timeout`.
+    assert time.monotonic() - start < 2.0
+    assert (await slow_response).startswith(b"HTTP/1.1 200 OK")
+    assert await idle.read() == b""
+    assert await slow.read() == b""
+    assert await new.read() == b""
+    for writer in writers:
+        writer.close()
+
+
+def test_send_fd():
+    left, right = socket.socketpair()
+    with left, right, open(__file__, "rb") as file:
+        send_fd(left, file.fileno())
+        message, fds = receive_fds(right, 1)
+        assert message == b"\0"
+        assert len(fds) == 1
+        with open(fds[0], "rb") as received:
+            assert received.read() == Path(__file__).read_bytes()
+
+        left.close()
+        assert receive_fds(right, 1) == (b"", [])
+
+
+@pytest.mark.parametrize(
+    "code, expected", [("0", 0), ("3", 3), ("os.kill(os.getpid(), 9)", -9)]
+)
+def test_exit_code(code: str, expected: int):
+    process = subprocess.Popen(
+        [sys.executable, "-c", f"import os, sys; sys.exit({code})"]
+    )
+    _, status = os.waitpid(process.pid, 0)
+    assert exit_code(status) == expected
+
+
+def test_numa_placement(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    assert parse_cpu_list("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+
+    for node, cpus in (("node0", "0-3"), ("node1", "4-7"), ("node2", "")):
+        (tmp_path / node).mkdir()
+        (tmp_path / node / "cpulist").write_text(cpus + "\n")
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(7)))
+    nodes = numa_nodes(str(tmp_path))
+    assert nodes == [[0, 1, 2, 3], [4, 5, 6]]
+    assert numa_nodes(str(tmp_path / "missing")) == [list(range(7))]
+
+    cores = [worker_cpus(index, nodes, per_core=True) for index in range(8)]
+    assert cores == [[0], [4], [1], [5], [2], [6], [3], [4]]
+    assert worker_cpus(1, nodes, per_core=False) == [4, 5, 6]
+
+
+@pytest.mark.parametrize("cpu_affinity", ["core", "node"])
+def test_cpu_affinity(unused_tcp_port: int, cpu_affinity: str):
+    available = os.sched_getaffinity(0)
+    options = {"cpu_affinity": cpu_affinity, "reuse_port": True}
+    with run_manager(unused_tcp_port, workers=2, **options) as process:
+        for pid in children(process.pid):
+            cpus = os.sched_getaffinity(pid)
+            assert cpus <= available
+            if cpu_affinity == "core":
+                assert len(cpus) == 1
+        assert is_serving(unused_tcp_port)
+
+
+def test_cpu_affinity_values():
+    with pytest.raises(ValueError):
+        Manager(Config(app), cpu_affinity="socket")
+
+
+def test_autoscale():
+    manager = Manager(Config(app), workers=2, min_workers=1, max_workers=3)
+    manager.autoscale_interval = 0.0
+    manager.scale_down_samples = 2
+
+    def add_worker(index: int) -> None:
+        worker = Worker(index, pid=1000 + index)
+        worker.metrics = manager.metrics.acquire(index)
+        manager.workers[worker.pid] = worker
+
+    def sample(busy: float, lag: float = 0.0) -> int:
+        for worker in manager.workers.values():
+            assert worker.metrics is not None
+            worker.metrics[BUSY] = int(busy * 1000)
+            worker.metrics[LAG] = int(lag * 1_000_000)
+        manager.autoscale()
+        return manager.num_workers
+
+    add_worker(0)
+    add_worker(1)
+    # Between the thresholds, nothing changes.
+    assert [sample(0.5) for _ in range(5)] == [2] * 5
+    # Scaling up requires consecutive samples above a threshold.
+    assert [sample(0.9), sample(0.5), sample(0.1, lag=0.2), sample(0.9)] == [2] * 4
+    assert sample(0.9) == 3
+    # No sample is taken until the new worker runs.
+    assert sample(0.1) == 3
+    add_worker(2)
+    assert [sample(0.9) for _ in range(3)] == [3, 3, 3]
+
+    assert [sample(0.1), sample(0.1)] == [3, 2]
+    del manager.workers[1002]
+    assert [sample(0.1), sample(0.1)] == [2, 1]
+    del manager.workers[1001]
+    assert [sample(0.1), sample(0.1)] == [1, 1]
@@ -0,0 +1,100 @@
+import pytest
+import uvicorn_extended
+import uvicorn_httparse
+import uvicorn_tls
+import uvicorn_trailers
+from uvicorn_target import DEFAULT_TARGET_DECODER, TargetDecoder, decode_target
+
+from tests.protocol import get_connected_protocol
+from tests.response import Response
+
+
+@pytest.mark.parametrize(
+    "target, expected",
+    [
+        (b"/", ("/", b"/", b"")),
+        (b"/a/b?x=1&y=2", ("/a/b", b"/a/b", b"x=1&y=2")),
+        (b"/a?b?c", ("/a", b"/a", b"b?c")),
+        (b"/a?x#f", ("/a", b"/a", b"x")),
+        (b"/a#f?x", ("/a", b"/a", b"")),
+        (b"//double/slash", ("//double/slash", b"//double/slash", b"")),
+        (b"/caf%C3%A9?q=%20", ("/café", b"/caf%C3%A9", b"q=%20")),
+        (b"/%2F%zz", ("//%zz", b"/%2F%zz", b"")),
+        (b"http://example.org/a?x=1", ("/a", b"/a", b"x=1")),
+        (b"http://example.org", ("/", b"/", b"")),
+        (b"*", ("*", b"*", b"")),
+        (b"example.org:443", ("example.org:443", b"example.org:443", b"")),
+    ],
+)
+def test_decode_target(target, expected):
+    assert decode_target(target) == expected
+    assert TargetDecoder()(target) == expected
+
+
+def test_decode_target_str():
+    assert decode_target("/caf%C3%A9?x=1") == ("/café", b"/caf%C3%A9", b"x=1")
+    with pytest.raises(UnicodeError):
+        decode_target("/café")
+
+
+def test_decode_target_non_ascii():
+    with pytest.raises(UnicodeError):
+        decode_target("/café".encode())
+    with pytest.raises(UnicodeError):
+        TargetDecoder()("/café?x=1".encode())
+
+
+def test_target_decoder_cache():
+    decoder = TargetDecoder(maxsize=2, max_length=16)
+    for target in [b"/a", b"/b", b"/a", b"/c", b"/a", b"/b"]:
+        decoder(target)
+    # `/b` was evicted by `/c`, when `/a` was used last.
+    assert decoder.stats() == {"targets": 2, "hits": 2, "misses": 4, "bypassed": 0}
+
+    # Only the path is cached, without the query string.
+    assert decoder(b"/a?page=2") == ("/a", b"/a", b"page=2")
+    assert decoder(b"/a?" + b"x" * 32) == ("/a", b"/a", b"x" * 32)
+    assert decoder.stats()["hits"] == 4
+
+    long_path = b"/" + b"x" * 16
+    assert decoder(long_path) == (long_path.decode(), long_path, b"")
+    assert decoder(long_path + b"?y") == (long_path.decode(), long_path, b"y")
+    assert decoder.stats()["bypassed"] == 2
+    assert decoder.stats()["targets"] == 2
+
+    decoder.clear()
+    assert decoder.stats() == {"targets": 0, "hits": 0, "misses": 0, "bypassed": 0}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "http_protocol",
+    [
+        uvicorn_trailers.HTTPProtocol,
+        uvicorn_extended.HTTPProtocol,
+        uvicorn_tls.HTTPProtocol,
+        uvicorn_httparse.HttparseProtocol,
+    ],
+)
+async def test_protocols_share_the_decoder(http_protocol):
+    scopes = []
+
+    async def app(scope, receive, send):
+        scopes.append(scope)
+        await Response("Hello, world", media_type="text/plain")(scope, receive, send)
+
+    assert http_protocol.target_decoder is DEFAULT_TARGET_DECODER
+    decoder = TargetDecoder()
+
+    class HTTPProtocol(http_protocol):
+        target_decoder = decoder
+
+    protocol = get_connected_protocol(app, HTTPProtocol)
+    protocol.data_received(b"GET /caf%C3%A9?a=1 HTTP/1.1\r\nHost: example.org\r\n\r\n")
+    protocol.eof_received()
+    await protocol.loop.run_one()
+    (scope,) = scopes
+    assert scope["path"] == "/café"
+    assert scope["raw_path"] == b"/caf%C3%A9"
+    assert scope["query_string"] == b"a=1"
+    assert decoder.stats()["misses"] == 1
@@ -0,0 +1,636 @@
+import asyncio
+import http.client
+import json
+import os
+import shutil
+import socket
+import ssl
+import sys
+from asyncio.sslproto import SSLProtocol
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+import uvicorn_tls
+from uvicorn.config import Config
+from uvicorn_tls.buffers import ADOPTING_VERSIONS
+from uvicorn_tls.extension import distinguished_name
+from uvicorn_tls.ktls import OP_ENABLE_KTLS, copy_file, enable_ktls, ktls_send_enabled
+from uvicorn_tls.openssl import get_session_cache_size
+from uvicorn_tls.resumption import SessionResumption, load_secret
+from uvicorn_tls.sni import SNIContexts
+
+from tests.utils import run_server, to_thread
+
+CERTS = Path(__file__).parent / "certs"
+
+
+def client_context(cert: bool = True) -> ssl.SSLContext:
+    context = ssl.create_default_context(cafile=str(CERTS / "ca.pem"))
+    if cert:
+        context.load_cert_chain(CERTS / "client.pem", CERTS / "client.key")
+    return context
+
+
+def get(port: int, context: ssl.SSLContext, requests: int = 1) -> List[Any]:
+    connection = http.client.HTTPSConnection("localhost", port, context=context)
+    try:
+        bodies = []
+        for _ in range(requests):
+            connection.request("GET", "/")
+            bodies.append(json.loads(connection.getresponse().read()))
+        return bodies
+    finally:
+        connection.close()
+
+
+def ssl_config(app: Any, port: int, **kwargs: Any) -> Config:
+    return Config(
+        app=app,
+        port=port,
+        ssl_certfile=str(CERTS / "server.pem"),
+        ssl_keyfile=str(CERTS / "server.key"),
+        lifespan="off",
+        **kwargs,
+    )
+
+
+async def hello_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"Hello, world!"})
+
+
+# The sessions can only be resumed by the context that created them.
+RESUMING_CONTEXT = client_context(cert=False)
+
+
+def connect(
+    port: int, session: Optional[ssl.SSLSession] = None
+) -> Tuple[ssl.SSLSession, bool]:
+    """
+    Make a request on a new connection, and return its TLS session, and whether
+    it was resumed from `session`.
+    """
+    context = RESUMING_CONTEXT
+    with socket.create_connection(("127.0.0.1", port)) as raw:
+        with context.wrap_socket(
+            raw, server_hostname="localhost", session=session
+        ) as sock:
+            sock.sendall(
+                b"GET / HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n"
+            )
+            while sock.recv(4096):
+                pass
+            assert sock.session is not None
+            return sock.session, sock.session_reused
+
+
+@pytest.mark.anyio
+async def test_tls_extension(unused_tcp_port: int):
+    extensions: List[Dict[str, Any]] = []
+
+    async def app(scope, receive, send):
+        extensions.append(scope["extensions"]["tls"])
+        body = json.dumps(scope["extensions"]["tls"]).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": body})
+
+    config = Config(
+        app=app,
+        http=uvicorn_tls.HTTPProtocol,
+        port=unused_tcp_port,
+        ssl_certfile=str(CERTS / "server.pem"),
+        ssl_keyfile=str(CERTS / "server.key"),
+        ssl_ca_certs=str(CERTS / "ca.pem"),
+        ssl_cert_reqs=ssl.CERT_OPTIONAL,
+        lifespan="off",
+    )
+    async with run_server(config):
+        bodies = await to_thread(get, unused_tcp_port, client_context(), 2)
+        anonymous = await to_thread(get, unused_tcp_port, client_context(cert=False))
+
+    tls = bodies[0]
+    assert tls["server_cert"] == (CERTS / "server.pem").read_text()
+    assert tls["client_cert_chain"] == [(CERTS / "client.pem").read_text()]
+    assert tls["client_cert_name"] == "CN=client,O=Uvicorn Extensions,C=BR"
+    assert tls["client_cert_error"] is None
+    assert tls["tls_version"] == 0x0304
+    assert tls["cipher_suite"] in (0x1301, 0x1302, 0x1303)
+    assert tls["server_name"] == "localhost"
+    # The extension is computed once per connection.
+    assert bodies[1] == tls
+    assert extensions[0] is extensions[1]
+
+    assert anonymous[0]["client_cert_chain"] == []
+    assert anonymous[0]["client_cert_name"] is None
+    assert anonymous[0]["server_cert"] == tls["server_cert"]
+
+
+@pytest.mark.anyio
+async def test_no_tls_extension(unused_tcp_port: int):
+    async def app(scope, receive, send):
+        body = json.dumps("tls" in scope.get("extensions", {})).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": body})
+
+    config = Config(
+        app=app, http=uvicorn_tls.HTTPProtocol, port=unused_tcp_port, lifespan="off"
+    )
+    async with run_server(config):
+        connection = http.client.HTTPConnection("127.0.0.1", unused_tcp_port)
+        await to_thread(connection.request, "GET", "/")
+        response = await to_thread(connection.getresponse)
+        assert json.loads(response.read()) is False
+        connection.close()
+
+
+def test_distinguished_name():
+    name = (
+        (("countryName", "BR"),),
+        (("organizationName", "Uvicorn, Extensions"),),
+        (("commonName", " client"), ("userId", "#1")),
+    )
+    expected = "CN=\\ client+UID=\\#1,O=Uvicorn\\, Extensions,C=BR"
+    assert distinguished_name(name) == expected
+
+
+def bind() -> socket.socket:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def resuming_protocol(resumption: SessionResumption) -> type:
+    return type(
+        "HTTPProtocol",
+        (uvicorn_tls.HTTPProtocol,),
+        {"session_resumption": resumption},
+    )
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "shared_secret, use_ctypes", [(True, True), (False, True), (True, False)]
+)
+async def test_session_resumption(
+    tmp_path: Path, shared_secret: bool, use_ctypes: bool
+):
+    secret_path = str(tmp_path / "secret")
+    resumptions = []
+    ports = []
+    async with AsyncExitStack() as stack:
+        # Each server stands for a worker, with its own `SSLContext`.
+        for _ in range(2):
+            secret = load_secret(secret_path) if shared_secret else None
+            resumption = SessionResumption(secret, use_ctypes=use_ctypes)
+            sock = stack.enter_context(bind())
+            config = ssl_config(hello_app, 0, http=resuming_protocol(resumption))
+            await stack.enter_async_context(run_server(config, sockets=[sock]))
+            resumptions.append(resumption)
+            ports.append(sock.getsockname()[1])
+
+        session, reused = await to_thread(connect, ports[0])
+        assert not reused
+        _, reused = await to_thread(connect, ports[0], session)
+        assert reused
+        _, reused = await to_thread(connect, ports[1], session)
+        # Without `use_ctypes`, each context has a ticket key of its own.
+        assert reused is (shared_secret and use_ctypes)
+
+    assert resumptions[0].stats() == {"handshakes": 2, "resumed": 1, "hit_rate": 0.5}
+    if use_ctypes:
+        assert config.ssl is not None
+        assert get_session_cache_size(config.ssl) == resumptions[1].cache_size
+
+
+@pytest.mark.anyio
+async def test_ticket_key_rotation(monkeypatch: pytest.MonkeyPatch):
+    resumption = SessionResumption(rotation_interval=60.0, use_ctypes=True)
+    config = ssl_config(hello_app, 0, http=resuming_protocol(resumption))
+    with bind() as sock:
+        port = sock.getsockname()[1]
+        async with run_server(config, sockets=[sock]):
+            session, _ = await to_thread(connect, port)
+            _, reused = await to_thread(connect, port, session)
+            assert reused
+
+            # The tickets of the previous period are still accepted, and renewed.
+            epoch = resumption.epoch()
+            monkeypatch.setattr(resumption, "epoch", lambda now=None: epoch + 1)
+            renewed, reused = await to_thread(connect, port, session)
+            assert reused
+
+            # Those of the period before are rejected.
+            monkeypatch.setattr(resumption, "epoch", lambda now=None: epoch + 2)
+            _, reused = await to_thread(connect, port, session)
+            assert not reused
+            _, reused = await to_thread(connect, port, renewed)
+            assert reused
+    assert sorted(resumption.keys) == [epoch + 1, epoch + 2]
+
+
+@pytest.mark.anyio
+async def test_contexts_configured_once(monkeypatch: pytest.MonkeyPatch):
+    resumption = SessionResumption(use_ctypes=True)
+    configured = []
+    monkeypatch.setattr(resumption, "configure", configured.append)
+    config = ssl_config(hello_app, 0, http=resuming_protocol(resumption))
+    with bind() as sock:
+        port = sock.getsockname()[1]
+        async with run_server(config, sockets=[sock]):
+            await to_thread(connect, port)
+            await to_thread(connect, port)
+    assert configured == [config.ssl]
+
+
+def test_load_secret(tmp_path: Path):
+    path = str(tmp_path / "secret")
+    secret = load_secret(path)
+    assert len(secret) == 32
+    assert load_secret(path) == secret
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def sni_protocol(sni: SNIContexts) -> type:
+    return type("HTTPProtocol", (uvicorn_tls.HTTPProtocol,), {"sni": sni})
+
+
+def peer_cert(port: int, server_name: str) -> bytes:
+    context = ssl.create_default_context(cafile=str(CERTS / "ca.pem"))
+    with socket.create_connection(("127.0.0.1", port)) as raw:
+        with context.wrap_socket(raw, server_hostname=server_name) as sock:
+            sock.sendall(b"GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+            while sock.recv(4096):
+                pass
+            cert = sock.getpeercert(binary_form=True)
+            assert cert is not None
+            return cert
+
+
+def der(path: Path) -> bytes:
+    return ssl.PEM_cert_to_DER_cert(path.read_text())
+
+
+@pytest.mark.anyio
+async def test_sni():
+    certificates = {
+        name: (str(CERTS / f"{name}.pem"), str(CERTS / f"{name}.key"))
+        for name in ("example.com", "example.org")
+    }
+    wildcard = CERTS / "wildcard.example.net"
+    certificates["*.example.net"] = (f"{wildcard}.pem", f"{wildcard}.key")
+    sni = SNIContexts(certificates, maxsize=2, reload_interval=None)
+    assert sni.stats()["contexts"] == 2
+
+    extensions = []
+
+    async def app(scope, receive, send):
+        extensions.append(scope["extensions"]["tls"])
+        await hello_app(scope, receive, send)
+
+    config = ssl_config(app, 0, http=sni_protocol(sni))
+    with bind() as sock:
+        port = sock.getsockname()[1]
+        async with run_server(config, sockets=[sock]):
+            for name, path in [
+                ("example.com", CERTS / "example.com.pem"),
+                ("example.org", CERTS / "example.org.pem"),
+                ("api.example.net", CERTS / "wildcard.example.net.pem"),
+                ("localhost", CERTS / "server.pem"),
+                ("example.com", CERTS / "example.com.pem"),
+            ]:
+                assert await to_thread(peer_cert, port, name) == der(path)
+
+    # The wildcard certificate evicted the one of `example.com`.
+    assert sni.stats() == {"contexts": 2, "hits": 2, "misses": 2, "reloads": 0}
+    # The requests see the certificate of their server name.
+    assert extensions[1]["server_name"] == "example.org"
+    assert extensions[1]["server_cert"] == (CERTS / "example.org.pem").read_text()
+    assert extensions[3]["server_name"] == "localhost"
+    assert extensions[3]["server_cert"] == (CERTS / "server.pem").read_text()
+
+
+@pytest.mark.anyio
+async def test_sni_reload(tmp_path: Path):
+    certfile, keyfile = tmp_path / "cert.pem", tmp_path / "cert.key"
+    shutil.copy(CERTS / "example.com.pem", certfile)
+    shutil.copy(CERTS / "example.com.key", keyfile)
+    sni = SNIContexts({"example.com": (str(certfile), str(keyfile))})
+    assert sni.reload() == 0
+
+    # A certificate for another name, just to tell them apart.
+    shutil.copy(CERTS / "example.org.pem", certfile)
+    shutil.copy(CERTS / "example.org.key", keyfile)
+    os.utime(certfile, (0, 0))
+    assert sni.reload() == 1
+    entry = sni.get((str(certfile), str(keyfile)))
+    assert entry.server_cert == (CERTS / "example.org.pem").read_text()
+
+    # A certificate that doesn't match the key isn't loaded.
+    shutil.copy(CERTS / "example.com.pem", certfile)
+    os.utime(certfile, (1, 1))
+    assert sni.reload() == 0
+    assert sni.get((str(certfile), str(keyfile))) is entry
+
+
+def ktls_protocol() -> type:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERTS / "server.pem", CERTS / "server.key")
+    # Without the constant of the `ssl` module, the option isn't guessed.
+    assert enable_ktls(context) is (OP_ENABLE_KTLS is not None)
+    return type("HTTPProtocol", (uvicorn_tls.HTTPProtocol,), {"ktls_context": context})
+
+
+def download(
+    port: int, context: Optional[ssl.SSLContext], paths: List[str]
+) -> List[Tuple[str, bytes]]:
+    connection: http.client.HTTPConnection
+    if context is None:
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+    else:
+        connection = http.client.HTTPSConnection("localhost", port, context=context)
+    responses = []
+    for path in paths:
+        method = "HEAD" if path == "/head" else "GET"
+        connection.request(method, path)
+        response = connection.getresponse()
+        responses.append((response.getheader("transfer-encoding"), response.read()))
+    connection.close()
+    return responses
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("transport", ["http", "https", "ktls"])
+@pytest.mark.parametrize("loop_sendfile", [True, False])
+async def test_zerocopysend(
+    tmp_path: Path, transport: str, loop_sendfile: bool, monkeypatch: pytest.MonkeyPatch
+):
+    if not loop_sendfile:
+        # As with `uvloop`, that doesn't implement `loop.sendfile`.
+        monkeypatch.setattr(
+            asyncio.AbstractEventLoop, "sendfile", asyncio.AbstractEventLoop.sendfile
+        )
+        monkeypatch.delattr(asyncio.BaseEventLoop, "sendfile")
+    content = os.urandom(1 << 20)
+    path = tmp_path / "file"
+    path.write_bytes(content)
+    schemes = []
+
+    async def app(scope, receive, send):
+        schemes.append(scope["scheme"])
+        assert "http.response.zerocopysend" in scope["extensions"]
+        assert ("tls" in scope["extensions"]) is (transport != "http")
+        with open(path, "rb") as file:
+            if scope["path"] == "/chunked":
+                headers = []
+            else:
+                headers = [(b"content-length", b"1000")]
+            await send(
+                {"type": "http.response.start", "status": 200, "headers": headers}
+            )
+            if scope["path"] == "/chunked":
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file,
+                        "more_body": True,
+                    }
+                )
+                await send({"type": "http.response.body", "body": b"!"})
+            else:
+                message = {"type": "http.response.zerocopysend", "file": file}
+                await send({**message, "offset": 10, "count": 1000})
+
+    kwargs: Dict[str, Any] = {"http": uvicorn_tls.HTTPProtocol}
+    if transport == "ktls":
+        kwargs["http"] = ktls_protocol()
+    if transport == "https":
+        config = ssl_config(app, 0, **kwargs)
+    else:
+        config = Config(app=app, port=0, lifespan="off", **kwargs)
+    context = None if transport == "http" else client_context(cert=False)
+    with bind() as sock:
+        port = sock.getsockname()[1]
+        async with run_server(config, sockets=[sock]):
+            responses = await to_thread(
+                download, port, context, ["/", "/chunked", "/head"]
+            )
+
+    assert responses == [
+        (None, content[10:1010]),
+        ("chunked", content + b"!"),
+        (None, b""),
+    ]
+    assert set(schemes) == {"http" if transport == "http" else "https"}
+
+
+@pytest.mark.anyio
+async def test_copy_file(tmp_path: Path):
+    class Transport(asyncio.Transport):
+        def __init__(self) -> None:
+            super().__init__()
+            self.buffer = b""
+
+        def write(self, data: bytes) -> None:
+            self.buffer += data
+
+        def is_closing(self) -> bool:
+            return False
+
+    path = tmp_path / "file"
+    path.write_bytes(b"Hello, world!")
+    transport = Transport()
+    with open(path, "rb") as file:
+        # The file is shorter than `count`.
+        await copy_file(transport, file, 7, 1000, None)
+    assert transport.buffer == b"world!"
+
+
+def plain_request(port: int) -> bytes:
+    response = b""
+    with socket.create_connection(("127.0.0.1", port)) as client:
+        client.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        try:
+            while chunk := client.recv(4096):
+                response += chunk
+        except ConnectionResetError:
+            pass
+    return response
+
+
+@pytest.mark.anyio
+async def test_ktls_transport_handshake_failure():
+    config = Config(app=hello_app, http=ktls_protocol(), port=0, lifespan="off")
+    with bind() as sock:
+        port = sock.getsockname()[1]
+        async with run_server(config, sockets=[sock]):
+            # A plain HTTP request fails the handshake, and closes the connection.
+            response = await to_thread(plain_request, port)
+            assert not response.startswith(b"HTTP")
+
+            # The TLS clients are served.
+            _, reused = await to_thread(connect, port)
+            assert not reused
+
+
+def test_ktls_send_enabled():
+    with socket.socket() as sock:
+        assert not ktls_send_enabled(sock)
+
+
+def close_notified(port: int) -> bytes:
+    context = client_context(cert=False)
+    with socket.create_connection(("127.0.0.1", port)) as raw_sock:
+        # A truncated connection raises `ssl.SSLEOFError`.
+        with context.wrap_socket(
+            raw_sock, server_hostname="localhost", suppress_ragged_eofs=False
+        ) as client:
+            client.sendall(
+                b"GET / HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n"
+            )
+            response = b""
+            while chunk := client.recv(4096):
+                response += chunk
+            return response
+
+
+@pytest.mark.anyio
+async def test_ktls_transport_close_notify():
+    config = Config(app=hello_app, http=ktls_protocol(), port=0, lifespan="off")
+    with bind() as sock:
+        port = sock.getsockname()[1]
+        async with run_server(config, sockets=[sock]):
+            response = await to_thread(close_notified, port)
+    assert response.startswith(b"HTTP/1.1 200 OK")
+
+
+def ktls_available() -> bool:
+    if OP_ENABLE_KTLS is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        ulps = Path("/proc/sys/net/ipv4/tcp_available_ulp").read_text().split()
+    except OSError:
+        return False
+    return "tls" in ulps
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(not ktls_available(), reason="Kernel TLS isn't available.")
+async def test_ktls_sendfile(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    content = os.urandom(1 << 20)
+    path = tmp_path / "file"
+    path.write_bytes(content)
+    sendfile_calls = []
+    sendfile = os.sendfile
+
+    def os_sendfile(out_fd: int, in_fd: int, offset: int, count: int) -> int:
+        sendfile_calls.append(count)
+        return sendfile(out_fd, in_fd, offset, count)
+
+    monkeypatch.setattr(os, "sendfile", os_sendfile)
+
+    async def app(scope, receive, send):
+        with open(path, "rb") as file:
+            headers = [(b"content-length", b"1000")]
+            await send(
+                {"type": "http.response.start", "status": 200, "headers": headers}
+            )
+            await send(
+                {
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": 10,
+                    "count": 1000,
+                }
+            )
+
+    config = Config(app=app, http=ktls_protocol(), port=0, lifespan="off")
+    with bind() as sock:
+        port = sock.getsockname()[1]
+        async with run_server(config, sockets=[sock]):
+            responses = await to_thread(
+                download, port, client_context(cert=False), ["/"]
+            )
+
+    assert responses == [(None, content[10:1010])]
+    if not sendfile_calls:
+        pytest.skip("OpenSSL isn't built with kernel TLS.")
+
+
+def upload(port: int, body: bytes) -> bytes:
+    connection = http.client.HTTPSConnection(
+        "localhost", port, context=client_context(cert=False)
+    )
+    try:
+        connection.request("POST", "/", body=body)
+        return connection.getresponse().read()
+    finally:
+        connection.close()
+
+
+@pytest.mark.anyio
+@pytest.mark.skipif(
+    sys.version_info[:2] not in ADOPTING_VERSIONS,
+    reason="The read buffers are only replaced on the tested versions.",
+)
+async def test_ssl_buffers():
+    buffers = []
+
+    class HTTPProtocol(uvicorn_tls.HTTPProtocol):
+        ssl_buffers = uvicorn_tls.SSLBuffers(read_size=16 * 1024)
+
+        def connection_made(self, transport):
+            super().connection_made(transport)
+            buffers.append(transport._ssl_protocol._ssl_buffer)
+
+    async def app(scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": body[::-1]})
+
+    config = ssl_config(app, 0, http=HTTPProtocol)
+    bodies = [os.urandom(1 << 20) for _ in range(2)]
+    with bind() as sock:
+        port = sock.getsockname()[1]
+        async with run_server(config, sockets=[sock]):
+            # The uploads are read concurrently, in the same buffer.
+            responses = await asyncio.gather(
+                *(to_thread(upload, port, body) for body in bodies)
+            )
+
+    assert responses == [body[::-1] for body in bodies]
+    assert len(buffers) == 2
+    assert buffers[0] is buffers[1]
+    assert len(buffers[0]) == 16 * 1024
+
+
+@pytest.mark.skipif(
+    sys.version_info[:2] not in ADOPTING_VERSIONS,
+    reason="The read buffers are only replaced on the tested versions.",
+)
+def test_ssl_buffers_checks_the_transport():
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    loop = asyncio.new_event_loop()
+    try:
+        protocol = SSLProtocol(loop, asyncio.Protocol(), context, None, True)
+        transport = protocol._app_transport
+        buffers = uvicorn_tls.SSLBuffers(read_size=1024)
+
+        # Not the buffer the transport allocated: it's left as it is.
+        protocol._ssl_buffer_view = memoryview(bytearray(protocol.max_size))
+        assert not buffers.adopt(transport)
+        protocol._ssl_buffer = b""
+        assert not buffers.adopt(transport)
+
+        protocol._ssl_buffer = bytearray(protocol.max_size)
+        protocol._ssl_buffer_view = memoryview(protocol._ssl_buffer)
+        assert buffers.adopt(transport)
+        assert len(protocol._ssl_buffer) == protocol.max_size == 1024
+    finally:
+        loop.close()
@@ -188,3 +188,27 @@ async def test_head_request_with_trailers(http_protocol):
     assert b"HTTP/1.1 200 OK" in protocol.transport.buffer
     assert b"Hello, world" not in protocol.transport.buffer
     assert b"x-trailer-test: test" not in protocol.transport.buffer
+
+
+@pytest.mark.anyio
+async def test_scope_per_request(http_protocol):
+    scopes = []
+
+    async def app(scope, receive, send) -> None:
+        if not scopes:
+            scope["asgi"]["spec_version"] = "2.4"
+            scope["extensions"]["http.response.debug"] = {}
+        scopes.append(scope)
+        await send({"type": "http.response.start", "status": 204})
+        await send({"type": "http.response.body"})
+
+    protocol = get_connected_protocol(app, http_protocol)
+    for _ in range(2):
+        protocol.data_received(SIMPLE_GET_REQUEST)
+        await protocol.loop.run_one()
+    first, second = scopes
+    assert first is not second
+    assert second["asgi"] == {"version": "3.0", "spec_version": "2.3"}
+    assert "http.response.debug" not in second["extensions"]
+    assert second["client"] == first["client"] == ("127.0.0.1", 8001)
+    assert second["path"] == "/"
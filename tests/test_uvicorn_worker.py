@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+import pytest
+import uvicorn_httparse
+from uvicorn.config import HTTP_PROTOCOLS, Config
+from uvicorn_worker import UvicornWorker, UvloopWorker, WorkerServer
+from uvicorn_worker.workers import resolve_protocol
+
+ROOT = Path(__file__).parent.parent
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="Gunicorn doesn't run on Windows."
+)
+
+
+async def app(scope, receive, send):
+    if scope["type"] != "http":
+        return
+    body = {"pid": os.getpid(), "extensions": sorted(scope.get("extensions", {}))}
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+class TrailersWorker(UvicornWorker):
+    CONFIG_KWARGS = {"loop": "asyncio", "http": "uvicorn_trailers:HTTPProtocol"}
+
+
+class UvloopTrailersWorker(UvloopWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "uvicorn_trailers:HTTPProtocol"}
+
+
+def get(port: int) -> httpx.Response:
+    return httpx.get(f"http://127.0.0.1:{port}/", headers={"connection": "close"})
+
+
+@contextmanager
+def run_gunicorn(port: int, worker_class: type, *args: str):
+    name = f"{worker_class.__module__}.{worker_class.__name__}"
+    command = [
+        *(sys.executable, "-m", "gunicorn", "tests.test_uvicorn_worker:app"),
+        *("--bind", f"127.0.0.1:{port}", "--worker-class", name, *args),
+    ]
+    process = subprocess.Popen(command, cwd=ROOT)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                get(port)
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        yield process
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=10)
+
+
+@pytest.mark.parametrize("worker_class", [TrailersWorker, UvloopTrailersWorker])
+def test_serve(unused_tcp_port: int, worker_class: type):
+    if worker_class is UvloopTrailersWorker:
+        pytest.importorskip("uvloop")
+    with run_gunicorn(unused_tcp_port, worker_class):
+        response = get(unused_tcp_port)
+        assert response.status_code == 200
+        assert "date" in response.headers
+        assert "http.response.trailers" in response.json()["extensions"]
+
+
+def test_max_requests(unused_tcp_port: int):
+    with run_gunicorn(unused_tcp_port, UvicornWorker, "--max-requests", "3"):
+        pids = set()
+        deadline = time.monotonic() + 10
+        while len(pids) < 2 and time.monotonic() < deadline:
+            # The connections made while the worker restarts may be refused.
+            try:
+                pids.add(get(unused_tcp_port).json()["pid"])
+            except httpx.TransportError:
+                time.sleep(0.1)
+        assert len(pids) == 2
+
+
+def test_resolve_protocol():
+    assert resolve_protocol("h11", HTTP_PROTOCOLS) == "h11"
+    protocol = uvicorn_httparse.HttparseProtocol
+    assert resolve_protocol(protocol, HTTP_PROTOCOLS) is protocol
+    name = "uvicorn_httparse:HttparseProtocol"
+    assert resolve_protocol(name, HTTP_PROTOCOLS) is protocol
+
+
+@pytest.mark.anyio
+async def test_idle_server_sleeps(unused_tcp_port: int):
+    notified = []
+
+    async def callback_notify():
+        notified.append(time.monotonic())
+
+    config = Config(
+        app,
+        port=unused_tcp_port,
+        callback_notify=callback_notify,
+        timeout_notify=0.6,
+        log_level="warning",
+        lifespan="off",
+    )
+    server = WorkerServer(config)
+    ticks = 0
+    on_tick = server.on_tick
+
+    async def count_ticks(counter: int) -> bool:
+        nonlocal ticks
+        ticks += 1
+        return await on_tick(counter)
+
+    server.on_tick = count_ticks  # type: ignore[assignment]
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", unused_tcp_port))
+    task = asyncio.create_task(server.serve(sockets=[sock]))
+    try:
+        while not server.started:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(1.0)
+        # The Uvicorn server would have ticked 10 times.
+        assert 2 <= len(notified) <= ticks <= 5
+        # The heartbeats are twice as frequent as the timeout.
+        intervals = [b - a for a, b in zip(notified, notified[1:])]
+        assert all(interval < 0.45 for interval in intervals)
+
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"http://127.0.0.1:{unused_tcp_port}/")
+        assert response.status_code == 200
+        assert "date" in response.headers
+    finally:
+        server.should_exit = True
+        assert server.wakeup is not None
+        server.wakeup.set()
+        await task
+        sock.close()
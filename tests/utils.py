@@ -1,9 +1,13 @@
 import asyncio
+import functools
 from contextlib import asynccontextmanager
+from typing import Any, Callable, TypeVar
 
 from uvicorn.config import Config
 from uvicorn.server import Server
 
+T = TypeVar("T")
+
 
 @asynccontextmanager
 async def run_server(config: Config, sockets=None):
@@ -15,3 +19,9 @@ async def run_server(config: Config, sockets=None):
     finally:
         await server.shutdown()
         task.cancel()
+
+
+async def to_thread(func: Callable[..., T], *args: Any) -> T:
+    # `asyncio.to_thread` is only defined from Python 3.9.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))